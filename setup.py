@@ -53,8 +53,8 @@ setup(
     package_dir={'': 'src'},
     packages=find_packages(where='src'),
     package_data={  # Optional
-        'boxcontroller': ['FILE'],
-    }
+        'boxcontroller': ['settings/*', 'plugins/*/sounds/*'],
+    },
     python_requires='>=3.6, < 4',
     setup_requires=[
         'docutils>=0.3',
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Awaitable helpers for ListenerPlugins with coroutine functions as callbacks.
+
+Listeners may be `async def`, they are run as tasks on BoxController's main
+loop so waiting for a subprocess, a socket or a timer does not block other
+plugins. Blocking code must not be called from a coroutine, use
+ListenerPlugin.run_in_executor() instead.
+"""
+
+import asyncio
+import logging
+
+from . import subprocesses
+
+logger = logging.getLogger(__name__)
+
+async def run(*args, input=None, timeout=False, check=False):
+    """Run a program and wait for it without blocking the main loop.
+
+    Shorthand for subprocesses.runner.run(), i.e., the program may wait for
+    a free slot and is killed after [Subprocesses] timeout by default.
+
+    Positional arguments:
+    * -- the program and its arguments [string]
+
+    Keyword arguments:
+    input -- passed to the program's stdin [string]
+    timeout -- kill the program after timeout seconds, None to wait
+        forever, False for the default [float]
+    check -- raise subprocess.CalledProcessError if it fails [boolean]
+
+    Returns:
+    stdout and stderr decoded as UTF-8 [subprocess.CompletedProcess]
+
+    Raises subprocess.TimeoutExpired, OSError if it cannot be started.
+    """
+    return await subprocesses.runner.run(*args, input=input, timeout=timeout,
+            check=check)
+
+async def open_connection(host=None, port=None, path=None, timeout=None):
+    """Connect to a TCP or a unix socket.
+
+    Keyword arguments:
+    host -- the host [string]
+    port -- the port [int]
+    path -- the path of the unix socket, used instead of host / port [string]
+    timeout -- give up after timeout seconds [float]
+
+    Returns:
+    (reader, writer) [(asyncio.StreamReader, asyncio.StreamWriter)]
+
+    Raises asyncio.TimeoutError, OSError.
+    """
+    if path is not None:
+        connecting = asyncio.open_unix_connection(str(path))
+    else:
+        connecting = asyncio.open_connection(host, port)
+    return await asyncio.wait_for(connecting, timeout)
+
+async def wait_readable(readable, timeout=None):
+    """Wait until a file descriptor can be read from.
+
+    Do not use it for objects the main loop watches itself (the connections
+    to ProcessPlugins, devices of inline plugins).
+
+    Positional arguments:
+    readable -- file descriptor or object with fileno() [int|object]
+
+    Keyword arguments:
+    timeout -- seconds to wait at most, None to wait forever [float]
+
+    Returns:
+    True if readable, False if the timeout expired [boolean]
+    """
+    loop = asyncio.get_event_loop()
+    descriptor = readable if isinstance(readable, int) else readable.fileno()
+    ready = loop.create_future()
+    loop.add_reader(descriptor,
+            lambda: ready.done() or ready.set_result(True))
+    try:
+        return await asyncio.wait_for(ready, timeout)
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        loop.remove_reader(descriptor)
+
+async def sleep(delay):
+    """Wait delay seconds without blocking the main loop.
+
+    Positional arguments:
+    delay -- seconds [float]
+    """
+    await asyncio.sleep(delay)
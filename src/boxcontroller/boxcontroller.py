@@ -1,38 +1,100 @@
 #!/usr/bin/env python3
 
+import asyncio
+import datetime
 import signal
 import sys
 import os
 import logging
 import logging.config
 import pkgutil
+import functools
+import time
 from importlib import import_module
-import pkg_resources
 import argparse
 import multiprocessing
-from queue import Empty
+import multiprocessing.connection
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from pathlib import Path
 
 from .log import log
 from . import config as cfg
+from . import control
 from . import eventmap as evt
+from . import ipc
+from . import lanes
+from . import memoryreport
+from . import metrics
+from . import patterns
+from . import processplugin
+from . import sampler
+from . import subprocesses
+from .recorder import Recorder
 from .eventapi import EventAPI
+from .pluginmanifest import PluginManifest
+from .scheduler import Scheduler
+from .startupprofiler import profiler
 
 logger = logging.getLogger(__name__)
 
+_lag = metrics.registry.summary('boxcontroller_message_lag_seconds',
+        'Time between an input being sent (by a ProcessPlugin, a ' +
+        'ListenerPlugin or through the control socket) and its processing')
+_depth = metrics.registry.gauge('boxcontroller_queue_depth',
+        'Messages found waiting the last time a ProcessPlugin was read',
+        ['process'])
+_lane_wait = metrics.registry.summary('boxcontroller_lane_wait_seconds',
+        'Inputs processed per lane and how long they waited', ['lane'])
+_dropped = metrics.registry.counter('boxcontroller_inputs_dropped_total',
+        'Inputs dropped as their lane was full or they waited too long, ' +
+        'or coalesced with the same input waiting', ['lane', 'reason'])
+
+# {priority: name}
+LANE_NAMES = {priority: name for name, priority in ipc.PRIORITIES.items()}
+
+# events that do not cause a lazy plugin to be imported
+LAZY_IGNORED_EVENTS = ['init', 'terminate', 'before_shutdown',
+        'config_changed']
+
 class BoxController(EventAPI):
     def __init__(self, config):
         self._plugins = {}
+        self._deferred = {}
+        self._entries = {}
         self._config = config
         self.__processes = {}
-        self.__to_plugins = multiprocessing.JoinableQueue()
-        self.__from_plugins = multiprocessing.Queue()
+        # reading ends of the pipes from the ProcessPlugins: {connection: name}
+        self.__readers = {}
+        # ids of the ProcessPlugins as used in messages: {name: id}
+        self.__sources = {}
+        # command channels to the ProcessPlugins: {name: ipc.Sender}
+        self.__commanders = {}
         self.__stop_signal = False
         self.__shutdown_flag = False
-
-        self._path_plugins = Path(pkg_resources.resource_filename(__name__,
-                'plugins'))
+        self.__reload_requested = False
+        self.__termination_requested = False
+        self.__profiling_requested = False
+        # where a directory for the samples of each profiling run is created
+        self.__profile_path = Path(config.get('Paths', 'user_config'),
+                'profiles').expanduser().resolve()
+        # the directory of the current run: {name of the process: file}
+        self.__profile_directory = None
+        self.__profiles = {}
+        self.__next_config_check = 0
+        self._scheduler = Scheduler()
+        # inputs waiting to be processed, higher lanes first
+        self.__lanes = lanes.Lanes()
+        # ends wait_for_messages() early if inputs have been queued
+        self.__wake_up = None
+        self._read_priorities()
+        self._read_queue_policies()
+        self._configure_subprocesses()
+        # listeners may be coroutine functions run on the main loop
+        asyncio.set_event_loop(self.get_loop())
+        self._register_metrics()
+
+        self._path_plugins = Path(__file__).parent / 'plugins'
         self._path_plugins_user = Path(
                 config.get('Paths', 'user_config'),
                 config.get('Paths', 'plugins'))
@@ -42,9 +104,14 @@ class BoxController(EventAPI):
 
         self.setup(Path(config.get('Paths', 'user_config')))
 
-        self._event_map = evt.EventMap(config)
+        self._manifest = PluginManifest(Path(
+                config.get('Paths', 'user_config'),
+                config.get('Paths', 'plugin_manifest',
+                    default='plugin_manifest.json')).expanduser().resolve())
+
+        with profiler.phase('eventmap load'):
+            self._event_map = evt.EventMap(config)
         self.load_plugins()
-        self.register_listener('shutdown', 'main', callback=self.on_shutdown)
         self.load_event_map()
 
     def get_stop_signal(self):
@@ -77,7 +144,8 @@ class BoxController(EventAPI):
     def load_event_map(self):
         """Trigger a (re-)load of the event mappings."""
         logger.info('loading events')
-        self._event_map.load()
+        with profiler.phase('eventmap reload'):
+            self._event_map.load()
         logger.info('events loaded')
 
     def load_plugins(self):
@@ -91,51 +159,330 @@ class BoxController(EventAPI):
         # multiple times in case of one or more reloads
         #super(publisher.Publisher, self)._reset()
         super()._reset()
-        self._plugins['main'] = self
-        self._load_plugins(self._path_plugins)
-        self._load_plugins(self._path_plugins_user.expanduser().resolve())
-        self._dispatch('init')
+        self.stop_processes()
+        self.__processes = {}
+        for reader in self.__readers.keys():
+            reader.close()
+        self.__readers = {}
+        for commander in self.__commanders.values():
+            commander.get_connection().close()
+        self.__commanders = {}
+        self._plugins = {'main': self}
+        self._deferred = {}
+        self.register_listener('shutdown', 'main', callback=self.on_shutdown)
+        self.register_listener('command', 'main', callback=self.send_command)
+        self.register_listener('memory_report', 'main',
+                callback=self.report_memory)
+        self.register_listener('profile', 'main',
+                callback=self.toggle_profiling)
+
+        entries = {}
+        for path in [self._path_plugins,
+                self._path_plugins_user.expanduser().resolve()]:
+            for entry in self._scan_plugins(path):
+                entries[entry['class']] = entry
+        self._manifest.save()
+        self._entries = entries
+        self.validate_config(entries.values())
+
+        # lazy plugins others depend on need to be initialised right away
+        required = set()
+        pending = [entry for entry in entries.values() if not entry['lazy']]
+        while len(pending) > 0:
+            for dependency in pending.pop()['dependencies']:
+                if dependency in entries and not dependency in required:
+                    required.add(dependency)
+                    pending.append(entries[dependency])
+
+        for classname, entry in entries.items():
+            if entry['lazy'] and not classname in required:
+                self._defer_plugin(entry)
+            else:
+                self._import_plugin(entry)
+
+        # let input processes accept (and buffer) input while the listeners
+        # are still initialising
+        self.start_processes()
+        self._init_plugins()
 
-    def _load_plugins(self, path):
-        """Gather all packages under path as plugins.
+    def _scan_plugins(self, path):
+        """Return the manifest entries of all packages under path.
+
+        Blacklisted plugins are left out.
 
         Positional arguments:
         path -- the path to scan for modules [string|Path]
         """
-        logger.info('loading plugins from {}'.format(path))
+        logger.info('scanning for plugins in {}'.format(path))
 
         blacklist = self.get_config().get('Plugins', 'blacklist', default='')
-        blacklist = [item.lower() for item in blacklist.split(',')]
+        blacklist = [item.strip().lower() for item in blacklist.split(',')]
+
+        if not str(path) in sys.path:
+            sys.path.append(str(path))
 
-        sys.path.append(str(path))
-        for file in path.glob('*'):
-            if file.name == '__pycache__' or not file.is_dir():
+        entries = []
+        for entry in self._manifest.scan(Path(path)):
+            if entry['name'].lower() in blacklist:
+                logger.debug('blacklisted plugin: {}'.format(entry['name']))
                 continue
+            entries.append(entry)
+        return entries
+
+    def reload_plugins(self):
+        """Stop all plugins and load them anew."""
+        logger.info('reloading plugins')
+        self._dispatch('terminate')
+        self.load_plugins()
+        self.am_i_idle()
+
+    def request_config_reload(self):
+        """Reload the config as soon as the main loop gets to it.
+
+        Safe to call from a signal handler.
+        """
+        self.__reload_requested = True
 
-            name = file.name
+    def request_termination(self):
+        """Terminate as soon as the main loop gets to it.
+
+        Safe to call from a signal handler.
+        """
+        self.__termination_requested = True
+
+    def request_profiling_toggle(self):
+        """Start / stop profiling as soon as the main loop gets to it.
+
+        Safe to call from a signal handler.
+        """
+        self.__profiling_requested = True
+
+    def _check_config(self):
+        """Reload the config if requested or if the files changed."""
+        if not self.__reload_requested:
+            interval = self.get_config().get('System',
+                    'config_watch_interval', default=5, variable_type='float')
+            if interval <= 0 or time.monotonic() < self.__next_config_check:
+                return
+            self.__next_config_check = time.monotonic() + interval
+            if not self.get_config().has_changed_on_disk():
+                return
+        self.__reload_requested = False
+        self.reload_config()
+
+    def reload_config(self):
+        """Reload the config from disk and notify the plugins affected.
+
+        Dispatches "config_changed" with the changes to all listeners reading
+        changed sections and restarts ProcessPlugins reading changed
+        sections.
+
+        Returns:
+        {section: {key: (old value, new value)}}
+        """
+        logger.info('reloading config')
+        changes = self.get_config().load()
+        if len(changes) == 0:
+            logger.info('config unchanged')
+            return changes
 
-            if name.lower() in blacklist:
-                logger.debug('blacklisted plugin: {}'.format(name))
+        for section, values in changes.items():
+            for key, (old, new) in values.items():
+                logger.info('config changed: [{}] {}: "{}" -> "{}"'.format(
+                    section, key, old, new))
+        self.validate_config([entry for entry in self._entries.values()
+            if entry['section'] in changes])
+
+        if 'blacklist' in changes.get('Plugins', {}):
+            self.reload_plugins()
+            return changes
+
+        if 'Mapping' in changes or 'Paths' in changes:
+            self._event_map = evt.EventMap(self.get_config())
+
+        if 'Priorities' in changes:
+            self._read_priorities()
+
+        if 'Queue' in changes:
+            self._read_queue_policies()
+
+        if 'Subprocesses' in changes:
+            self._configure_subprocesses()
+
+        affected = self.get_affected_plugins(changes)
+        for name in affected:
+            if name in self.get_processes():
+                self.restart_process(name)
+        self._dispatch_to('config_changed', affected, changes)
+        return changes
+
+    def get_affected_plugins(self, changes):
+        """Return the names of the loaded plugins reading changed sections.
+
+        Positional arguments:
+        changes -- {section: {key: (old value, new value)}} [dict]
+        """
+        affected = []
+        for name, plugin in self.get_plugins().items():
+            if name == 'main':
                 continue
+            sections = set(self._entries.get(name, {}).get('sections', []))
+            if plugin.config_section is not None:
+                sections.add(plugin.config_section)
+            if len(sections & set(changes.keys())) > 0:
+                affected.append(name)
+        return affected
+
+    def validate_config(self, entries):
+        """Report unknown options and bad values in the plugins' sections.
 
-            package = import_module('{}.{}'.format(name, name))
-            classname = name[0].upper() + name[1:]
+        Positional arguments:
+        entries -- the plugins' manifest entries [list]
+        """
+        for entry in entries:
+            if entry['section'] is None:
+                continue
+            schema = {key: tuple(definition)
+                    for key, definition in entry['schema'].items()}
+            if entry['kind'] == 'process':
+                # read by ProcessPlugin itself
+                schema.setdefault('execution_mode', ('str', None))
+            for problem in self.get_config().validate(entry['section'],
+                    schema):
+                logger.error('config for plugin "{}": {}'.format(
+                    entry['name'], problem))
+
+    def _init_plugins(self):
+        """Dispatch "init" to all plugins respecting their dependencies.
+
+        Plugins whose dependencies have been initialised are initialised
+        concurrently in a pool of threads.
+        """
+        callbacks = dict(self.get_subscribers('init'))
+        dependencies = {}
+        for name in callbacks.keys():
+            dependencies[name] = set()
+            for dependency in getattr(self._plugins.get(name), 'dependencies',
+                    []):
+                if dependency in callbacks:
+                    dependencies[name].add(dependency)
+                else:
+                    logger.debug('"{}" depends on "{}" which is not loaded'
+                            .format(name, dependency))
+
+        workers = self.get_config().get('Plugins', 'init_workers', default=4,
+                variable_type='int')
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            running = {}
+            while len(dependencies) > 0 or len(running) > 0:
+                ready = [name for name, waiting_for in dependencies.items()
+                        if len(waiting_for) == 0]
+                if len(ready) == 0 and len(running) == 0:
+                    logger.error('circular dependencies between: {}'.format(
+                        ', '.join(dependencies.keys())))
+                    ready = list(dependencies.keys())
+                for name in ready:
+                    del dependencies[name]
+                    logger.debug('dispatching "init" for "{}"'.format(name))
+                    running[executor.submit(self._init_plugin, name,
+                        callbacks[name])] = name
+                if len(running) == 0:
+                    continue
+
+                done, not_done = wait(running.keys(),
+                        return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    # raise errors occurring during initialisation
+                    future.result()
+                    for waiting_for in dependencies.values():
+                        waiting_for.discard(name)
+
+    def _init_plugin(self, name, callback):
+        """Initialise a single plugin.
+
+        Positional arguments:
+        name -- the name of the plugin [string]
+        callback -- the plugin's callback for "init" [function]
+        """
+        with profiler.phase('on_init {}'.format(name)):
+            # a coroutine will be run once the main loop is running
+            self._call_listener(name, callback)
+
+    def _import_plugin(self, entry):
+        """Import and instantiate a plugin.
+
+        Positional arguments:
+        entry -- the plugin's manifest entry [dict]
+        """
+        logger.debug('importing plugin "{}"'.format(entry['name']))
+        with profiler.phase('import {}'.format(entry['name'])):
+            package = import_module('{}.{}'.format(entry['name'],
+                entry['name']))
+        classname = entry['class']
+        with profiler.phase('instantiate {}'.format(entry['name'])):
             self._plugins[classname] = getattr(package, classname)(
-                    name=classname, main=self, to_plugins=self.__to_plugins,
-                    from_plugins=self.__from_plugins)
+                        name=classname, main=self)
+        return self._plugins[classname]
 
-        logger.info('plugins loaded from {}'.format(path))
+    def _defer_plugin(self, entry):
+        """Register placeholders to import the plugin on first dispatch.
+
+        Positional arguments:
+        entry -- the plugin's manifest entry [dict]
+        """
+        logger.debug('deferring plugin "{}"'.format(entry['name']))
+        classname = entry['class']
+        self._deferred[classname] = entry
+        for event in entry['events']:
+            if event in LAZY_IGNORED_EVENTS:
+                continue
+            self.register_listener(event, classname, callback=functools.partial(
+                self._on_deferred_event, classname, event))
+
+    def _on_deferred_event(self, classname, event, *args, **kwargs):
+        """Import a deferred plugin and pass the event on to it.
+
+        Positional arguments:
+        classname -- the name of the plugin [string]
+        event -- the event that has been dispatched [string]
+        """
+        self._load_deferred_plugin(classname)
+        callback = self.get_subscribers(event).get(classname)
+        if callback is None:
+            logger.debug('"{}" did not register for "{}"'.format(classname,
+                event))
+            return
+        self._call_listener(classname, callback, *args, **kwargs)
+
+    def _load_deferred_plugin(self, classname):
+        """Import and initialise a deferred plugin.
+
+        Positional arguments:
+        classname -- the name of the plugin [string]
+        """
+        entry = self._deferred.pop(classname)
+        for event in entry['events']:
+            self.unregister(event, classname)
+        plugin = self._import_plugin(entry)
+        # "init" has already been dispatched
+        plugin.on_init()
+        return plugin
 
     def get_plugins(self):
-        """Return a dict of references to all plugins."""
+        """Return a dict of references to all loaded plugins."""
         return self._plugins
 
     def get_plugin(self, name):
         """Return a reference to the requested plugin.
 
+        Deferred plugins will be imported.
+
         Positional arguments:
         name -- the plugin name [string]
         """
+        if name in self._deferred:
+            return self._load_deferred_plugin(name)
         if not name in self._plugins:
             raise KeyError('No such plugin.')
         return self.get_plugins()[name]
@@ -144,6 +491,10 @@ class BoxController(EventAPI):
         """Return a reference to the config."""
         return self._config
 
+    def get_scheduler(self):
+        """Return the scheduler whose timers are run by the main loop."""
+        return self._scheduler
+
     def define_event(self, key, event, *args, **kwargs):
         """Update, add or delete the mapping of an event.
 
@@ -165,43 +516,695 @@ class BoxController(EventAPI):
         Positional arguments:
         name -- the name of the process [string]
         reference -- reference to the process object [multiprocess.Process]
+
+        Returns:
+        (the connection to send messages through, the process' id,
+        the connection to receive commands from)
         """
         self.get_processes()[name] = reference
+        for reader, reader_name in list(self.__readers.items()):
+            if reader_name == name:
+                # the process is being replaced
+                del self.__readers[reader]
+                reader.close()
+        if name in self.__commanders:
+            self.__commanders.pop(name).get_connection().close()
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        self.__readers[reader] = name
+        source = self.__sources.setdefault(name, len(self.__sources) + 1)
+        command_reader, command_writer = multiprocessing.Pipe(duplex=False)
+        self.__commanders[name] = ipc.Sender(command_writer, ipc.SOURCE_MAIN)
+        return (writer, source, command_reader)
+
+    def send_command(self, name, command, *args, **kwargs):
+        """Send a command to a single ProcessPlugin.
+
+        Also called for the event "command" so commands can be mapped to
+        inputs, e.g.: "CARD_ID|command|Inputusbrfid|pause".
 
-    def run(self):
-        """Start a process for each ProcessPlugin and listen to their input.
+        Positional arguments:
+        name -- the name of the ProcessPlugin [string]
+        command -- the command, e.g., "pause" [string]
+        * -- JSON serialisable parameters to pass with the command
 
-        Modified after: https://pymotw.com/3/multiprocessing/communication.html
+        Keyword arguments:
+        * -- JSON serialisable parameters to pass with the command
         """
-        logger.debug('running process plugins')
+        commander = self.__commanders.get(name)
+        if commander is None:
+            logger.error('no such process: "{}"'.format(name))
+            return
+        logger.debug('sending command "{}" to "{}"'.format(command, name))
+        try:
+            commander.put(ipc.encode_command(command, *args, **kwargs),
+                    kind=ipc.COMMAND)
+        except (BrokenPipeError, OSError):
+            logger.error('lost connection to "{}"'.format(name))
+
+    def get_source_name(self, source):
+        """Return the name of the ProcessPlugin with the id source or None.
+
+        Positional arguments:
+        source -- the id [int]
+        """
+        for name, candidate in self.__sources.items():
+            if candidate == source:
+                return name
+        return None
+
+    def receive_messages(self, timeout=None):
+        """Wait for messages from the ProcessPlugins and process them.
+
+        Keyword arguments:
+        timeout -- seconds to wait at most, None to wait forever [float]
+        """
+        inline = self.get_inline_callbacks()
+        self._process_ready(multiprocessing.connection.wait(
+            self._get_watched(inline), timeout), inline)
+
+    async def wait_for_messages(self, timeout=None):
+        """Wait for messages like receive_messages() but let tasks run.
+
+        Keyword arguments:
+        timeout -- seconds to wait at most, None to wait forever [float]
+        """
+        loop = self.get_loop()
+        inline = self.get_inline_callbacks()
+        ready = []
+        woken = loop.create_future()
+
+        def on_ready(reader):
+            if not reader in ready:
+                ready.append(reader)
+            if not woken.done():
+                woken.set_result(None)
+
+        if len(self.__lanes) > 0:
+            # e.g., queued by a timer
+            on_ready(None)
+        self.__wake_up = functools.partial(on_ready, None)
+
+        descriptors = []
+        for reader in self._get_watched(inline):
+            descriptor = reader if isinstance(reader, int) else \
+                    reader.fileno()
+            loop.add_reader(descriptor, on_ready, reader)
+            descriptors.append(descriptor)
+        timer = None
+        if timeout is not None:
+            timer = loop.call_later(timeout, on_ready, None)
+        try:
+            await woken
+        finally:
+            self.__wake_up = None
+            for descriptor in descriptors:
+                loop.remove_reader(descriptor)
+            if timer is not None:
+                timer.cancel()
+        self._process_ready([reader for reader in ready if reader is not None],
+                inline)
+
+    def _get_watched(self, inline):
+        """Return all objects the main loop waits for.
+
+        Positional arguments:
+        inline -- as returned by get_inline_callbacks() [dict]
+        """
+        return list(self.__readers.keys()) + list(inline.keys()) + \
+                [self.get_scheduler().get_waker()]
+
+    def _process_ready(self, ready, inline):
+        """Process whatever the main loop found to be ready.
+
+        Positional arguments:
+        ready -- the objects that are ready [list]
+        inline -- as returned by get_inline_callbacks() [dict]
+        """
+        waker = self.get_scheduler().get_waker()
+        for reader in ready:
+            if reader is waker:
+                # a timer has been scheduled from another thread
+                continue
+            if reader in inline:
+                self._call_inline(*inline[reader])
+                continue
+            self._read_messages(reader)
+        self._drain_lanes()
+
+    def _read_messages(self, reader):
+        """Put the messages waiting at reader into their lanes.
+
+        Positional arguments:
+        reader -- the connection to read from [Connection]
+        """
+        try:
+            messages = ipc.receive(reader)
+        except (EOFError, OSError):
+            logger.error('lost connection to "{}"'.format(
+                self.__readers.get(reader)))
+            self.__readers.pop(reader, None)
+            return
+        _depth.set(len(messages), process=self.__readers.get(reader))
+        for message in messages:
+            if message.kind != ipc.INPUT:
+                logger.error('unknown kind of message: {}'.format(
+                    message.kind))
+                continue
+            self.queue_input(message.payload,
+                    source=self.get_source_name(message.source),
+                    priority=message.priority, timestamp=message.timestamp)
+
+    def queue_input(self, string, source=None, priority=ipc.PRIORITY_NONE,
+            timestamp=None):
+        """Put an input into its lane, the main loop processes it.
+
+        All inputs go through here (ProcessPlugins, ListenerPlugins, the
+        control socket) so [Priorities] and [Queue] apply to each of them.
+        May be called from any thread.
+
+        Positional arguments:
+        string -- the input [string]
+
+        Keyword arguments:
+        source -- where the input came from, e.g., the name of the plugin
+            [string]
+        priority -- the priority requested by the sender, see
+            get_input_priority() [int]
+        timestamp -- time.monotonic() when the input was read [float]
+
+        Returns:
+        (the event mapped to the input or None, None if queued otherwise
+            what Lanes.put() returned), (None, None) if called from another
+            thread [tuple]
+        """
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        if not self.is_loop_owner():
+            self.get_loop().call_soon_threadsafe(functools.partial(
+                self.queue_input, string, source=source, priority=priority,
+                timestamp=timestamp))
+            return (None, None)
+        # only to choose the lane, the input is mapped again when processed
+        # as the eventmap may be reloaded while it waits
+        mapping = self.map_input(string)
+        priority = self.get_input_priority(source, mapping,
+                requested=priority)
+        policy = self.get_queue_policy(string)
+        result = self.__lanes.put((string, source, timestamp), priority,
+                key=string if policy == 'coalesce' else None, policy=policy)
+        if result is not None:
+            logger.debug('input "{}": {}'.format(string, result))
+            _dropped.inc(lane=LANE_NAMES[priority], reason=result)
+        if self.__wake_up is not None:
+            self.__wake_up()
+        return (mapping[0], result)
+
+    def _drain_lanes(self):
+        """Process the inputs waiting, higher lanes first.
+
+        Before each input not in the highest lane the ProcessPlugins are
+        checked for new messages so, e.g., a "shutdown" does not wait
+        behind a burst of cards.
+        """
+        highest = self.__lanes.get_priorities()[0]
+        max_age = self.__queue_policies['max_age']
+        while len(self.__lanes) > 0:
+            if self.__lanes.get_next_priority() != highest:
+                for reader in multiprocessing.connection.wait(
+                        list(self.__readers.keys()), 0):
+                    self._read_messages(reader)
+            priority, waited, (string, source, timestamp) = \
+                    self.__lanes.pop()
+            _lane_wait.observe(waited, lane=LANE_NAMES[priority])
+            if max_age > 0 and time.monotonic() - timestamp > max_age:
+                logger.info('dropping input "{}" after {:.1f} s'.format(
+                    string, time.monotonic() - timestamp))
+                _dropped.inc(lane=LANE_NAMES[priority], reason='expired')
+                continue
+            lag = time.monotonic() - timestamp
+            _lag.observe(lag)
+            logger.debug('input from "{}" after {:.1f} ms'.format(source,
+                lag * 1000))
+            self.process_input(string, source=source, timestamp=timestamp)
+
+    def _read_priorities(self):
+        """Read the lanes of events and sources from [Priorities]."""
+        config = self.get_config()
+        self.__priorities = {
+                'events': lanes.parse_priorities(config.get('Priorities',
+                    'events', default='')),
+                'sources': lanes.parse_priorities(config.get('Priorities',
+                    'sources', default='')),
+                'default': lanes.parse_priority(config.get('Priorities',
+                    'default', default='normal'), default=ipc.PRIORITY_NORMAL),
+                }
+
+    def _read_queue_policies(self):
+        """Read how long the lanes may get and their policies from
+        [Queue]."""
+        config = self.get_config()
+        max_length = config.get('Queue', 'max_length', default=100,
+                variable_type='int')
+        self.__lanes.set_max_length(max_length if max_length > 0 else None)
+        exact = {}
+        matcher = patterns.PatternMatcher()
+        for key, policy in lanes.parse_policies(config.get('Queue',
+                'policies', default='')).items():
+            if patterns.is_pattern(key):
+                matcher.add(key, policy)
+            else:
+                exact[key] = policy
+        matcher.compile()
+        default = config.get('Queue', 'default', default='drop-oldest')
+        if not default in lanes.POLICIES:
+            logger.error('unknown policy "{}"'.format(default))
+            default = 'drop-oldest'
+        self.__queue_policies = {'exact': exact, 'matcher': matcher,
+                'default': default, 'max_age': config.get('Queue', 'max_age',
+                    default=0, variable_type='float')}
+
+    def _configure_subprocesses(self):
+        """Read the timeout and the limit of external programs from
+        [Subprocesses]."""
+        config = self.get_config()
+        subprocesses.runner.configure(
+                limit=config.get('Subprocesses', 'limit', default=4,
+                    variable_type='int'),
+                timeout=config.get('Subprocesses', 'timeout', default=10,
+                    variable_type='float'))
+
+    def get_queue_policy(self, string):
+        """Return how to queue an input, see lanes.POLICIES.
+
+        Positional arguments:
+        string -- the input [string]
+        """
+        policies = self.__queue_policies
+        policy = policies['exact'].get(string)
+        if policy is not None:
+            return policy
+        match = policies['matcher'].match(string)
+        if match is not None:
+            return match[0]
+        return policies['default']
+
+    def get_input_priority(self, source, mapping,
+            requested=ipc.PRIORITY_NONE):
+        """Return the lane an input is processed in.
+
+        The first of these decides:
+        1. the priority the input was sent with
+        2. "priority=" in the eventmap
+        3. the event ([Priorities] events)
+        4. the source, e.g., the plugin or "control" ([Priorities] sources)
+        5. [Priorities] default
+
+        Positional arguments:
+        source -- where the input came from [string]
+        mapping -- as returned by map_input() [tuple]
+
+        Keyword arguments:
+        requested -- the priority the input was sent with [int]
+
+        Returns:
+        the priority [int]
+        """
+        if requested in LANE_NAMES:
+            return requested
+        event, data = mapping
+        if data is not None and data['priority'] is not None:
+            priority = lanes.parse_priority(data['priority'])
+            if priority is not None:
+                return priority
+        priorities = self.__priorities
+        if event in priorities['events']:
+            return priorities['events'][event]
+        if source in priorities['sources']:
+            return priorities['sources'][source]
+        return priorities['default']
+
+    def get_inline_callbacks(self):
+        """Return the objects watched for ProcessPlugins running inline.
+
+        Returns:
+        {object: (name of the plugin, callback)} [dict]
+        """
+        inline = {}
         for name, process in self.get_processes().items():
-            logger.debug('starting process "{}"'.format(name))
-            process.start()
+            if process.get_execution_mode() != 'inline' or \
+                    not process.is_executing():
+                continue
+            for selectable, callback in process.get_selectables().items():
+                inline[selectable] = (name, callback)
+        return inline
 
+    def _call_inline(self, name, callback):
+        """Call back a ProcessPlugin running inline.
+
+        The plugin is stopped if the callback raises an error so it cannot
+        take the main loop down with it.
+
+        Positional arguments:
+        name -- the name of the ProcessPlugin [string]
+        callback -- the callback [function]
+        """
+        try:
+            callback()
+        except Exception:
+            logger.exception('error in "{}", stopping it'.format(name))
+            self.get_processes()[name].stop_execution()
+
+    def start_processes(self):
+        """Start each ProcessPlugin not yet running in its execution mode."""
+        logger.debug('running process plugins')
+        # children must not inherit the main process' signal handlers and
+        # ignore SIGINT (Ctrl+C reaches the whole process group), the main
+        # process stops them in order
+        handlers = {signum: signal.signal(signum, signal.SIG_IGN if
+                signum == signal.SIGINT else signal.SIG_DFL)
+                for signum in [signal.SIGINT, signal.SIGHUP, signal.SIGUSR1]}
+        try:
+            for name, process in self.get_processes().items():
+                if process.is_started():
+                    continue
+                logger.debug('starting process "{}" ({})'.format(name,
+                    process.get_execution_mode()))
+                with profiler.phase('process start {}'.format(name)):
+                    process.start_execution()
+                if self.is_profiling():
+                    self._profile_process(name)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
         logger.debug('started all process plugins')
-        self._dispatch('finished_loading')
-        logger.debug('waiting for signals')
 
-        self.am_i_idle()
+    def restart_process(self, name):
+        """Replace a ProcessPlugin with a new instance and start it.
 
-        while not self.get_stop_signal():
+        Positional arguments:
+        name -- the name of the ProcessPlugin [string]
+        """
+        logger.info('restarting process "{}"'.format(name))
+        self.stop_process(name)
+        # registers itself as a process
+        self._import_plugin(self._entries[name])
+        self.start_processes()
+
+    def get_process_ids(self):
+        """Return the ids of the main process and each ProcessPlugin running
+        in its own process.
+
+        Returns:
+        {'main': id, name of the ProcessPlugin: id, ...} [dict]
+        """
+        processes = {'main': os.getpid()}
+        for name, process in self.get_processes().items():
+            # threads and inline plugins are part of the main process
+            if process.get_execution_mode() == 'process' and \
+                    process.is_executing():
+                processes[name] = process.pid
+        return processes
+
+    def get_memory_report(self):
+        """Return a table of the memory used by the main process and each
+        running ProcessPlugin."""
+        return memoryreport.format_report(self.get_process_ids())
+
+    def _register_metrics(self):
+        """Register the metrics read from BoxController when scraped.
+
+        Unregistered by _unregister_metrics() as they keep a reference to
+        BoxController.
+        """
+        registry = metrics.registry
+        registry.gauge('boxcontroller_busy',
+                'Whether a busy bee is busy (1) or the box is idle (0)',
+                function=lambda: self.get_idle_state() == 'busy')
+        registry.gauge('boxcontroller_busy_bees_busy',
+                'Number of busy bees currently busy',
+                function=self.get_busy_count)
+        registry.counter('boxcontroller_state_seconds_total',
+                'Seconds spent idle / busy', ['state'],
+                function=lambda: {(state,): seconds for state, seconds
+                    in self.get_idle_times().items()})
+        registry.gauge('boxcontroller_lane_depth',
+                'Inputs waiting in each lane', ['lane'],
+                function=lambda: {(LANE_NAMES[priority],): depth for
+                    priority, depth in self.__lanes.get_depths().items()})
+        registry.gauge('boxcontroller_process_rss_bytes',
+                'Resident set size of the main process and each ProcessPlugin',
+                ['process'], function=functools.partial(self._get_memory,
+                    'rss'))
+        registry.gauge('boxcontroller_process_uss_bytes',
+                'Memory private to the main process and each ProcessPlugin',
+                ['process'], function=functools.partial(self._get_memory,
+                    'uss'))
+
+    def _unregister_metrics(self):
+        for name in ['boxcontroller_busy', 'boxcontroller_busy_bees_busy',
+                'boxcontroller_lane_depth',
+                'boxcontroller_state_seconds_total',
+                'boxcontroller_process_rss_bytes',
+                'boxcontroller_process_uss_bytes']:
+            metrics.registry.unregister(name)
+
+    def _get_memory(self, kind):
+        """Return {(name,): bytes} of kind ("rss"|"pss"|"uss")."""
+        values = {}
+        for name, pid in self.get_process_ids().items():
+            memory = memoryreport.get_memory(pid)
+            if memory is not None:
+                values[(name,)] = memory[kind]
+        return values
+
+    def get_socket_path(self, section):
+        """Return the path of the socket configured in section or None.
+
+        Positional arguments:
+        section -- "Metrics" or "Control" [string]
+        """
+        path = self.get_config().get(section, 'socket', default='').strip()
+        if path == '':
+            return None
+        return Path(self.get_config().get('Paths', 'user_config'),
+                path).expanduser().resolve()
+
+    async def start_servers(self):
+        """Serve the metrics ([Metrics]) and accept inputs and events
+        ([Control]) in the main loop.
+
+        Returns:
+        the servers [list]
+        """
+        servers = []
+        port = self.get_config().get('Metrics', 'http_port', default=0,
+                variable_type='int')
+        try:
+            servers += await metrics.serve(metrics.registry,
+                    path=self.get_socket_path('Metrics'),
+                    port=port if port > 0 else None)
+        except OSError as error:
+            logger.error('could not serve metrics: {}'.format(error))
+        path = self.get_socket_path('Control')
+        if path is not None:
             try:
-                input_string = self.__from_plugins.get(False)
-                self.process_input(input_string)
-            except Empty:
-                pass
+                servers.append(await control.serve(self, path))
+            except OSError as error:
+                logger.error('could not open control socket: {}'.format(
+                    error))
+        return servers
 
-        # stop all process plugins
-        for name, process in self.get_processes().items():
-            logger.debug('terminating process "{}"'.format(name))
-            process.terminate()
-            process.join()
+    def set_profile_path(self, path):
+        """Set where a directory for each profiling run is created.
+
+        Positional arguments:
+        path -- the directory [Path]
+        """
+        self.__profile_path = Path(path).expanduser().resolve()
+
+    def is_profiling(self):
+        return self.__profile_directory is not None
+
+    def toggle_profiling(self, state='toggle'):
+        """Start or stop profiling all processes.
+
+        Also called for the event "profile" so profiling can be mapped to
+        inputs, e.g.: "CARD_ID|profile" or "CARD_ID|profile|off".
+
+        Keyword arguments:
+        state -- "on", "off" or "toggle" [string]
+        """
+        if state == 'toggle':
+            state = 'off' if self.is_profiling() else 'on'
+        if state == 'on':
+            self.start_profiling()
+        elif state == 'off':
+            self.stop_profiling()
+        else:
+            logger.error('unknown profiling state "{}"'.format(state))
+
+    def start_profiling(self):
+        """Sample the main process (with all its threads) and each
+        ProcessPlugin running in its own process until stop_profiling().
+
+        The samples of each process are written to a new directory in the
+        profile path, see sampler.Sampler.
+        """
+        if self.is_profiling():
+            return
+        self.__profile_directory = self.__profile_path / \
+                datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.__profiles = {}
+        sampler.sampler.start(self.__get_profile_file('main'),
+                self.__get_profile_interval())
+        for name in self.get_process_ids().keys():
+            if name != 'main':
+                self._profile_process(name)
+
+    def _profile_process(self, name):
+        """Tell a ProcessPlugin running in its own process to profile."""
+        process = self.get_processes().get(name)
+        if process is None or process.get_execution_mode() != 'process':
+            # sampled with the main process
+            return
+        self.send_command(name, 'profile', True,
+                str(self.__get_profile_file(name)),
+                self.__get_profile_interval())
 
+    def __get_profile_file(self, name):
+        path = self.__profile_directory / '{}{}'.format(name,
+                sampler.EXTENSION)
+        self.__profiles[name] = path
+        return path
+
+    def __get_profile_interval(self):
+        return self.get_config().get('System', 'profile_interval',
+                default=sampler.DEFAULT_INTERVAL, variable_type='float')
+
+    def stop_profiling(self, wait=False):
+        """Stop profiling, write the samples and a summary of all processes.
+
+        The ProcessPlugins write their samples when they get to the command
+        so the summary is written once they have, or after 5 s.
+
+        Keyword arguments:
+        wait -- block until the summary is written instead of checking back
+            from the main loop, e.g., before the processes are stopped [bool]
+        """
+        if not self.is_profiling():
+            return
+        directory = self.__profile_directory
+        profiles = self.__profiles
+        self.__profile_directory = None
+        self.__profiles = {}
+        sampler.sampler.stop()
+        for name in profiles.keys():
+            if name != 'main':
+                self.send_command(name, 'profile', False)
+        deadline = time.monotonic() + 5
+        if not wait:
+            self.__summarise_profiles(directory, profiles, deadline)
+            return
+        while not self.__are_profiles_written(profiles, deadline):
+            time.sleep(0.05)
+        sampler.write_summary(directory)
+
+    def __are_profiles_written(self, profiles, deadline):
+        if time.monotonic() >= deadline:
+            return True
+        # do not wait for processes that died meanwhile
+        processes = self.get_process_ids()
+        return all(path.exists() or not name in processes
+                for name, path in profiles.items())
+
+    def __summarise_profiles(self, directory, profiles, deadline):
+        if not self.__are_profiles_written(profiles, deadline):
+            self.get_scheduler().call_later(0.1, self.__summarise_profiles,
+                    directory, profiles, deadline)
+            return
+        sampler.write_summary(directory)
+
+    def report_memory(self):
+        """Log the memory used by each process."""
+        logger.info('memory used ({}):\n{}'.format(
+            multiprocessing.get_start_method(), self.get_memory_report()))
+
+    def stop_process(self, name):
+        """Stop a running ProcessPlugin.
+
+        Positional arguments:
+        name -- the name of the ProcessPlugin [string]
+        """
+        process = self.get_processes()[name]
+        if not process.is_started():
+            return
+        logger.debug('terminating process "{}"'.format(name))
+        if process.get_execution_mode() != 'inline' and \
+                process.is_executing():
+            # let run() return
+            self.send_command(name, 'stop')
+        process.stop_execution()
+
+    def stop_processes(self):
+        """Stop all running ProcessPlugins."""
+        for name in self.get_processes().keys():
+            self.stop_process(name)
+
+    def start(self):
+        """Start a process for each ProcessPlugin and announce readiness."""
+        self.start_processes()
+        with profiler.phase('finished_loading'):
+            self._dispatch('finished_loading')
+        profiler.ready()
+
+    def run(self):
+        """Start a process for each ProcessPlugin and listen to their input.
+
+        Modified after: https://pymotw.com/3/multiprocessing/communication.html
+        """
+        self.start()
+        logger.debug('waiting for signals')
+
+        self.am_i_idle()
+
+        servers = self.get_loop().run_until_complete(self.start_servers())
+        self.get_loop().run_until_complete(self._main_loop())
+        for server in servers:
+            server.close()
+        for section in ['Metrics', 'Control']:
+            path = self.get_socket_path(section)
+            if path is not None and path.is_socket():
+                path.unlink()
+        # e.g., let a sound finish playing before shutting down
+        self.finish_tasks(timeout=self.get_config().get('System',
+            'task_timeout', default=5, variable_type='float'))
+
+        # before the processes are gone
+        self.stop_profiling(wait=True)
+        self.stop_processes()
+        self._unregister_metrics()
         self.shutdown()
 
+    async def _main_loop(self):
+        """The main loop, runs until BoxController terminates."""
+        while not self.get_stop_signal():
+            if self.__termination_requested:
+                self.terminate()
+                break
+            self._check_config()
+            if self.__profiling_requested:
+                self.__profiling_requested = False
+                self.toggle_profiling()
+            # wake up at least every 0.5 s to handle signals
+            await self.wait_for_messages(
+                    timeout=self.get_scheduler().get_timeout(0.5))
+            self.get_scheduler().run_due()
+
 
     def terminate(self):
         """Stop all ProcessPlugins and ListenerPlugins."""
+        times = self.get_idle_times()
+        logger.info('time spent idle: {:.0f} s, busy: {:.0f} s'.format(
+            times['idle'], times['busy']))
         # signal to all Plugins running in the main thread
         self._dispatch('terminate')
         # stop all ProcessPlugins with their processes
@@ -235,9 +1238,10 @@ def main():
     """Run the application.
 
     Configure logging and read parameters.
-    """
-    config = cfg.Config()
 
+    Returns:
+    the exit status, 1 after a fatal error [int]
+    """
     parser = argparse.ArgumentParser()
     parser.add_argument(
         '-o', '--options',
@@ -261,33 +1265,114 @@ def main():
         help='increase verbosity',
         action='count',
         default=0)
+    parser.add_argument(
+        '--profile-startup',
+        help='write the time spent in each phase of booting to a report \n' +
+            'file (default: USER_CONFIG/startup_profile)',
+        action='store',
+        nargs='?',
+        const='',
+        default=None,
+        type=str)
+    parser.add_argument(
+        '--profile',
+        help='sample the main process, its threads and each ProcessPlugin \n' +
+            'until terminating or receiving SIGUSR1 (which toggles \n' +
+            'profiling, as does the event "profile") and write the \n' +
+            'samples and a summary to a new directory in DIR \n' +
+            '(default: USER_CONFIG/profiles)',
+        action='store',
+        nargs='?',
+        const='',
+        default=None,
+        metavar='DIR',
+        type=str)
+    parser.add_argument(
+        '--record',
+        help='append every input with its time and source to a file \n' +
+            'to replay it with tools/replay.py \n' +
+            '(default: USER_CONFIG/inputs.rec)',
+        action='store',
+        nargs='?',
+        const='',
+        default=None,
+        type=str)
 
     args = parser.parse_args()
 
+    if args.profile_startup is not None:
+        # the path will be set once the config has been loaded
+        profiler.enable(args.profile_startup)
+
+    with profiler.phase('config load'):
+        config = cfg.Config()
+
     if not args.options == '':
         for option in args.options.split('@@'):
             try:
                 section, rest = option.split('.', 1)
                 option, value = rest.split('=', 1)
-                cfg.set(section, option, value)
+                config.set(section, option, value)
             except:
                 logger.error('did not understand option "{}"'.format(option))
 
     if not args.user_config == '':
-        cfg.set('Paths', 'user_config', args.user_config)
+        config.set('Paths', 'user_config', args.user_config)
+
+    if not args.options == '' or not args.user_config == '':
+        # the user config might be found somewhere else now
+        config.load()
+
+    if args.profile_startup == '':
+        profiler.enable(Path(config.get('Paths', 'user_config'),
+            'startup_profile').expanduser().resolve())
+
+    # before the logging queue is created as it depends on the start method
+    processplugin.set_start_method(
+            config.get('System', 'start_method', default='fork'),
+            preload=[module.strip() for module in config.get('System',
+                'forkserver_preload', default='').split(',')
+                if module.strip() != ''])
 
     verbosity = ['ERROR', 'WARNING', 'INFO', 'DEBUG']
     log.config['handlers']['console']['level'] = verbosity[args.verbosity]
     log.config['loggers']['__main__']['level'] = verbosity[args.verbosity]
     log.config['loggers']['boxcontroller']['level'] = verbosity[args.verbosity]
 
-    logging.config.dictConfig(log.config)
-
-    boxcontroller = BoxController(config)
+    listener = log.configure(log.config)
+    recorder = None
 
-    signal.signal(signal.SIGINT, lambda signal_num, frame: signal_handler(
-        signal_num, frame, boxcontroller))
-    boxcontroller.run()
+    try:
+        boxcontroller = BoxController(config)
+
+        if args.record is not None:
+            recorder = Recorder(Path(args.record) if args.record != '' else
+                    Path(config.get('Paths', 'user_config'),
+                        'inputs.rec').expanduser().resolve())
+            boxcontroller.set_recorder(recorder)
+
+        if args.profile is not None:
+            if args.profile != '':
+                boxcontroller.set_profile_path(Path(args.profile))
+            boxcontroller.start_profiling()
+
+        signal.signal(signal.SIGINT, lambda signal_num, frame: signal_handler(
+            signal_num, frame, boxcontroller))
+        signal.signal(signal.SIGHUP,
+                lambda signal_num, frame: boxcontroller.request_config_reload())
+        signal.signal(signal.SIGUSR1, lambda signal_num, frame:
+                boxcontroller.request_profiling_toggle())
+        boxcontroller.run()
+    except Exception as error:
+        # log it while the listener still writes records out
+        logger.error(error, exc_info=True)
+        return 1
+    finally:
+        if recorder is not None:
+            recorder.close()
+        # flush all records still waiting in the queue
+        listener.stop()
+    return 0
 
 def signal_handler(signal_num, frame, boxcontroller):
     """Log signal and call sys.exit(0).
@@ -298,12 +1383,16 @@ def signal_handler(signal_num, frame, boxcontroller):
     boxcontroller -- BoxController object to stop
     """
     logger.info('recieved signal ' + str(signal_num))
-    boxcontroller.terminate()
+    # terminating within the handler might deadlock if the signal interrupted
+    # the main thread while it was holding a lock
+    boxcontroller.request_termination()
     #sys.exit(0)
 
 if __name__ == '__main__':
 
     try:
-        main()
+        sys.exit(main())
     except Exception as error:
+        # failed before logging was configured
         logger.error(error, exc_info=True)
+        sys.exit(1)
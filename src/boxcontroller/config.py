@@ -4,10 +4,56 @@ import logging
 import os
 from pathlib import Path
 import configparser
-import pkg_resources
 
 logger = logging.getLogger(__name__)
 
+class Settings():
+    """Immutable snapshot of a config section with pre-converted values.
+
+    Values are accessed as attributes, e.g., settings.volume_step.
+    """
+
+    def __init__(self, section, values):
+        """Store the values.
+
+        Positional arguments:
+        section -- the name of the section [string]
+        values -- the converted values [dict]
+        """
+        object.__setattr__(self, '_section', section)
+        for key, value in values.items():
+            object.__setattr__(self, key, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('settings are read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('settings are read-only')
+
+    def __reduce__(self):
+        return (Settings, (self._section, self.as_dict()))
+
+    def __repr__(self):
+        return 'Settings({}, {})'.format(self._section, self.as_dict())
+
+    def get_section(self):
+        return self._section
+
+    def get(self, key, default=None):
+        """Return the value for key or default if there is no such key.
+
+        Positional arguments:
+        key -- the key [string]
+
+        Keyword arguments:
+        default -- the value to return if key is unknown
+        """
+        return self.__dict__.get(key, default) if key != '_section' else default
+
+    def as_dict(self):
+        return {key: value for key, value in self.__dict__.items()
+                if key != '_section'}
+
 class Config():
     """Representation of the configuration.
 
@@ -24,21 +70,88 @@ class Config():
         self._reset()
 
     def load(self):
+        """(Re-)load the config from file(s) and return what changed.
+
+        Values set via Config.set() are kept.
+
+        Returns:
+        {section: {key: (old value, new value)}}, missing values are None
+        """
         config = configparser.ConfigParser(interpolation=None)
         # load from APPLICATION_PATH/settings/config.ini
-        path = Path(pkg_resources.resource_filename(__name__,
-            'settings/config.ini'))
-        self.__config = self._load(config, path)
+        self._load(config, self.get_path_default())
+        self._apply_overrides(config)
         # load from user config
-        path = Path(self.get('Paths', 'user_config'), 'config.ini')
-        path = path.expanduser().resolve()
-        self.__config = self._load(config, path)
+        path = Path(config.get('Paths', 'user_config', fallback='~'),
+                'config.ini').expanduser().resolve()
+        self.__path_user = path
+        self._load(config, path)
+        self._apply_overrides(config)
+
+        changes = self._diff(self.__config, config)
+        self.__config = config
+        self.__mtimes = self.get_mtimes()
+        return changes
 
     def _reset(self):
         """Reset variables."""
-        self.__config = {}
+        self.__config = configparser.ConfigParser(interpolation=None)
+        self.__overrides = {}
+        self.__path_user = None
+        self.__mtimes = None
         self.load()
 
+    def get_path_default(self):
+        return Path(__file__).parent / 'settings' / 'config.ini'
+
+    def get_path_user(self):
+        return self.__path_user
+
+    def get_mtimes(self):
+        """Return the mtimes of the config files (None if missing)."""
+        mtimes = []
+        for path in [self.get_path_default(), self.get_path_user()]:
+            try:
+                mtimes.append(path.stat().st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    def has_changed_on_disk(self):
+        """Return whether any config file changed since it was loaded."""
+        return self.get_mtimes() != self.__mtimes
+
+    def _apply_overrides(self, config):
+        """Apply the values set via Config.set().
+
+        Positional arguments:
+        config -- configparser.ConfigParser()
+        """
+        for section, values in self.__overrides.items():
+            if not config.has_section(section):
+                continue
+            for field, value in values.items():
+                config[section][field] = value
+
+    def _diff(self, old, new):
+        """Return the values that differ between two configs.
+
+        Positional arguments:
+        old -- configparser.ConfigParser()
+        new -- configparser.ConfigParser()
+        """
+        changes = {}
+        for section in set(old.sections()) | set(new.sections()):
+            keys = set(old[section].keys() if old.has_section(section) else [])
+            keys |= set(new[section].keys() if new.has_section(section) else [])
+            for key in keys:
+                old_value = old.get(section, key, fallback=None)
+                new_value = new.get(section, key, fallback=None)
+                if old_value != new_value:
+                    changes.setdefault(section, {})[key] = (old_value,
+                            new_value)
+        return changes
+
     def _load(self, config, path):
         """Load config from file.
 
@@ -74,6 +187,89 @@ class Config():
         else:
             return self.__config.get(*args, fallback=default)
 
+    def get_settings(self, section, schema):
+        """Return an immutable snapshot of a section converted per schema.
+
+        Invalid values are replaced by their default. Use validate() to get a
+        list of problems.
+
+        Positional arguments:
+        section -- the section [string]
+        schema -- {key: (variable_type, default)} where variable_type is one
+                  of "str", "int", "float", "boolean", "path", "list" or
+                  "intlist" [dict]
+        """
+        values, problems = self._convert(section, schema)
+        return Settings(section, values)
+
+    def validate(self, section, schema):
+        """Return a list of problems with a section given its schema.
+
+        Positional arguments:
+        section -- the section [string]
+        schema -- see Config.get_settings() [dict]
+        """
+        values, problems = self._convert(section, schema)
+        return problems
+
+    def _convert(self, section, schema):
+        """Convert all values of a section according to schema.
+
+        Positional arguments:
+        section -- the section [string]
+        schema -- see Config.get_settings() [dict]
+
+        Returns:
+        ({key: value}, [problem [string]])
+        """
+        values = {}
+        problems = []
+        for key, (variable_type, default) in schema.items():
+            raw = self.__config.get(section, key, fallback=None)
+            if raw is None:
+                values[key] = default
+                continue
+            try:
+                values[key] = self._convert_value(raw, variable_type)
+            except ValueError:
+                problems.append('[{}] {}: "{}" is not of type {}'.format(
+                    section, key, raw, variable_type))
+                values[key] = default
+
+        if self.__config.has_section(section):
+            for key in self.__config[section].keys():
+                if not key in schema:
+                    problems.append('[{}] {}: unknown option'.format(section,
+                        key))
+        return (values, problems)
+
+    def _convert_value(self, raw, variable_type):
+        """Convert a string to variable_type, raise ValueError on failure.
+
+        Positional arguments:
+        raw -- the value as read from the file [string]
+        variable_type -- see Config.get_settings() [string]
+        """
+        raw = raw.strip()
+        if variable_type == 'int':
+            return int(raw)
+        elif variable_type == 'float':
+            return float(raw)
+        elif variable_type == 'boolean':
+            try:
+                return configparser.ConfigParser.BOOLEAN_STATES[raw.lower()]
+            except KeyError:
+                raise ValueError('not a boolean: {}'.format(raw))
+        elif variable_type == 'path':
+            return Path(raw).expanduser()
+        elif variable_type == 'list':
+            return tuple(item.strip() for item in raw.split(',')
+                    if item.strip() != '')
+        elif variable_type == 'intlist':
+            return tuple(int(item) for item in raw.split(',')
+                    if item.strip() != '')
+        return raw
+
     def set(self, section, field, value):
         """Set a config value manually.
 
@@ -84,6 +280,7 @@ class Config():
         """
         try:
             self.__config[section][field] = value
+            self.__overrides.setdefault(section, {})[field] = value
         except KeyError:
             logger.debug('could not set config value for "'+ str(section) +
                 '.' + str(field) + '" to "' + value + '"')
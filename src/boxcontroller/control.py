@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+import logging
+import os
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# longest request line accepted [bytes]
+LIMIT = 1048576
+
+_items = metrics.registry.counter('boxcontroller_control_items_total',
+        'Inputs and events received through the control socket', ['kind'])
+
+def execute(api, item):
+    """Execute a single item received through the control socket.
+
+    Items look like:
+    {"input": "0123456789"} -- processed like input from a device
+    {"input": "0123456789", "source": "Inputusbrfid"} -- e.g., when
+        replaying a recording (default source: "control")
+    {"event": "vol_step", "args": [], "kwargs": {"direction": "+"}}
+
+    Positional arguments:
+    api -- where to send inputs and events to [EventAPI]
+    item -- the item [dict]
+
+    Inputs are put into their lane like inputs from devices and processed
+    by the main loop afterwards.
+
+    Returns:
+    {"ok": true, ...} or {"ok": false, "error": "..."} [dict], for inputs
+        "event" is the event mapped and "queued" tells if the input or
+        another one has been dropped or coalesced (see lanes.Lanes.put())
+    """
+    if not isinstance(item, dict):
+        return {'ok': False, 'error': 'expected an object'}
+    try:
+        if 'input' in item:
+            _items.inc(kind='input')
+            event, queued = api.queue_input(str(item['input']),
+                    source=str(item.get('source', 'control')))
+            answer = {'ok': True, 'event': event}
+            if queued is not None:
+                answer['queued'] = queued
+            return answer
+        if 'event' in item:
+            args = item.get('args', [])
+            kwargs = item.get('kwargs', {})
+            if not isinstance(args, list) or not isinstance(kwargs, dict):
+                return {'ok': False,
+                        'error': '"args" must be a list, "kwargs" an object'}
+            _items.inc(kind='event')
+            api.request_event(str(item['event']), *args, **kwargs)
+            return {'ok': True}
+    except Exception as error:
+        logger.exception('error executing {}'.format(item))
+        return {'ok': False, 'error': '{}: {}'.format(type(error).__name__,
+            error)}
+    return {'ok': False, 'error': 'expected "input" or "event"'}
+
+async def serve(api, path):
+    """Accept inputs and events through a unix socket in the running loop.
+
+    Each request is a line of JSON, either a single item or a list of items
+    (see execute()). Each request is answered by a line of JSON, the result
+    or the list of results. The main loop may run other tasks between the
+    items of a batch.
+
+    Positional arguments:
+    api -- where to send inputs and events to [EventAPI]
+    path -- path of the socket, only the user may connect [Path]
+
+    Returns:
+    the server, close() it to stop serving [asyncio.AbstractServer]
+    """
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(json.dumps({'ok': False,
+                        'error': 'request too long'}).encode('utf-8') + b'\n')
+                    break
+                if line == b'':
+                    break
+                if line.strip() == b'':
+                    continue
+                try:
+                    request = json.loads(line.decode('utf-8'))
+                except ValueError as error:
+                    answer = {'ok': False,
+                            'error': 'invalid JSON: {}'.format(error)}
+                else:
+                    if isinstance(request, list):
+                        answer = []
+                        for item in request:
+                            answer.append(execute(api, item))
+                            await asyncio.sleep(0)
+                    else:
+                        answer = execute(api, request)
+                writer.write(json.dumps(answer).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    if path.is_socket():
+        # left over from a crash
+        path.unlink()
+    # do not let anyone else connect, not even for a moment
+    umask = os.umask(0o177)
+    try:
+        server = await asyncio.start_unix_server(handle, str(path),
+                limit=LIMIT)
+    finally:
+        os.umask(umask)
+    logger.info('accepting inputs and events at {}'.format(path))
+    return server
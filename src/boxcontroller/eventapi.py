@@ -1,9 +1,23 @@
 #!/usr/bin/env bash
 
+import asyncio
+import functools
 import logging
+import threading
+import time
+
+from . import ipc
+from . import metrics
 
 logger = logging.getLogger(__name__)
 
+_dispatched = metrics.registry.counter('boxcontroller_events_dispatched_total',
+        'Events dispatched to listeners', ['event'])
+_inputs = metrics.registry.counter('boxcontroller_inputs_total',
+        'Inputs received')
+_unmapped = metrics.registry.counter('boxcontroller_inputs_unmapped_total',
+        'Inputs received without an event mapped to them')
+
 class EventAPI:
     """Interface for plugins communication synchronously."""
 
@@ -17,8 +31,17 @@ class EventAPI:
             return self.get_events()[event]
         except KeyError:
             # event has not yet been added
-            self.get_events()[event] = {}
-        return self.get_subscribers(event)
+            # plugins may register concurrently during initialisation
+            with self.get_lock():
+                return self.get_events().setdefault(event, {})
+
+    def get_lock(self):
+        """Return the lock guarding (un-)registration of listeners."""
+        try:
+            return self.__lock
+        except AttributeError:
+            self.__lock = threading.RLock()
+            return self.__lock
 
     def get_events(self):
         """Return a dictionary of events."""
@@ -46,12 +69,15 @@ class EventAPI:
             except AttributeError:
                 logger.error('could not get default callback on {}'.format(who))
                 return
+        with self.get_lock():
+            if exclusive:
+                self.get_events()[event] = {who: callback}
+            else:
+                self.get_subscribers(event)[who] = callback
         if exclusive:
-            self.get_events()[event] = {who: callback}
             logger.debug('"{}" registered for event "{}" (exclusive)'.format(
                 who, event))
         else:
-            self.get_subscribers(event)[who] = callback
             logger.debug('"{}" registered for event "{}"'.format(who, event))
 
     def unregister(self, event, who):
@@ -62,7 +88,8 @@ class EventAPI:
         who -- name of the plugin to unregister [string]
         """
         try:
-            del self.get_subscribers(event)[who]
+            with self.get_lock():
+                del self.get_subscribers(event)[who]
             logger.debug('"{}" unregistered for event "{}"'.format(who, event))
         except KeyError:
             return
@@ -80,12 +107,126 @@ class EventAPI:
         if len(self.get_subscribers(event)) == 0:
             logger.debug('trying to dispatch "{}", no one\'s listening'.format(
                 event))
-        for subscriber, callback in self.get_subscribers(event).items():
+        _dispatched.inc(event=event)
+        # iterate over a copy as callbacks may (un-)register listeners
+        for subscriber, callback in list(self.get_subscribers(event).items()):
             logger.debug('dispatching "{}" for "{}"'.format(event, subscriber))
-            callback(*args, **kwargs)
+            self._call_listener(subscriber, callback, *args, **kwargs)
+
+    def _dispatch_to(self, event, who, *args, **kwargs):
+        """Dispatch event to some of its subscribers only.
+
+        Positional arguments:
+        event -- the event to be dispatched [string]
+        who -- names of the subscribers to dispatch to [list]
+        * -- parameters to pass with the event
+
+        Keyword arguments:
+        * -- parameters to pass with the event
+        """
+        _dispatched.inc(event=event)
+        for subscriber, callback in list(self.get_subscribers(event).items()):
+            if subscriber in who:
+                logger.debug('dispatching "{}" for "{}"'.format(event,
+                    subscriber))
+                self._call_listener(subscriber, callback, *args, **kwargs)
+
+    def _call_listener(self, who, callback, *args, **kwargs):
+        """Call a listener, run it as a task if it's a coroutine function.
+
+        Positional arguments:
+        who -- name of the listener [string]
+        callback -- the function / coroutine function to call [function]
+        * -- parameters to pass with the event
+
+        Keyword arguments:
+        * -- parameters to pass with the event
+        """
+        result = callback(*args, **kwargs)
+        if asyncio.iscoroutine(result):
+            self.create_task(result, who)
+
+    def get_loop(self):
+        """Return the asyncio event loop the main loop runs on.
+
+        It belongs to the thread that called get_loop() first.
+        """
+        try:
+            return self.__loop
+        except AttributeError:
+            with self.get_lock():
+                try:
+                    return self.__loop
+                except AttributeError:
+                    self.__tasks = set()
+                    self.__loop_owner = threading.get_ident()
+                    self.__loop = asyncio.new_event_loop()
+                    return self.__loop
+
+    def is_loop_owner(self):
+        """Return True if called from the thread the main loop runs in."""
+        self.get_loop()
+        return threading.get_ident() == self.__loop_owner
+
+    def create_task(self, coroutine, who=None):
+        """Run a coroutine concurrently in the main loop.
+
+        May be called from any thread. Errors are logged, the task will be
+        given some time to finish when BoxController terminates.
+
+        Positional arguments:
+        coroutine -- the coroutine [coroutine]
+
+        Keyword arguments:
+        who -- name of the plugin for error messages [string]
+
+        Returns:
+        the task [asyncio.Task] or None if called from another thread
+        """
+        loop = self.get_loop()
+        if not self.is_loop_owner():
+            loop.call_soon_threadsafe(self.create_task, coroutine, who)
+            return None
+        task = loop.create_task(coroutine)
+        self.__tasks.add(task)
+        task.add_done_callback(functools.partial(self._on_task_done, who))
+        return task
+
+    def _on_task_done(self, who, task):
+        self.__tasks.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            logger.error('error in task of "{}"'.format(who), exc_info=error)
+
+    def finish_tasks(self, timeout=None):
+        """Run the event loop until all tasks are done.
+
+        Keyword arguments:
+        timeout -- cancel the tasks still running after timeout seconds,
+            None to wait forever [float]
+        """
+        loop = self.get_loop()
+        # let tasks scheduled from other threads be created
+        loop.run_until_complete(asyncio.sleep(0))
+        if len(self.__tasks) == 0:
+            return
+        logger.debug('waiting for {} task(s) to finish'.format(
+            len(self.__tasks)))
+        done, pending = loop.run_until_complete(asyncio.wait(
+            list(self.__tasks), timeout=timeout))
+        for task in pending:
+            logger.error('cancelling task {}'.format(task))
+            task.cancel()
+        if len(pending) > 0:
+            loop.run_until_complete(asyncio.wait(pending))
 
     def _reset(self):
         self._events = {}
+        with self.get_lock():
+            self.get_busy_bees().clear()
+            self.__busy_count = 0
 
     def register_busy_bee(self, name):
         """Some plugins may declare the box's state as not idle.
@@ -96,7 +237,7 @@ class EventAPI:
         name -- name of the plugin [string]
         """
         # register busy bee but mark as not busy at the moment
-        self.get_busy_bees()[name] = False
+        self.mark_busy_bee_as_busy(name, False)
 
     def get_busy_bees(self):
         """Return a dict holding busy bees which may inhibit idle time."""
@@ -104,31 +245,103 @@ class EventAPI:
             return self.__busy_bees
         except AttributeError:
             self.__busy_bees = {}
+            self.__busy_count = 0
             return self.__busy_bees
 
+    def get_busy_count(self):
+        """Return the number of busy bees currently busy."""
+        self.get_busy_bees()
+        return self.__busy_count
+
+    def get_idle_state(self):
+        """Return the last dispatched state ("idle"|"busy") or None."""
+        try:
+            return self.__idle_state
+        except AttributeError:
+            return None
+
+    def get_idle_times(self):
+        """Return the seconds spent in each state since the first one.
+
+        Returns:
+        {'idle': seconds, 'busy': seconds} [dict]
+        """
+        with self.get_lock():
+            times = dict(self._get_state_times())
+            state = self.get_idle_state()
+            if state is not None:
+                times[state] += time.monotonic() - self.__state_since
+        return times
+
+    def _get_state_times(self):
+        try:
+            return self.__state_times
+        except AttributeError:
+            self.__state_times = {'idle': 0, 'busy': 0}
+            return self.__state_times
+
+    def _set_idle_state(self, state):
+        """Enter state and account for the time spent in the last one.
+
+        Positional arguments:
+        state -- "idle" or "busy" [string]
+
+        Returns:
+        True if the state changed [boolean]
+        """
+        now = time.monotonic()
+        old = self.get_idle_state()
+        if old == state:
+            return False
+        if old is not None:
+            spent = now - self.__state_since
+            self._get_state_times()[old] += spent
+            logger.debug('{} after {:.1f} s {}'.format(state, spent, old))
+        self.__idle_state = state
+        self.__state_since = now
+        return True
+
     def am_i_idle(self):
-        """Am I idle (True) or are there any busy bees inhibitting idle time?"""
-        logger.debug('am I idle?')
-        if not True in self.get_busy_bees().values():
-            logger.debug('I am idle.')
-            self._dispatch('idle')
-        else:
-            logger.debug('someone\'s busy.')
-            self._dispatch('busy')
+        """Dispatch "idle" or "busy" according to the busy bees.
+
+        Dispatches even if the state has not changed, e.g., to inform plugins
+        that have just been (re-)loaded.
+        """
+        with self.get_lock():
+            state = 'idle' if self.get_busy_count() == 0 else 'busy'
+            self._set_idle_state(state)
+        logger.debug('I am {}.'.format(state))
+        self._dispatch(state)
 
     def mark_busy_bee_as_busy(self, name, busy):
         """Mark a plugin as busy or idle.
 
+        "idle" / "busy" are only dispatched if the state of the box changes,
+        i.e., the first busy bee gets busy or the last one stops being busy.
+
         Positional arguments:
         name -- name of the plugin [string]
 
         Keyword arguments:
         busy -- busy (True) or not (False) [boolean]
         """
-        logger.debug('mark {} as {}busy'.format(name,
-            '' if busy else 'not '))
-        self.get_busy_bees()[name] = busy
-        self.am_i_idle()
+        with self.get_lock():
+            busy_bees = self.get_busy_bees()
+            if busy_bees.get(name) == busy:
+                return
+            logger.debug('mark {} as {}busy'.format(name,
+                '' if busy else 'not '))
+            if busy:
+                self.__busy_count += 1
+            elif busy_bees.get(name):
+                self.__busy_count -= 1
+            busy_bees[name] = busy
+            state = 'idle' if self.__busy_count == 0 else 'busy'
+            # before the first am_i_idle() nobody has been told anything
+            changed = self.get_idle_state() is not None and \
+                    self._set_idle_state(state)
+        if changed:
+            self._dispatch(state)
 
     def communicate(self, message, type):
         """Communicate something to the user.
@@ -156,20 +369,85 @@ class EventAPI:
         """
         self._dispatch(event, *args, **kwargs)
 
-    def process_input(self, string):
+    def get_recorder(self):
+        """Return the Recorder writing all inputs or None."""
+        try:
+            return self.__recorder
+        except AttributeError:
+            return None
+
+    def set_recorder(self, recorder):
+        """Record all inputs from now on.
+
+        Positional arguments:
+        recorder -- the recorder, None to stop recording [Recorder]
+        """
+        self.__recorder = recorder
+
+    def map_input(self, string):
+        """Return the event mapped to an input.
+
+        Positional arguments:
+        string - the input to map to an event [string]
+
+        Returns:
+        (event, data) as returned by EventMap.get() or (None, None) if no
+            event is mapped to the input [tuple]
+        """
+        try:
+            return self._event_map.get(string)
+        except KeyError:
+            return (None, None)
+
+    def queue_input(self, string, source=None, priority=ipc.PRIORITY_NONE,
+            timestamp=None):
+        """Process an input once it is its turn.
+
+        Processes the input right away, BoxController puts it into a lane
+        first.
+
+        Positional arguments:
+        string -- the input [string]
+
+        Keyword arguments:
+        source -- where the input came from, e.g., the name of the plugin
+            [string]
+        priority -- the priority requested by the sender [int]
+        timestamp -- time.monotonic() when the input was read [float]
+
+        Returns:
+        (the event mapped to the input or None [string], None) [tuple]
+        """
+        return (self.process_input(string, source=source,
+            timestamp=timestamp), None)
+
+    def process_input(self, string, source=None, timestamp=None):
         """The main way to process input from peripherals.
 
         The input is used as a key to look up which event to trigger.
 
         Positional arguments:
         string - the input to map to an event [string]
+
+        Keyword arguments:
+        source -- where the input came from, e.g., the name of the plugin
+            [string]
+        timestamp -- time.monotonic() when the input was read [float]
+
+        Returns:
+        the event or None if no event is mapped to the input [string]
         """
         logger.debug('recieved input: "{}"'.format(string))
-        try:
-            event, data = self._event_map.get(string)
-            logger.debug('event "{}" mapped to input "{}"'.format(event, string))
-        except KeyError:
+        _inputs.inc()
+        recorder = self.get_recorder()
+        if recorder is not None:
+            recorder.record(string, source=source, timestamp=timestamp)
+        event, data = self.map_input(string)
+        if event is None:
             logger.info('no event mapped to input "{}"'.format(string))
-            return
+            _unmapped.inc()
+            return None
+        logger.debug('event "{}" mapped to input "{}"'.format(event, string))
 
         self._dispatch(event, *data['positional'], **data['keyword'])
+        return event
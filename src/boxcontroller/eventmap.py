@@ -2,10 +2,12 @@
 
 import logging
 import os
+import time
 from pathlib import Path
-import pkg_resources
 
 from . import keymap
+from . import mapindex
+from . import patterns
 
 logger = logging.getLogger(__name__)
 
@@ -19,8 +21,26 @@ class EventMap(keymap.KeyMap):
 
     Events are specified one per line.
     For the general form see Commands.process_map().
+
+    Keys may be patterns where "*" matches any number of characters and "?"
+    exactly one, e.g.:
+    GPIO_*_L|stop
+    *|unknown_card
+    What each wildcard matched is appended to the positional data. Exact
+    keys take precedence over patterns, see PatternMatcher for the order of
+    patterns.
+
+    The keyword "priority" is not passed with the event, it sets the lane
+    the input is processed in ("low", "normal", "high"), e.g.:
+    GPIO_12_P|toggle|priority=high
+
+    With [Mapping] index set, both files are compiled into an index which
+    is looked up instead of loading all mappings (see MapIndex).
     """
 
+    # seconds between two checks whether the index is still current
+    index_check_interval = 1
+
     def __init__(self, config):
         """Initialise variables and load map from file(s)."""
         super().__init__(config)
@@ -28,6 +48,17 @@ class EventMap(keymap.KeyMap):
                 config.get('Paths', 'user_config'),
                 self.get_config().get('Paths', 'eventmap'))
         self.__path_user_map = self.__path_user_map.expanduser().resolve()
+        self.__index = None
+        self.__next_index_check = 0
+        self.__matcher = patterns.PatternMatcher()
+        index = self.get_config().get('Mapping', 'index', default='').strip()
+        if index != '':
+            self.__index = mapindex.MapIndex(
+                    Path(config.get('Paths', 'user_config'),
+                        index).expanduser().resolve(),
+                    [self.get_path_default_map(), self.get_path_user_map()],
+                    delimiter=self.get_delimiter(),
+                    is_pattern=patterns.is_pattern)
         self.reset()
 
     def reset(self):
@@ -38,17 +69,51 @@ class EventMap(keymap.KeyMap):
     def get_path_user_map(self):
         return self.__path_user_map
 
+    def get_path_default_map(self):
+        return Path(__file__).parent / 'settings' / 'eventmap'
+
+    def get_index(self):
+        """Return the MapIndex or None if the mappings are loaded."""
+        return self.__index
+
     def load(self):
         """(Re-)read the mapping files.
 
         Can be used to insert new mappings into the running system.
         """
+        if self.__index is not None:
+            try:
+                # compiles the index if the files changed
+                if self.__index.open():
+                    self.__compile_patterns(self._process_map(line)
+                            for line in self.__index.get_patterns())
+                self.__next_index_check = time.monotonic() + \
+                        self.index_check_interval
+                return
+            except OSError as error:
+                logger.error('cannot use the index, loading all mappings: ' +
+                        '{}'.format(error))
+                self.__index = None
         # load from APPLICATION_PATH/settings/events
-        path = Path(pkg_resources.resource_filename(__name__,
-            'settings/eventmap'))
-        super().load(path)
+        super().load(self.get_path_default_map())
         # load from ~/.config/boxcontroller
         super().load(self.get_path_user_map())
+        self.__compile_patterns((key, data)
+                for key, data in self.get_map().items()
+                if patterns.is_pattern(key))
+
+    def __compile_patterns(self, mappings):
+        """Compile the matcher from (pattern, data) in definition order."""
+        self.__matcher = patterns.PatternMatcher()
+        for key, data in mappings:
+            self.__matcher.add(key, data)
+        self.__matcher.compile()
+        if self.__matcher.get_count() > 0:
+            logger.debug('compiled {} patterns'.format(
+                self.__matcher.get_count()))
+
+    def get_matcher(self):
+        return self.__matcher
 
     def get(self, key):
         """Return the event mapped to the key or None.
@@ -57,18 +122,41 @@ class EventMap(keymap.KeyMap):
         key -- the key [string]
 
         Returns:
-        (event [string], ['positional': [string], 'keyword': {string: string}]
+        (event [string], {'positional': [string], 'keyword': {string: string},
+            'priority': string or None})
         """
         try:
-            data = self.get_map()[key]
+            captured = []
+            try:
+                if self.__index is not None:
+                    data = self.__get_indexed(key)
+                else:
+                    data = self.get_map()[key]
+            except KeyError:
+                match = self.__matcher.match(key)
+                if match is None:
+                    raise
+                data, captured = match
+            keyword = data['keyword'].copy()
             return (data['positional'][0], {
-                        'positional': data['positional'][1:],
-                        'keyword': data['keyword'].copy()
+                        'positional': data['positional'][1:] + captured,
+                        'keyword': keyword,
+                        'priority': keyword.pop('priority', None)
                     })
         except KeyError:
             logger.error('no event for key: "{}"'.format(key))
             raise KeyError
 
+    def __get_indexed(self, key):
+        """Return the data mapped to key from the index."""
+        if time.monotonic() >= self.__next_index_check:
+            # e.g., the file has been edited by hand
+            self.load()
+        line = self.__index.get_line(key)
+        if line is None:
+            raise KeyError(key)
+        return self._process_map(line)[1]
+
     def update(self, key, event, *args, **kwargs):
         """Update, add or delete the mapping of an event.
 
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+import collections
+import json
+import logging
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+# kinds of messages
+# ProcessPlugin -> BoxController: an input string
+INPUT = 1
+# BoxController -> ProcessPlugin: a command, see encode_command()
+COMMAND = 2
+
+# source of messages sent by BoxController
+SOURCE_MAIN = 0
+
+# priority of a message, PRIORITY_NONE lets BoxController decide
+PRIORITY_NONE = 0
+PRIORITY_LOW = 1
+PRIORITY_NORMAL = 2
+PRIORITY_HIGH = 3
+
+# names of the priorities as used in the config and the eventmap
+PRIORITIES = {'low': PRIORITY_LOW, 'normal': PRIORITY_NORMAL,
+        'high': PRIORITY_HIGH}
+
+# kind [uint8], priority [uint8], source [uint16], timestamp [double],
+# length of the payload [uint16], network byte order
+HEADER = struct.Struct('!BBHdH')
+
+MAX_PAYLOAD = 65535
+
+Message = collections.namedtuple('Message',
+        ['kind', 'priority', 'source', 'timestamp', 'payload'])
+Message.__doc__ = """A message between a ProcessPlugin and BoxController.
+
+kind -- the kind of message, e.g., INPUT [int]
+priority -- the priority or PRIORITY_NONE [int]
+source -- the sender's id as assigned by BoxController [int]
+timestamp -- time.monotonic() when the message was created [float]
+payload -- e.g., the input string [string]
+"""
+
+def encode(message):
+    """Return the message as bytes: header followed by the UTF-8 payload.
+
+    Positional arguments:
+    message -- the message to encode [Message]
+    """
+    payload = message.payload.encode('utf-8')
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError('payload exceeds {} bytes'.format(MAX_PAYLOAD))
+    return HEADER.pack(message.kind, message.priority, message.source,
+            message.timestamp, len(payload)) + payload
+
+def decode(buffer):
+    """Return a list of all messages contained in buffer.
+
+    Positional arguments:
+    buffer -- one or more encoded messages [bytes]
+    """
+    messages = []
+    offset = 0
+    length = len(buffer)
+    while offset < length:
+        kind, priority, source, timestamp, size = HEADER.unpack_from(buffer,
+                offset)
+        offset += HEADER.size
+        payload = bytes(buffer[offset:offset + size]).decode('utf-8')
+        offset += size
+        messages.append(Message(kind, priority, source, timestamp, payload))
+    return messages
+
+def encode_command(command, *args, **kwargs):
+    """Return the payload of a COMMAND message.
+
+    Positional arguments:
+    command -- the name of the command, e.g., "pause" [string]
+    * -- JSON serialisable parameters to pass with the command
+
+    Keyword arguments:
+    * -- JSON serialisable parameters to pass with the command
+    """
+    return json.dumps([command, args, kwargs])
+
+def decode_command(payload):
+    """Return (command, args, kwargs) from the payload of a COMMAND message.
+
+    Positional arguments:
+    payload -- the payload [string]
+    """
+    command, args, kwargs = json.loads(payload)
+    return (command, args, kwargs)
+
+class Sender():
+    """Send messages through a multiprocessing.Connection.
+
+    Messages may be collected and sent as one batch with a single write.
+    """
+
+    def __init__(self, connection, source):
+        """Initialise variables.
+
+        Positional arguments:
+        connection -- the connection to write to [Connection]
+        source -- the id of the sender [int]
+        """
+        self.__connection = connection
+        self.__source = source
+        self.__buffer = []
+
+    def get_connection(self):
+        return self.__connection
+
+    def get_source(self):
+        return self.__source
+
+    def put(self, payload, priority=PRIORITY_NONE, kind=INPUT, flush=True):
+        """Send a message.
+
+        Positional arguments:
+        payload -- the payload [string]
+
+        Keyword arguments:
+        priority -- the priority of the message [int]
+        kind -- the kind of message [int]
+        flush -- send immediately (True) or wait for flush() (False) [boolean]
+        """
+        self.__buffer.append(encode(Message(kind, priority, self.__source,
+            time.monotonic(), payload)))
+        if flush:
+            self.flush()
+
+    def put_many(self, payloads, priority=PRIORITY_NONE, kind=INPUT):
+        """Send several messages with a single write.
+
+        Positional arguments:
+        payloads -- the payloads [list of string]
+
+        Keyword arguments:
+        priority -- the priority of the messages [int]
+        kind -- the kind of the messages [int]
+        """
+        for payload in payloads:
+            self.put(payload, priority=priority, kind=kind, flush=False)
+        self.flush()
+
+    def flush(self):
+        """Send all collected messages."""
+        if len(self.__buffer) == 0:
+            return
+        data = b''.join(self.__buffer)
+        self.__buffer = []
+        self.__connection.send_bytes(data)
+
+def receive(connection):
+    """Read one batch of messages from connection.
+
+    Raises EOFError if the other end has been closed.
+
+    Positional arguments:
+    connection -- the connection to read from [Connection]
+    """
+    return decode(connection.recv_bytes())
@@ -3,10 +3,14 @@
 import logging
 import os
 from pathlib import Path
-import pkg_resources
+
+from . import metrics
 
 logger = logging.getLogger(__name__)
 
+_writes = metrics.registry.counter('boxcontroller_map_writes_total',
+        'Map files (e.g., the status file of MPC) written', ['file'])
+
 class KeyMap():
     """Textual representation of simple data where a database would be too much.
 
@@ -161,6 +165,7 @@ class KeyMap():
         with open(path, 'w') as map:
             map.write(''.join(lines))
             logger.debug('updated map: "{}"'.format(path))
+        _writes.inc(file=path.name)
 
         self.reset()
 
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+import collections
+import logging
+import time
+
+from . import ipc
+
+logger = logging.getLogger(__name__)
+
+# what to do with an item:
+# drop-oldest -- if its lane is full, drop the first item of the lane
+# drop-newest -- if its lane is full, drop the item
+# coalesce -- replace the item with the same key waiting in the lane so only
+#   the latest is processed, otherwise like drop-oldest
+POLICIES = ['drop-oldest', 'drop-newest', 'coalesce']
+
+# what happened to an item put into a lane besides being queued
+DROPPED_OLDEST = 'dropped_oldest'
+DROPPED_NEWEST = 'dropped_newest'
+COALESCED = 'coalesced'
+
+class Lanes():
+    """A queue with one FIFO lane per priority, higher lanes drain first.
+
+    Within a lane items keep the order they were put in. Each lane holds at
+    most max_length items, see POLICIES for what happens to more.
+    """
+
+    def __init__(self, priorities=(ipc.PRIORITY_LOW, ipc.PRIORITY_NORMAL,
+            ipc.PRIORITY_HIGH), max_length=None):
+        """Initialise variables.
+
+        Keyword arguments:
+        priorities -- the priorities of the lanes [tuple]
+        max_length -- items per lane, None for no limit [int]
+        """
+        # highest priority first
+        self.__priorities = sorted(priorities, reverse=True)
+        # entries: [time queued, item, key]
+        self.__lanes = {priority: collections.deque()
+                for priority in self.__priorities}
+        # the entries waiting per lane by key: {priority: {key: entry}}
+        self.__keys = {priority: {} for priority in self.__priorities}
+        self.__length = 0
+        self.__max_length = max_length
+
+    def set_max_length(self, max_length):
+        """Limit the items per lane, items already queued are kept.
+
+        Positional arguments:
+        max_length -- items per lane, None for no limit [int]
+        """
+        self.__max_length = max_length
+
+    def __len__(self):
+        return self.__length
+
+    def get_priorities(self):
+        """Return the priorities of the lanes, highest first."""
+        return self.__priorities
+
+    def get_depths(self):
+        """Return {priority: number of items waiting}."""
+        return {priority: len(lane) for priority, lane in
+                self.__lanes.items()}
+
+    def put(self, item, priority, key=None, policy='drop-oldest'):
+        """Add an item to the end of its lane.
+
+        Positional arguments:
+        item -- the item
+        priority -- the priority of the lane [int]
+
+        Keyword arguments:
+        key -- items with the same key may be coalesced [string]
+        policy -- see POLICIES [string]
+
+        Returns:
+        None if queued, otherwise DROPPED_OLDEST, DROPPED_NEWEST or
+            COALESCED [string]
+        """
+        lane = self.__lanes[priority]
+        keys = self.__keys[priority]
+        if policy == 'coalesce' and key in keys:
+            # keep the place in the lane, process the latest item
+            keys[key][1] = item
+            return COALESCED
+        result = None
+        if self.__max_length is not None and len(lane) >= self.__max_length:
+            if policy == 'drop-newest' or len(lane) == 0:
+                return DROPPED_NEWEST
+            self.__forget(priority, lane.popleft())
+            self.__length -= 1
+            result = DROPPED_OLDEST
+        entry = [time.monotonic(), item, key]
+        lane.append(entry)
+        if key is not None:
+            keys[key] = entry
+        self.__length += 1
+        return result
+
+    def __forget(self, priority, entry):
+        keys = self.__keys[priority]
+        if entry[2] is not None and keys.get(entry[2]) is entry:
+            del keys[entry[2]]
+
+    def get_next_priority(self):
+        """Return the priority of the item pop() returns or None."""
+        for priority in self.__priorities:
+            if len(self.__lanes[priority]) > 0:
+                return priority
+        return None
+
+    def pop(self):
+        """Remove and return the first item of the highest lane not empty.
+
+        Raises IndexError if all lanes are empty.
+
+        Returns:
+        (priority, seconds waited, item) [tuple]
+        """
+        priority = self.get_next_priority()
+        if priority is None:
+            raise IndexError('all lanes are empty')
+        entry = self.__lanes[priority].popleft()
+        self.__forget(priority, entry)
+        self.__length -= 1
+        return (priority, time.monotonic() - entry[0], entry[1])
+
+    def clear(self):
+        for priority, lane in self.__lanes.items():
+            lane.clear()
+            self.__keys[priority].clear()
+        self.__length = 0
+
+def parse_priority(name, default=None):
+    """Return the priority called name ("low", "normal", "high").
+
+    Positional arguments:
+    name -- the name [string]
+
+    Keyword arguments:
+    default -- returned for unknown names [int]
+    """
+    priority = ipc.PRIORITIES.get(str(name).strip().lower())
+    if priority is None:
+        logger.error('unknown priority "{}"'.format(name))
+        return default
+    return priority
+
+def parse_policies(value):
+    """Return {key: policy} from a list like "GPIO_*:coalesce, 04*:...".
+
+    Positional arguments:
+    value -- the list [string]
+    """
+    policies = {}
+    for item in value.split(','):
+        if item.strip() == '':
+            continue
+        key, _, policy = item.rpartition(':')
+        policy = policy.strip().lower()
+        if key.strip() == '' or not policy in POLICIES:
+            logger.error('cannot read policy "{}"'.format(item.strip()))
+            continue
+        policies[key.strip()] = policy
+    return policies
+
+def parse_priorities(value):
+    """Return {name: priority} from a list like "shutdown:high, stop:high".
+
+    Positional arguments:
+    value -- the list [string]
+    """
+    priorities = {}
+    for item in value.split(','):
+        if item.strip() == '':
+            continue
+        name, _, priority = item.rpartition(':')
+        priority = parse_priority(priority)
+        if name.strip() == '' or priority is None:
+            logger.error('cannot read priority "{}"'.format(item.strip()))
+            continue
+        priorities[name.strip()] = priority
+    return priorities
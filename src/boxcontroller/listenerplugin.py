@@ -1,13 +1,22 @@
 #!/usr/bin/env python3
 
+import functools
 import logging
+import subprocess
+from . import ipc
+from . import metrics
 from . import plugin
+from . import subprocesses
 
 logger = logging.getLogger(__name__)
 
 class ListenerPlugin(plugin.Plugin):
     """Base for plugins listening to events in the same thread / process."""
 
+    # set to True in your plugin if it need not be imported and initialised
+    # before one of its events is dispatched
+    lazy = False
+
     def __init__(self, *args, **kwargs):
         """Initialise variables and register to "plugins_loaded".
 
@@ -20,6 +29,7 @@ class ListenerPlugin(plugin.Plugin):
         plugin.Plugin.__init__(self, *args, **kwargs)
         self.__main = kwargs['main']
         self.register('init', self.on_init)
+        self.register('config_changed', self._on_config_changed)
 
     def get_publisher(self):
         return self.get_main()
@@ -55,6 +65,21 @@ class ListenerPlugin(plugin.Plugin):
         raise NotImplementedError('you missed your chance to initialise ' +
                 'and register events')
 
+    def _on_config_changed(self, changes):
+        self.load_settings(self.get_config())
+        self.on_config_changed(changes)
+
+    def on_config_changed(self, changes):
+        """React to a reloaded config.
+
+        Only called if a section the plugin reads has changed. The plugin's
+        settings (get_settings()) have already been updated.
+
+        Positional arguments:
+        changes -- {section: {key: (old value, new value)}} [dict]
+        """
+        pass
+
     def register_as_busy_bee(self):
         """Mark this plugin as a busy bee potentially inhibitting shutdown, etc.
         """
@@ -84,13 +109,165 @@ class ListenerPlugin(plugin.Plugin):
         """
         self.get_main().communicate(message, type)
 
-    def send_to_input(self, input_string):
+    def send_to_input(self, input_string, priority=ipc.PRIORITY_NONE):
         """Send something to the main plugin for processing as input.
 
+        The input is put into its lane like inputs from ProcessPlugins.
+
         Positional arguments:
         input_string -- the string to process
+
+        Keyword arguments:
+        priority -- the priority of the input, see ipc.PRIORITIES [int]
         """
-        self.get_main().process_input(input_string)
+        self.get_main().queue_input(input_string, source=self.get_name(),
+                priority=priority)
+
+    def call_later(self, delay, callback, *args, **kwargs):
+        """Call callback after delay seconds in the main loop.
+
+        Cancel pending timers on "terminate".
+
+        Positional arguments:
+        delay -- seconds to wait [float]
+        callback -- the function to call [function]
+        * -- parameters to pass to the callback
+
+        Keyword arguments:
+        * -- parameters to pass to the callback
+
+        Returns:
+        the timer, call cancel() on it to stop it [scheduler.Timer]
+        """
+        return self.get_main().get_scheduler().call_later(delay, callback,
+                *args, **kwargs)
+
+    def call_every(self, interval, callback, *args, **kwargs):
+        """Call callback every interval seconds in the main loop.
+
+        Cancel the timer on "terminate".
+
+        Positional arguments:
+        interval -- seconds between two calls [float]
+        callback -- the function to call [function]
+        * -- parameters to pass to the callback
+
+        Keyword arguments:
+        * -- parameters to pass to the callback
+
+        Returns:
+        the timer, call cancel() on it to stop it [scheduler.Timer]
+        """
+        return self.get_main().get_scheduler().call_every(interval, callback,
+                *args, **kwargs)
+
+    def create_task(self, coroutine):
+        """Run a coroutine concurrently in the main loop.
+
+        Callbacks defined with `async def` are run as tasks anyway, see
+        boxcontroller.aio for helpers to await.
+
+        Positional arguments:
+        coroutine -- the coroutine [coroutine]
+
+        Returns:
+        the task [asyncio.Task] or None if not called from the main thread
+        """
+        return self.get_main().create_task(coroutine, self.get_name())
+
+    def run_in_executor(self, function, *args, **kwargs):
+        """Call a blocking function in a thread, return an awaitable.
+
+        Positional arguments:
+        function -- the function to call [function]
+        * -- parameters to pass to the function
+
+        Keyword arguments:
+        * -- parameters to pass to the function
+
+        Returns:
+        the function's result when awaited [asyncio.Future]
+        """
+        return self.get_main().get_loop().run_in_executor(None,
+                functools.partial(function, *args, **kwargs))
+
+    def spawn(self, *args, input=None, timeout=False):
+        """Run a program in the background, do not wait for it.
+
+        Errors are logged. Await boxcontroller.aio.run() instead if the
+        result is needed.
+
+        Positional arguments:
+        * -- the program and its arguments [string]
+
+        Keyword arguments:
+        input -- passed to the program's stdin [string]
+        timeout -- kill the program after timeout seconds, None to wait
+            forever, False for the default [float]
+
+        Returns:
+        the task [asyncio.Task] or None if not called from the main thread
+        """
+        return self.create_task(self.__spawn(args, input, timeout))
+
+    async def __spawn(self, args, input, timeout):
+        try:
+            result = await subprocesses.runner.run(*args, input=input,
+                    timeout=timeout)
+        except (subprocess.TimeoutExpired, OSError) as error:
+            logger.error('could not run "{}": {}'.format(args[0], error))
+            return
+        if result.returncode != 0:
+            logger.error('"{}" failed: "{}"'.format(' '.join(result.args),
+                result.stderr.strip()))
+
+    def register_counter(self, name, help, labels=(), function=None):
+        """Register a counter exposed with BoxController's metrics.
+
+        The name is prefixed with "boxcontroller_PLUGIN_", e.g., "plays_total"
+        becomes "boxcontroller_mpc_plays_total". Registering it again, e.g.,
+        after a reload, returns the existing counter.
+
+        Positional arguments:
+        name -- the name [string]
+        help -- what it counts [string]
+
+        Keyword arguments:
+        labels -- names of the labels [tuple]
+        function -- returns the value when scraped instead of counting
+            with inc() [function]
+
+        Returns:
+        the counter, call inc() to count [metrics.Counter]
+        """
+        return metrics.registry.counter(self._get_metric_name(name), help,
+                labels, function)
+
+    def register_gauge(self, name, help, labels=(), function=None):
+        """Register a gauge exposed with BoxController's metrics.
+
+        See register_counter().
+
+        Returns:
+        the gauge, call set() to set it [metrics.Gauge]
+        """
+        return metrics.registry.gauge(self._get_metric_name(name), help,
+                labels, function)
+
+    def register_summary(self, name, help, labels=()):
+        """Register a summary (count and sum) exposed with BoxController's
+        metrics.
+
+        See register_counter().
+
+        Returns:
+        the summary, call observe() to add a value [metrics.Summary]
+        """
+        return metrics.registry.summary(self._get_metric_name(name), help,
+                labels)
+
+    def _get_metric_name(self, name):
+        return 'boxcontroller_{}_{}'.format(self.get_name().lower(), name)
 
     def request_event(self, event, *args, **kwargs):
         """Request an event to be dispatched.
@@ -1,5 +1,12 @@
 #!/usr/bin/env python3
 
+import collections
+import logging
+import logging.config
+import logging.handlers
+import multiprocessing
+import time
+
 config = {
     'version': 1,
     'disable_existing_loggers': True,
@@ -39,3 +46,133 @@ config = {
         },
     }
 }
+
+# identical messages are let through BURST times per INTERVAL seconds
+rate_limit = {
+    'interval': 10,
+    'burst': 3,
+}
+
+# the queue all records are sent through, set by configure()
+_queue = None
+
+class RateLimitFilter(logging.Filter):
+    """Suppress identical messages repeated within a short time.
+
+    The first message after a period of suppression is annotated with the
+    number of repetitions that were dropped.
+    """
+
+    def __init__(self, interval=10, burst=3, max_entries=1000):
+        """Initialise variables.
+
+        Keyword arguments:
+        interval -- the length of the window in seconds [float]
+        burst -- number of identical messages to let through per window [int]
+        max_entries -- number of distinct messages to remember [int]
+        """
+        super().__init__()
+        self.__interval = interval
+        self.__burst = burst
+        self.__max_entries = max_entries
+        # (logger, level, message): [start of window, count]
+        self.__seen = collections.OrderedDict()
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.getMessage())
+        now = time.monotonic()
+        entry = self.__seen.get(key)
+
+        if entry is not None and now - entry[0] < self.__interval:
+            entry[1] += 1
+            return entry[1] <= self.__burst
+
+        suppressed = 0 if entry is None else max(entry[1] - self.__burst, 0)
+        self.__seen[key] = [now, 1]
+        self.__seen.move_to_end(key)
+        if len(self.__seen) > self.__max_entries:
+            self.__seen.popitem(last=False)
+
+        if suppressed > 0:
+            record.msg = '{} (suppressed {} repetitions)'.format(
+                    record.getMessage(), suppressed)
+            record.args = None
+        return True
+
+class RateLimitedQueueListener(logging.handlers.QueueListener):
+    """QueueListener passing each record through a RateLimitFilter once."""
+
+    def __init__(self, queue, *handlers, **kwargs):
+        super().__init__(queue, *handlers, **kwargs)
+        self.__filter = RateLimitFilter(**rate_limit)
+
+    def handle(self, record):
+        if self.__filter.filter(record):
+            super().handle(record)
+
+def configure(log_config):
+    """Configure logging to pass all records through a queue.
+
+    The handlers defined in log_config are moved to a listener thread
+    draining the queue. Loggers only put records onto the queue which does not
+    block. Child processes forked afterwards inherit the queue and thus send
+    their records to the same listener.
+
+    Positional arguments:
+    log_config -- the configuration for logging.config.dictConfig() [dict]
+
+    Returns:
+    the started listener [RateLimitedQueueListener]
+    """
+    global _queue
+    logging.config.dictConfig(log_config)
+
+    _queue = multiprocessing.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(_queue)
+    handlers = []
+    for name in log_config['loggers'].keys():
+        logger = logging.getLogger(name)
+        for handler in logger.handlers:
+            if not handler in handlers:
+                handlers.append(handler)
+        logger.handlers = [queue_handler]
+
+    listener = RateLimitedQueueListener(_queue, *handlers,
+            respect_handler_level=True)
+    listener.start()
+    return listener
+
+def get_queue():
+    """Return the queue records are sent through (None if not configured)."""
+    return _queue
+
+def get_child_config():
+    """Return what a child process needs to log through the queue.
+
+    Returns:
+    (the queue, {logger name: level}) or None if not configured
+    """
+    if _queue is None:
+        return None
+    return (_queue, {name: logging.getLogger(name).level
+        for name in config['loggers'].keys()})
+
+def configure_child(child_config):
+    """Configure logging in a child process not forked from the main process.
+
+    Children started with "spawn" or "forkserver" do not inherit the logging
+    configuration so their loggers need to be pointed to the queue again.
+
+    Positional arguments:
+    child_config -- as returned by get_child_config() in the main process
+    """
+    global _queue
+    if child_config is None:
+        return
+    _queue, levels = child_config
+    queue_handler = logging.handlers.QueueHandler(_queue)
+    for name, level in levels.items():
+        logger = logging.getLogger(name)
+        logger.handlers = [queue_handler]
+        logger.propagate = False
+        logger.setLevel(level)
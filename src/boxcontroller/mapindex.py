@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'BCMAPIDX'
+VERSION = 2
+
+# magic, version, length of the JSON header
+HEADER = struct.Struct('!8sHI')
+OFFSET = struct.Struct('!I')
+# length of the key, length of the line
+RECORD = struct.Struct('!HI')
+
+_builds = metrics.registry.summary('boxcontroller_map_index_build_seconds',
+        'Map indexes compiled and how long it took', ['file'])
+
+class MapIndex():
+    """A compiled index of one or more map files (see KeyMap).
+
+    The lines of the map files are written sorted by key to a binary file
+    which is looked up through mmap, so only the pages touched while
+    searching are read and no line is parsed before it is asked for. Later
+    files override earlier ones like KeyMap.load() does.
+
+    The index remembers the size and modification time of each map file
+    and is compiled again once one of them changes.
+
+    Lines whose key is a pattern (see patterns.py) cannot be found by
+    their key, they are kept in order in the header (see get_patterns()).
+
+    Layout (big-endian):
+        HEADER (magic, version, length of the JSON header)
+        JSON header {"sources": [[path, mtime_ns, size], ...],
+            "delimiter": "|", "count": N, "patterns": [line, ...]}
+        N offsets of the records, sorted by key [OFFSET]
+        N records: RECORD (length of the key, length of the line), the key
+            and the whole line, utf-8
+    """
+
+    def __init__(self, path, sources, delimiter='|', is_pattern=None):
+        """Initialise variables.
+
+        Positional arguments:
+        path -- where to write the index to [Path]
+        sources -- the map files, later ones override earlier ones [list]
+
+        Keyword arguments:
+        delimiter -- the delimiter of the map files [string]
+        is_pattern -- returns True for keys to keep in the header
+            [function]
+        """
+        self.__path = Path(path)
+        self.__sources = [Path(source) for source in sources]
+        self.__delimiter = delimiter
+        self.__is_pattern = is_pattern
+        self.__file = None
+        self.__map = None
+        self.__header = None
+        self.__count = 0
+        self.__offsets = 0
+
+    def get_path(self):
+        return self.__path
+
+    def get_count(self):
+        """Return the number of keys in the index."""
+        return self.__count
+
+    def get_patterns(self):
+        """Return the lines whose key is a pattern in the order defined."""
+        if self.__header is None:
+            return []
+        return self.__header['patterns']
+
+    def _get_fingerprints(self):
+        """Return [[path, mtime_ns, size], ...] of the map files."""
+        fingerprints = []
+        for source in self.__sources:
+            try:
+                stat = source.stat()
+                fingerprints.append([str(source), stat.st_mtime_ns,
+                    stat.st_size])
+            except FileNotFoundError:
+                fingerprints.append([str(source), None, None])
+        return fingerprints
+
+    def is_current(self):
+        """Return True if the open index matches the map files on disk."""
+        return self.__map is not None and \
+                self.__header['sources'] == self._get_fingerprints()
+
+    def open(self):
+        """Open the index, compile it first if the map files changed.
+
+        Returns:
+        False if the index was already open and current [bool]
+        """
+        if self.is_current():
+            return False
+        self.close()
+        if not self.__open() or not self.is_current():
+            self.close()
+            self.build()
+            if not self.__open():
+                raise OSError('cannot open map index "{}"'.format(
+                    self.__path))
+        return True
+
+    def __open(self):
+        try:
+            self.__file = self.__path.open('rb')
+            self.__map = mmap.mmap(self.__file.fileno(), 0,
+                    access=mmap.ACCESS_READ)
+            magic, version, length = HEADER.unpack_from(self.__map, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('unknown format')
+            self.__header = json.loads(self.__map[HEADER.size:HEADER.size +
+                length].decode('utf-8'))
+            if self.__header['delimiter'] != self.__delimiter:
+                raise ValueError('different delimiter')
+        except (OSError, ValueError, KeyError, struct.error) as error:
+            logger.debug('cannot use map index "{}": {}'.format(self.__path,
+                error))
+            self.close()
+            return False
+        self.__count = self.__header['count']
+        self.__offsets = HEADER.size + length
+        return True
+
+    def close(self):
+        if self.__map is not None:
+            self.__map.close()
+        if self.__file is not None:
+            self.__file.close()
+        self.__map = None
+        self.__file = None
+        self.__header = None
+        self.__count = 0
+
+    def build(self):
+        """Compile the index from the map files."""
+        start = time.monotonic()
+        fingerprints = self._get_fingerprints()
+        delimiter = self.__delimiter.encode('utf-8')
+        lines = {}
+        for source in self.__sources:
+            try:
+                with source.open('rb') as map:
+                    for line in map:
+                        line = line.strip()
+                        if line == b'':
+                            continue
+                        key = line.split(delimiter, 1)[0]
+                        if len(key) > 65535:
+                            logger.error('key too long: "{}"'.format(
+                                key[:40].decode('utf-8', 'replace')))
+                            continue
+                        lines[key] = line
+            except FileNotFoundError:
+                logger.debug('could not open file at ' + str(source))
+        patterns = []
+        if self.__is_pattern is not None:
+            for key, line in list(lines.items()):
+                if self.__is_pattern(key.decode('utf-8')):
+                    patterns.append(line.decode('utf-8'))
+                    del lines[key]
+        keys = sorted(lines.keys())
+        header = json.dumps({'sources': fingerprints,
+            'delimiter': self.__delimiter,
+            'count': len(keys), 'patterns': patterns}).encode('utf-8')
+
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        partial = self.__path.with_name(self.__path.name + '.partial')
+        with partial.open('wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, len(header)))
+            file.write(header)
+            offset = HEADER.size + len(header) + OFFSET.size * len(keys)
+            for key in keys:
+                file.write(OFFSET.pack(offset))
+                offset += RECORD.size + len(key) + len(lines[key])
+            for key in keys:
+                file.write(RECORD.pack(len(key), len(lines[key])))
+                file.write(key)
+                file.write(lines[key])
+        # replace the index in one go, lookups may still use the old one
+        os.replace(str(partial), str(self.__path))
+        duration = time.monotonic() - start
+        _builds.observe(duration, file=self.__path.name)
+        logger.info('compiled {} keys into "{}" in {:.3f} s'.format(len(keys),
+            self.__path, duration))
+
+    def get_line(self, key):
+        """Return the line mapped to key or None.
+
+        Positional arguments:
+        key -- the key [string]
+
+        Returns:
+        the whole line including the key [string]
+        """
+        if self.__map is None:
+            raise OSError('map index "{}" is not open'.format(self.__path))
+        key = key.encode('utf-8')
+        map = self.__map
+        low = 0
+        high = self.__count
+        while low < high:
+            middle = (low + high) // 2
+            offset, = OFFSET.unpack_from(map, self.__offsets +
+                    middle * OFFSET.size)
+            key_length, line_length = RECORD.unpack_from(map, offset)
+            start = offset + RECORD.size
+            found = map[start:start + key_length]
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                start += key_length
+                return map[start:start + line_length].decode('utf-8')
+        return None
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+def get_memory(pid=None):
+    """Return the memory used by a process in bytes.
+
+    RSS counts all pages in memory including those shared with other
+    processes (e.g., copy-on-write pages after forking), PSS divides shared
+    pages between the processes sharing them and USS (unique set size) only
+    counts pages private to the process, i.e., the memory that would be freed
+    if the process stopped.
+
+    Read from /proc so this only works on Linux.
+
+    Keyword arguments:
+    pid -- the process id, None for the calling process [int]
+
+    Returns:
+    {'rss': int, 'pss': int, 'uss': int} or None if it cannot be read
+    """
+    if pid is None:
+        pid = os.getpid()
+    path = Path('/proc', str(pid))
+    for name in ['smaps_rollup', 'smaps']:
+        try:
+            with (path / name).open('r') as file:
+                lines = file.readlines()
+            break
+        except OSError:
+            continue
+    else:
+        logger.debug('cannot read memory of process {}'.format(pid))
+        return None
+
+    # smaps lists each mapping, smaps_rollup has a single summary
+    fields = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) == 3 and parts[2] == 'kB':
+            key = parts[0].rstrip(':')
+            fields[key] = fields.get(key, 0) + int(parts[1]) * 1024
+    return {
+            'rss': fields.get('Rss', 0),
+            'pss': fields.get('Pss', 0),
+            'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty',
+                0),
+            }
+
+def format_report(processes):
+    """Return a table listing the memory used by each process.
+
+    Positional arguments:
+    processes -- {name: pid} [dict]
+    """
+    lines = ['{:<20} {:>8} {:>10} {:>10} {:>10}'.format('process', 'pid',
+        'USS [MiB]', 'PSS [MiB]', 'RSS [MiB]')]
+    total = {'rss': 0, 'pss': 0, 'uss': 0}
+    for name, pid in processes.items():
+        memory = get_memory(pid)
+        if memory is None:
+            lines.append('{:<20} {:>8} {:>10}'.format(name, pid, 'n/a'))
+            continue
+        for key in total.keys():
+            total[key] += memory[key]
+        lines.append('{:<20} {:>8} {:>10.1f} {:>10.1f} {:>10.1f}'.format(name,
+            pid, memory['uss'] / 1048576, memory['pss'] / 1048576,
+            memory['rss'] / 1048576))
+    lines.append('{:<20} {:>8} {:>10.1f} {:>10.1f} {:>10}'.format('total', '',
+        total['uss'] / 1048576, total['pss'] / 1048576, ''))
+    return '\n'.join(lines)
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+import math
+import threading
+
+logger = logging.getLogger(__name__)
+
+class Metric():
+    """A named value, optionally one per combination of label values.
+
+    Use the subclasses Counter, Gauge and Summary.
+    """
+
+    kind = None
+
+    def __init__(self, name, help, labels=(), function=None):
+        """Initialise variables.
+
+        Positional arguments:
+        name -- the name, e.g., "boxcontroller_inputs_total" [string]
+        help -- what it counts / measures [string]
+
+        Keyword arguments:
+        labels -- names of the labels [tuple]
+        function -- returns the value when scraped, a number or, with
+            labels, {(label value, ...): number} [function]
+        """
+        self.__name = name
+        self.__help = help
+        self.__labels = tuple(labels)
+        self.__function = function
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get_name(self):
+        return self.__name
+
+    def get_labels(self):
+        return self.__labels
+
+    def set_function(self, function):
+        """Replace the function returning the value when scraped."""
+        self.__function = function
+
+    def _get_key(self, labels):
+        try:
+            return tuple(str(labels[label]) for label in self.__labels)
+        except KeyError as error:
+            raise ValueError('{}: missing label {}'.format(self.__name,
+                error))
+
+    def get_values(self):
+        """Return {(label value, ...): value}."""
+        if self.__function is None:
+            with self._lock:
+                return dict(self._values)
+        try:
+            values = self.__function()
+        except Exception:
+            logger.exception('could not get the value of "{}"'.format(
+                self.__name))
+            return {}
+        return values if len(self.__labels) > 0 else {(): values}
+
+    def format(self):
+        """Return the metric in Prometheus' text format."""
+        lines = ['# HELP {} {}'.format(self.__name, self.__help),
+                '# TYPE {} {}'.format(self.__name, self.kind)]
+        for key, value in sorted(self.get_values().items()):
+            lines += self._format_value(self.__format_labels(key), value)
+        return '\n'.join(lines)
+
+    def _format_value(self, labels, value):
+        return ['{}{} {}'.format(self.__name, labels, format_number(value))]
+
+    def __format_labels(self, key):
+        if len(key) == 0:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(label, value.replace('\\',
+            '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for label, value in zip(self.__labels, key)) + '}'
+
+class Counter(Metric):
+    """A value that only goes up, e.g., the number of inputs received."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Increase the counter.
+
+        Keyword arguments:
+        amount -- how much to add [int|float]
+        * -- the values of the labels
+        """
+        key = self._get_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """A value that goes up and down, e.g., the depth of a queue."""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        """Set the gauge to value.
+
+        Positional arguments:
+        value -- the value [int|float]
+
+        Keyword arguments:
+        * -- the values of the labels
+        """
+        key = self._get_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._get_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Summary(Metric):
+    """Count and sum of observations, e.g., how long subprocesses take."""
+
+    kind = 'summary'
+
+    def observe(self, value, **labels):
+        """Record an observation.
+
+        Positional arguments:
+        value -- the value, e.g., seconds [int|float]
+
+        Keyword arguments:
+        * -- the values of the labels
+        """
+        key = self._get_key(labels)
+        with self._lock:
+            count, total = self._values.get(key, (0, 0))
+            self._values[key] = (count + 1, total + value)
+
+    def _format_value(self, labels, value):
+        return ['{}_count{} {}'.format(self.get_name(), labels,
+                    format_number(value[0])),
+                '{}_sum{} {}'.format(self.get_name(), labels,
+                    format_number(value[1]))]
+
+class Registry():
+    """All metrics of BoxController.
+
+    Asking for a metric that already exists returns it, so modules and
+    (reloaded) plugins need not keep track of what has been registered.
+    """
+
+    def __init__(self):
+        """Initialise variables."""
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+
+    def counter(self, name, help, labels=(), function=None):
+        """Return the counter called name, create it if necessary.
+
+        See Metric.__init__() for the arguments.
+        """
+        return self.__get(Counter, name, help, labels, function)
+
+    def gauge(self, name, help, labels=(), function=None):
+        """Return the gauge called name, create it if necessary.
+
+        See Metric.__init__() for the arguments.
+        """
+        return self.__get(Gauge, name, help, labels, function)
+
+    def summary(self, name, help, labels=()):
+        """Return the summary called name, create it if necessary.
+
+        See Metric.__init__() for the arguments.
+        """
+        return self.__get(Summary, name, help, labels, None)
+
+    def __get(self, cls, name, help, labels, function):
+        with self.__lock:
+            metric = self.__metrics.get(name)
+            if metric is None:
+                metric = cls(name, help, labels, function)
+                self.__metrics[name] = metric
+            elif type(metric) != cls or \
+                    metric.get_labels() != tuple(labels):
+                raise ValueError('"{}" is already registered as {} {}'.format(
+                    name, metric.kind, metric.get_labels()))
+            elif function is not None:
+                # e.g., a reloaded plugin
+                metric.set_function(function)
+            return metric
+
+    def unregister(self, name):
+        """Remove a metric, e.g., one whose function is no longer valid.
+
+        Positional arguments:
+        name -- the name of the metric [string]
+        """
+        with self.__lock:
+            self.__metrics.pop(name, None)
+
+    def format(self):
+        """Return all metrics in Prometheus' text format."""
+        with self.__lock:
+            metrics = sorted(self.__metrics.items())
+        return ''.join(metric.format() + '\n' for name, metric in metrics)
+
+def format_number(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+async def serve(registry, path=None, port=None):
+    """Serve the metrics in the running event loop.
+
+    A unix socket answers each connection with the metrics, e.g.,
+    `socat - UNIX-CONNECT:PATH`. The HTTP port only listens on the loopback
+    interface, e.g., `curl http://127.0.0.1:PORT/metrics`.
+
+    Keyword arguments:
+    path -- path of the unix socket, None to disable [Path]
+    port -- the HTTP port, None to disable [int]
+
+    Returns:
+    the servers, close() them to stop serving [list]
+    """
+    servers = []
+
+    async def answer(reader, writer):
+        try:
+            writer.write(registry.format().encode('utf-8'))
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def answer_http(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # skip the headers
+            while (await asyncio.wait_for(reader.readline(), 5)).strip() != \
+                    b'':
+                pass
+            method, path = (request.decode('latin-1').split() + ['', ''])[:2]
+            if method != 'GET':
+                status, body = '405 Method Not Allowed', ''
+            elif not path in ['/', '/metrics']:
+                status, body = '404 Not Found', ''
+            else:
+                status, body = '200 OK', registry.format()
+            body = body.encode('utf-8')
+            writer.write(('HTTP/1.0 {}\r\n'.format(status) +
+                'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n' +
+                'Content-Length: {}\r\n\r\n'.format(len(body))).encode(
+                    'latin-1') + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    if path is not None:
+        if path.is_socket():
+            # left over from a crash
+            path.unlink()
+        servers.append(await asyncio.start_unix_server(answer, str(path)))
+        logger.info('serving metrics at {}'.format(path))
+    if port is not None:
+        servers.append(await asyncio.start_server(answer_http, '127.0.0.1',
+            port))
+        logger.info('serving metrics at http://127.0.0.1:{}/metrics'.format(
+            port))
+    return servers
+
+# the registry used throughout BoxController
+registry = Registry()
+
+# filled by subprocesses.runner calling external programs (mpc, amixer, ...),
+# command is, e.g., "mpc status"
+subprocesses = registry.summary('boxcontroller_subprocess_seconds',
+        'Subprocesses run and how long they took', ['program', 'command'])
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# characters making a key a pattern:
+# * -- any number of characters (including none)
+# ? -- exactly one character
+WILDCARDS = '*?'
+
+def is_pattern(key):
+    """Return True if key contains a wildcard."""
+    return any(character in key for character in WILDCARDS)
+
+def split_pattern(pattern):
+    """Return the literal prefix and the rest of a pattern.
+
+    Positional arguments:
+    pattern -- the pattern, e.g., "GPIO_*_L" [string]
+
+    Returns:
+    (prefix, rest), e.g., ("GPIO_", "*_L") [tuple]
+    """
+    for i, character in enumerate(pattern):
+        if character in WILDCARDS:
+            return (pattern[:i], pattern[i:])
+    return (pattern, '')
+
+def translate(pattern):
+    """Return a regular expression capturing what each wildcard matched.
+
+    Positional arguments:
+    pattern -- the pattern [string]
+    """
+    parts = []
+    for character in pattern:
+        if character == '*':
+            parts.append('(.*)')
+        elif character == '?':
+            parts.append('(.)')
+        else:
+            parts.append(re.escape(character))
+    return ''.join(parts)
+
+class PatternMatcher():
+    """Match keys against patterns, e.g., "GPIO_*_L" or "04*".
+
+    The patterns are stored in a trie by their literal prefix (the part
+    before the first wildcard) so walking a key down the trie finds the
+    candidates in O(length of the key). Only the rest of each candidate is
+    matched by a regular expression.
+
+    If more than one pattern matches, the one with
+    1. the longest literal prefix wins, then the one with
+    2. the most literal characters, then the one
+    3. added last (e.g., later in the user's eventmap).
+    """
+
+    def __init__(self):
+        """Initialise variables."""
+        self.__patterns = []
+        self.__trie = None
+
+    def add(self, pattern, data):
+        """Add a pattern, compile() needs to be called afterwards.
+
+        Positional arguments:
+        pattern -- the pattern [string]
+        data -- returned by match() for keys matching the pattern
+        """
+        self.__patterns.append((pattern, data))
+        self.__trie = None
+
+    def get_count(self):
+        """Return the number of patterns."""
+        return len(self.__patterns)
+
+    def compile(self):
+        """Build the trie from the patterns added."""
+        # [{character: node}, [(precedence, rest, data), ...]]
+        trie = [{}, []]
+        for order, (pattern, data) in enumerate(self.__patterns):
+            prefix, rest = split_pattern(pattern)
+            node = trie
+            for character in prefix:
+                node = node[0].setdefault(character, [{}, []])
+            literals = len(pattern) - sum(pattern.count(wildcard)
+                    for wildcard in WILDCARDS)
+            node[1].append(((literals, order), re.compile(translate(rest),
+                re.DOTALL), data))
+        self.__sort(trie)
+        self.__trie = trie
+
+    def __sort(self, node):
+        # iterative to cope with long prefixes
+        pending = [node]
+        while len(pending) > 0:
+            node = pending.pop()
+            node[1].sort(key=lambda candidate: candidate[0], reverse=True)
+            pending.extend(node[0].values())
+
+    def match(self, key):
+        """Return the data of the pattern matching key and what each
+        wildcard matched or None.
+
+        Positional arguments:
+        key -- the key [string]
+
+        Returns:
+        (data, [captured string, ...]) or None [tuple]
+        """
+        if self.__trie is None:
+            self.compile()
+        # the nodes along the key, the deepest has the longest prefix
+        nodes = [(self.__trie, 0)]
+        node = self.__trie
+        for i, character in enumerate(key):
+            node = node[0].get(character)
+            if node is None:
+                break
+            nodes.append((node, i + 1))
+        for node, depth in reversed(nodes):
+            for precedence, expression, data in node[1]:
+                match = expression.fullmatch(key, depth)
+                if match is not None:
+                    return (data, list(match.groups()))
+        return None
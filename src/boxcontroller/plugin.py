@@ -7,6 +7,16 @@ logger = logging.getLogger(__name__)
 class Plugin:
     """Base class for plugins"""
 
+    # names of the plugins (e.g., "Shutdowntimer") that need to be initialised
+    # before this plugin
+    dependencies = []
+
+    # the config section the plugin reads its settings from and its schema:
+    # {key: (variable_type, default)}, see Config.get_settings()
+    # keep the schema literal so it can be checked without importing the plugin
+    config_section = None
+    config_schema = {}
+
     def __init__(self, *args, **kwargs):
         """Initialise variables and register to "plugins_loaded".
 
@@ -17,6 +27,23 @@ class Plugin:
         Plugin.__init__(self, *args, **kwargs)
         """
         self.__name = kwargs['name']
+        self.__settings = None
+        self.load_settings(kwargs['main'].get_config())
 
     def get_name(self):
         return self.__name
+
+    def get_settings(self):
+        """Return the immutable snapshot of the plugin's config section."""
+        return self.__settings
+
+    def load_settings(self, config):
+        """(Re-)create the snapshot of the plugin's config section.
+
+        Positional arguments:
+        config -- the config to read from [Config]
+        """
+        if self.config_section is None:
+            return
+        self.__settings = config.get_settings(self.config_section,
+                self.config_schema)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+import ast
+import json
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+class PluginManifest():
+    """Description of all plugins found in the plugin directories.
+
+    Each plugin package is analysed statically (without importing it) to find
+    out:
+    * name -- the name of the package (e.g., "mpc")
+    * class -- the name of the plugin class (e.g., "Mpc")
+    * kind -- "listener", "process" or None if it could not be determined
+    * events -- the events the plugin registers to via self.register()
+    * sections -- the config sections the plugin reads via get_config().get()
+    * lazy -- whether the plugin may be imported on first dispatch
+    * dependencies -- the plugins that need to be initialised beforehand
+    * section -- the plugin's config section (config_section)
+    * schema -- the schema of the config section (config_schema)
+
+    The results are cached in a JSON file and only recomputed if the module's
+    mtime or size changed.
+    """
+
+    version = 3
+
+    def __init__(self, path_cache):
+        """Initialise variables.
+
+        Positional arguments:
+        path_cache -- the path of the cache file [Path]
+        """
+        self.__path_cache = path_cache
+        self.__cache = None
+        self.__changed = False
+
+    def get_path_cache(self):
+        return self.__path_cache
+
+    def get_cache(self):
+        """Return the cached entries, load them from disk on first access."""
+        if self.__cache is None:
+            self.__cache = {}
+            try:
+                with open(self.get_path_cache(), 'r') as cache_file:
+                    data = json.load(cache_file)
+                if data.get('version') == self.version:
+                    self.__cache = data['plugins']
+            except (OSError, ValueError, KeyError):
+                logger.debug('could not read plugin manifest at {}'.format(
+                    self.get_path_cache()))
+        return self.__cache
+
+    def scan(self, path):
+        """Return the manifest entries for all packages under path.
+
+        Positional arguments:
+        path -- the directory to scan [Path]
+        """
+        entries = []
+        if not path.is_dir():
+            logger.debug('no plugin directory at {}'.format(path))
+            return entries
+
+        for directory in sorted(path.iterdir()):
+            if directory.name == '__pycache__' or not directory.is_dir():
+                continue
+            module = directory / '{}.py'.format(directory.name)
+            try:
+                stat = module.stat()
+            except OSError:
+                logger.error('no module "{}" in plugin "{}"'.format(
+                    module.name, directory.name))
+                continue
+
+            cached = self.get_cache().get(str(module))
+            if (cached is not None and cached['mtime'] == stat.st_mtime_ns
+                    and cached['size'] == stat.st_size):
+                entries.append(cached['entry'])
+                continue
+
+            logger.debug('analysing plugin "{}"'.format(directory.name))
+            entry = self._analyse(directory.name, module)
+            self.get_cache()[str(module)] = {
+                    'mtime': stat.st_mtime_ns,
+                    'size': stat.st_size,
+                    'entry': entry}
+            self.__changed = True
+            entries.append(entry)
+        return entries
+
+    def save(self):
+        """Write the cache to disk if anything changed."""
+        if not self.__changed:
+            return
+        try:
+            with open(self.get_path_cache(), 'w') as cache_file:
+                json.dump({'version': self.version,
+                    'plugins': self.get_cache()}, cache_file, indent=1)
+            self.__changed = False
+            logger.debug('saved plugin manifest to {}'.format(
+                self.get_path_cache()))
+        except OSError:
+            logger.error('could not write plugin manifest to {}'.format(
+                self.get_path_cache()))
+
+    def _analyse(self, name, path):
+        """Inspect the plugin's source and return its manifest entry.
+
+        Positional arguments:
+        name -- the name of the plugin package [string]
+        path -- the path to the plugin's module [Path]
+        """
+        classname = name[0].upper() + name[1:]
+        entry = {
+                'name': name,
+                'class': classname,
+                'kind': None,
+                'events': [],
+                'sections': [],
+                'lazy': False,
+                'dependencies': [],
+                'section': None,
+                'schema': {}}
+
+        try:
+            tree = ast.parse(path.read_text(), str(path))
+        except (OSError, SyntaxError, ValueError) as error:
+            logger.error('could not parse plugin "{}": {}'.format(name, error))
+            return entry
+
+        node = None
+        for candidate in tree.body:
+            if isinstance(candidate, ast.ClassDef) and \
+                    candidate.name == classname:
+                node = candidate
+                break
+        if node is None:
+            logger.debug('no class "{}" in plugin "{}"'.format(classname,
+                name))
+            return entry
+
+        bases = [self._name_of(base) for base in node.bases]
+        if 'ListenerPlugin' in bases:
+            entry['kind'] = 'listener'
+        elif 'ProcessPlugin' in bases:
+            entry['kind'] = 'process'
+
+        attributes = self._class_attributes(node)
+        dynamic = False
+        for child in ast.walk(node):
+            if not isinstance(child, ast.Call) or \
+                    not isinstance(child.func, ast.Attribute):
+                continue
+            if child.func.attr == 'register' and \
+                    self._name_of(child.func.value) == 'self':
+                event = self._literal(child.args[0]) if child.args else None
+                if isinstance(event, str):
+                    self._append(entry['events'], event)
+                else:
+                    # cannot tell which events this plugin needs
+                    dynamic = True
+            elif child.func.attr == 'get' and \
+                    isinstance(child.func.value, ast.Call) and \
+                    self._name_of(child.func.value.func) == 'get_config':
+                section = self._literal(child.args[0]) if child.args else None
+                if isinstance(section, str):
+                    self._append(entry['sections'], section)
+
+        entry['lazy'] = (entry['kind'] == 'listener' and not dynamic and
+                attributes.get('lazy', False) is True)
+        dependencies = attributes.get('dependencies', [])
+        if isinstance(dependencies, (list, tuple)):
+            entry['dependencies'] = [str(item) for item in dependencies]
+        if isinstance(attributes.get('config_section'), str):
+            entry['section'] = attributes['config_section']
+        if isinstance(attributes.get('config_schema'), dict):
+            entry['schema'] = attributes['config_schema']
+        return entry
+
+    def _class_attributes(self, node):
+        """Return all literal class attributes of a class definition.
+
+        Positional arguments:
+        node -- the class definition [ast.ClassDef]
+        """
+        attributes = {}
+        for child in node.body:
+            if not isinstance(child, ast.Assign):
+                continue
+            try:
+                value = ast.literal_eval(child.value)
+            except (ValueError, TypeError, SyntaxError):
+                continue
+            for target in child.targets:
+                if isinstance(target, ast.Name):
+                    attributes[target.id] = value
+        return attributes
+
+    def _literal(self, node):
+        try:
+            return ast.literal_eval(node)
+        except (ValueError, TypeError, SyntaxError):
+            return None
+
+    def _name_of(self, node):
+        if isinstance(node, ast.Name):
+            return node.id
+        elif isinstance(node, ast.Attribute):
+            return node.attr
+        return None
+
+    def _append(self, items, item):
+        if not item in items:
+            items.append(item)
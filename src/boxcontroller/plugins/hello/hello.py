@@ -12,10 +12,19 @@ class Hello(ListenerPlugin):
     Initialises on on_plugins_loaded().
     """
 
+    lazy = True
+    config_section = 'Hello'
+    config_schema = {
+            'smile': ('str', ':)'),
+            }
+
     def on_init(self):
-        self._smile = self.get_config().get('Hello', 'smile')
+        self._smile = self.get_settings().smile
         self.register('smile', self.smile)
 
+    def on_config_changed(self, changes):
+        self._smile = self.get_settings().smile
+
     def smile(self, at=''):
         if at == 'joke':
             logger.debug(':D')
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-from gpiodmonitor.gpiodmonitor import GPIODMonitor
+import functools
 import time
 import logging
 
@@ -13,21 +13,28 @@ class Inputgpiod(ProcessPlugin):
 
     """
 
-    def __init__(self, *args, **kwargs):
-        ProcessPlugin.__init__(self, *args, **kwargs)
-        self.__chip = kwargs['main'].get_config().get('InputGPIOD',
-                'chip', default=None, variable_type='int')
-
-        pins = kwargs['main'].get_config().get('InputGPIOD',
-                'pins', default='')
-        self.__pins = [int(pin) for pin in pins.split(',')]
+    # GPIODMonitor.run() never returns, its thread only ends with the
+    # plugin's process
+    execution_modes = ['process']
 
-        pins = kwargs['main'].get_config().get('InputGPIOD',
-                'pins_long_press', default='')
-        self.__long_press_pins = [int(pin) for pin in pins.split(',')]
+    config_section = 'InputGPIOD'
+    config_schema = {
+            'chip': ('int', None),
+            'pins': ('intlist', ()),
+            'pins_long_press': ('intlist', ()),
+            'long_press': ('int', 3),
+            }
 
-        self.__long_press = kwargs['main'].get_config().get('InputGPIOD',
-                'long_press', default=3, variable_type='int')
+    def __init__(self, *args, **kwargs):
+        ProcessPlugin.__init__(self, *args, **kwargs)
+        self.__chip = self.get_settings().chip
+        self.__pins = list(self.get_settings().pins)
+        self.__long_press_pins = list(self.get_settings().pins_long_press)
+        self.__long_press = self.get_settings().long_press
+        self.__paused = False
+        self.register_command('pause', functools.partial(self.set_paused, True))
+        self.register_command('resume',
+                functools.partial(self.set_paused, False))
 
         if self.__chip is None or len(self.__pins) == 0:
             logger.error('No chip or pins defined')
@@ -45,17 +52,34 @@ class Inputgpiod(ProcessPlugin):
     def get_long_press_duration(self):
         return self.__long_press
 
+    def is_paused(self):
+        return self.__paused
+
+    def set_paused(self, paused=True):
+        """Ignore presses while paused.
+
+        Keyword arguments:
+        paused -- pause (True) or resume (False) [boolean]
+        """
+        logger.debug('{} input'.format('pausing' if paused else 'resuming'))
+        self.__paused = paused
+
     def on_pressed(self, pin):
         logger.debug('GPIO {} pressed'.format(pin))
+        if self.is_paused():
+            return
         self.queue_put('GPIO_{}_P'.format(str(pin)))
 
     def on_long_pressed(self, pin):
         logger.debug('GPIO {} pressed for {}'.format(pin,
             self.get_long_press_duration()))
-        self.queue_put('feedback'.format(str(pin)))
-        self.queue_put('GPIO_{}_L'.format(str(pin)))
+        if self.is_paused():
+            return
+        self.queue_put_many(['feedback', 'GPIO_{}_L'.format(str(pin))])
 
     def run(self):
+        # import here so the main process does not need to load gpiod
+        from gpiodmonitor.gpiodmonitor import GPIODMonitor
         monitor = GPIODMonitor(self.__chip)
         for gpio_pin in self.get_pins():
             monitor.register(gpio_pin,
@@ -65,6 +89,7 @@ class Inputgpiod(ProcessPlugin):
                 lambda pin,time: self.on_long_pressed(pin),
                 self.get_long_press_duration())
         logger.debug('listening to pins')
-        monitor.run()
+        # GPIODMonitor runs its own loop which never returns
+        self.run_loop_in_thread(monitor.run)
 
 
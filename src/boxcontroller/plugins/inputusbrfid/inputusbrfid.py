@@ -1,8 +1,6 @@
 #!/usr/bin/env python3
 
-from evdev import InputDevice, ecodes
-from select import select
-import time
+import functools
 import logging
 
 from boxcontroller.processplugin import ProcessPlugin
@@ -14,23 +12,41 @@ class Inputusbrfid(ProcessPlugin):
 
     """
 
+    execution_modes = ['process', 'thread', 'inline']
+
+    config_section = 'InputUSBRFID'
+    config_schema = {
+            'device': ('str', None),
+            }
+
     def __init__(self, *args, **kwargs):
         ProcessPlugin.__init__(self, *args, **kwargs)
-        self.__device_path = kwargs['main'].get_config().get('InputUSBRFID',
-                'device', default=None)
+        self.__device_path = self.get_settings().device
+        self.__device = None
+        self.__paused = False
+        self.__keys = "X^1234567890XXXXqwertzuiopXXXXasdfghjklXXXXXyxcvbnmXXXXXXXXXXXXXXXXXXXXXXX"
+        # the characters of the card read so far
+        self.__string = ''
         if self.__device_path is None:
             logger.error('No device defined')
             return
+        self.register_command('pause', functools.partial(self.set_paused, True))
+        self.register_command('resume',
+                functools.partial(self.set_paused, False))
+        self.register_command('reopen', self.open_device)
+        self.register_command('grab', self.grab_device)
+        self.register_command('ungrab', functools.partial(self.grab_device,
+            False))
 
     def run(self):
         logger.debug('running')
-        self.__keys = "X^1234567890XXXXqwertzuiopXXXXasdfghjklXXXXXyxcvbnmXXXXXXXXXXXXXXXXXXXXXXX"
-        self.__device = InputDevice(self.__device_path)
+        self.open_device()
 
-        while True:
-            time.sleep(0.2)
-            card_id = self.read_card()
-            self.queue_put(card_id.strip())
+        while not self.get_interrupt_signal():
+            # the device may have been replaced by a command
+            device = self.get_device()
+            if device in self.wait([device]):
+                self.read_events()
 
         #with open( "/dev/input/event21", "rb" ) as input_handle:
         #    while 1:
@@ -39,19 +55,67 @@ class Inputusbrfid(ProcessPlugin):
         #      ###### PRINT FORMAL = ( Time Stamp_INT , 0 , Time Stamp_DEC , 0 ,
         #      ######   type , code ( key pressed ) , value (press/release) )
 
+    def setup_inline(self):
+        self.open_device()
+
+    def teardown_inline(self):
+        self.get_device().close()
+
+    def get_inline_callbacks(self):
+        return {self.get_device(): self.read_events}
+
     def get_device(self):
         return self.__device
 
+    def open_device(self):
+        """(Re-)open the device, e.g., after it has been replugged."""
+        # import here so the main process does not need to load evdev
+        from evdev import InputDevice
+        if self.__device is not None:
+            self.__device.close()
+        logger.debug('opening {}'.format(self.__device_path))
+        self.__device = InputDevice(self.__device_path)
+
+    def grab_device(self, grab=True):
+        """Grab the device so no one else receives its input.
+
+        Keyword arguments:
+        grab -- grab (True) or release (False) the device [boolean]
+        """
+        if grab:
+            self.get_device().grab()
+        else:
+            self.get_device().ungrab()
+
+    def is_paused(self):
+        return self.__paused
+
+    def set_paused(self, paused=True):
+        """Read but discard cards while paused.
+
+        Keyword arguments:
+        paused -- pause (True) or resume (False) [boolean]
+        """
+        logger.debug('{} input'.format('pausing' if paused else 'resuming'))
+        self.__paused = paused
+
     def get_key(self, code):
         return self.__keys[code]
 
-    def read_card(self):
-        string = ''
-        key = ''
-        while key != 'KEY_ENTER' and not self.get_interrupt_signal():
-            select([self.get_device()], [], [])
-            for event in self.get_device().read():
-                if event.type == 1 and event.value == 1:
-                    string += self.get_key(event.code)
-                    key = ecodes.KEY[event.code]
-        return string[:-1]
+    def read_events(self):
+        """Read the pending key presses and send each complete card id.
+
+        The reader "types" the id of the card followed by KEY_ENTER. Must only
+        be called when the device is ready as it does not block.
+        """
+        from evdev import ecodes
+        for event in self.get_device().read():
+            if event.type != 1 or event.value != 1:
+                continue
+            if ecodes.KEY[event.code] != 'KEY_ENTER':
+                self.__string += self.get_key(event.code)
+                continue
+            card_id = self.__string.strip()
+            self.__string = ''
+            if card_id != '' and not self.is_paused():
+                self.queue_put(card_id)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger('boxcontroller.plugin.' + __name__)
+
+class LibraryIndex():
+    """Cache the tracks in folder keys.
+
+    Listing a folder (`mpc listall KEY`) makes MPD walk its database which is
+    slow for large libraries on SD cards. The tracks are listed once per key
+    and kept until MPD reports an update of its database
+    (`mpc idleloop database`). The listing holds exactly the tracks
+    `mpc add KEY` queues, in the same order.
+
+    Nothing is cached while MPD's database cannot be watched, as updates
+    would go unnoticed.
+    """
+
+    # seconds to wait before trying to watch the database again
+    retry_interval = 30
+
+    def __init__(self, mpc, create_task):
+        """Initialise variables.
+
+        Positional arguments:
+        mpc -- coroutine function calling mpc and returning its output
+            [function]
+        create_task -- function running a coroutine in the main loop
+            [function]
+        """
+        self.__mpc = mpc
+        self.__create_task = create_task
+        self.__tracks = {}
+        self.__lock = threading.Lock()
+        self.__watcher = None
+        self.__last_attempt = None
+        self.__stopped = False
+
+    async def get_tracks(self, key):
+        """Return the tracks in folder key and its subfolders in MPD's order.
+
+        Positional arguments:
+        key -- the folder [string]
+
+        Returns:
+        paths [list] or None if MPD could not be asked
+        """
+        self.watch()
+        with self.__lock:
+            if key in self.__tracks:
+                logger.debug('tracks for "{}" cached'.format(key))
+                return self.__tracks[key]
+            cache = self.is_watching()
+        raw = await self.__mpc('listall', key)
+        if raw is None:
+            return None
+        tracks = raw.strip().split('\n') if raw.strip() != '' else []
+        if cache:
+            with self.__lock:
+                # the watcher might have invalidated the cache in the meantime
+                if self.is_watching():
+                    self.__tracks[key] = tracks
+        return tracks
+
+    def invalidate(self):
+        """Forget all tracks."""
+        with self.__lock:
+            if len(self.__tracks) > 0:
+                logger.debug('invalidating library index')
+            self.__tracks = {}
+
+    def is_watching(self):
+        """Return True if database updates will be noticed."""
+        return self.__watcher is not None
+
+    def watch(self):
+        """Start watching MPD's database if not yet watching."""
+        with self.__lock:
+            if self.__stopped or self.is_watching():
+                return
+            if self.__last_attempt is not None and \
+                    time.monotonic() - self.__last_attempt < \
+                    self.retry_interval:
+                return
+            self.__last_attempt = time.monotonic()
+        self.__create_task(self.__watch())
+
+    def stop(self):
+        """Stop watching MPD's database."""
+        with self.__lock:
+            self.__stopped = True
+            watcher = self.__watcher
+        if watcher is not None and watcher.returncode is None:
+            watcher.terminate()
+
+    async def __watch(self):
+        try:
+            watcher = await asyncio.create_subprocess_exec(
+                    'mpc', 'idleloop', 'database',
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except OSError as error:
+            logger.error('could not watch database: {}'.format(error))
+            return
+        with self.__lock:
+            if self.__stopped:
+                watcher.terminate()
+            self.__watcher = watcher
+        while True:
+            line = await watcher.stdout.readline()
+            if line == b'':
+                break
+            if line.strip() == b'database':
+                self.invalidate()
+        await watcher.wait()
+        with self.__lock:
+            if not self.__stopped:
+                logger.info('stopped watching database ({})'.format(
+                    watcher.returncode))
+            self.__watcher = None
+            self.__tracks = {}
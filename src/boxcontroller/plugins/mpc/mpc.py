@@ -1,22 +1,70 @@
 #!/usr/bin/env python3
 
+import asyncio
 import subprocess
-import threading
 import time
 import logging
-import sys
 import re
 #import hashlib
 
+from boxcontroller import subprocesses
 from boxcontroller.listenerplugin import ListenerPlugin
+from . import libraryindex
+from . import mpdclient
+from . import partitions
 from . import statusmap
 
 logger = logging.getLogger('boxcontroller.plugin.' + __name__)
 
+def parse_time(string):
+    """Return the seconds of a time as printed by mpc ("[[H:]M]:SS").
+
+    Positional arguments:
+    string -- the time [string]
+    """
+    seconds = 0
+    for part in string.split(':'):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+def format_time(seconds):
+    """Return seconds formatted like mpc does ("[H:]M:SS").
+
+    Positional arguments:
+    seconds -- the seconds [int|float]
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours > 0:
+        return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+    return '{}:{:02d}'.format(minutes, seconds)
+
 class Mpc(ListenerPlugin):
 
+    # marks itself as busy while initialising which Shutdowntimer should know
+    dependencies = ['Shutdowntimer']
+    config_section = 'MPC'
+    config_schema = {
+            'volume_step': ('int', 5),
+            'path_status': ('str', 'mpd_status'),
+            'interval_poll': ('int', 5),
+            'interval_checkpoint': ('int', 60),
+            'partitions': ('int', 0),
+            'mpd_host': ('str', 'localhost'),
+            'mpd_port': ('int', 6600),
+            }
+
     def on_init(self):
         self.__statusmap = statusmap.StatusMap(self.get_config())
+        self.__library_index = libraryindex.LibraryIndex(self.mpc,
+                self.create_task)
+        self.__partition_pool = None
+        self.__mpd_client = None
+        self.__plays = self.register_counter('plays_total',
+                'Keys played, their queue loaded or held by a partition',
+                ['queue'])
+        if self.get_settings().partitions > 0:
+            self.setup_partitions()
         # register only mpd_play initially so we do not block the other commands
         # the other listeners (toggle, next, ...) will be registered by
         # Mpc.play().
@@ -29,41 +77,92 @@ class Mpc(ListenerPlugin):
         # this plugin may inhibit shutdown etc. if it marks itself as busy
         self.register_as_busy_bee()
 
-        # a lock to prevent the main thread and the watching thread to update
-        # the status simultaneously
-        self.lock = threading.Lock()
-        self.stop_event = threading.Event()
-        # a chronicler to watch and record MPD's status
-        interval = self.get_config().get('MPC', 'polling_interval', default=5,
-                variable_type='int')
-        self.chronicler = threading.Thread(target=self.watch_status,
-                args=(self.stop_event,interval,))
-        self.chronicler.start()
-
+        # a lock to prevent the status from being updated simultaneously,
+        # see get_lock()
+        self.__lock = None
+        self.__last_status_update = None
+        # (key, status, time.monotonic()) of the last status queried
+        self.__anchor = None
+        # (key, status) last written to disk and when
+        self.__persisted = None
+        self.__last_write = None
+        self.start_chronicler()
+        # on_init is not called from the main loop, ask MPD there
+        self.create_task(self.resume())
+
+    async def resume(self):
+        """Seize control if MPD is already playing the current key."""
         logger.debug('checking if mpd is already playing')
-        self.__last_status_update = 0
-        if not self.check_status():
+        if not await self.check_status():
             return
         # we know what's on the list
-        status = self.query_mpd_status()
-        if status['status'] == 'playing':
+        status = await self.query_mpd_status()
+        if status.get('status') == 'playing':
             # and it's playing
             logger.debug('MPD\'s already a\'playing')
             # so seize control over the buttons
             self.seize_control()
             # and store the status
-            self.update_status()
+            await self.update_status()
             # be busy
             self.mark_as_busy(True)
 
-    def on_terminate(self):
-        """Send stop signal to thread watching MPD and wait for it to finish."""
-        self.stop_event.set()
-        self.chronicler.join()
+    def start_chronicler(self):
+        """Start a chronicler timer to watch and record MPD's status."""
+        self.chronicler = self.call_every(self.get_settings().interval_poll,
+                lambda: self.create_task(self.update_status()))
+
+    async def on_terminate(self):
+        """Stop watching MPD and save the current position."""
+        self.chronicler.cancel()
+        try:
+            # save where MPD really is, not where it might be by now
+            await self.update_status(force=True)
+        finally:
+            # also if MPD does not answer before the tasks are cancelled
+            self.write_checkpoint(extrapolate=False)
+            self.get_library_index().stop()
+            if self.__mpd_client is not None:
+                self.__mpd_client.close()
+
+    def on_config_changed(self, changes):
+        if 'interval_poll' in changes.get('MPC', {}):
+            # restart the chronicler with the new interval
+            self.chronicler.cancel()
+            self.start_chronicler()
 
     def get_statusmap(self):
         return self.__statusmap
 
+    def get_library_index(self):
+        return self.__library_index
+
+    def get_lock(self):
+        """Return the lock preventing the status from being updated
+        simultaneously."""
+        if self.__lock is None:
+            # created on the main loop which it is bound to in Python < 3.10
+            self.__lock = asyncio.Lock()
+        return self.__lock
+
+    def get_partition_pool(self):
+        """Return the PartitionPool or None if partitions are not used."""
+        return self.__partition_pool
+
+    def setup_partitions(self):
+        """Keep recently used keys ready in MPD partitions."""
+        settings = self.get_settings()
+        client = mpdclient.MPDClient(settings.mpd_host, settings.mpd_port)
+        pool = partitions.PartitionPool(client, settings.partitions)
+        try:
+            pool.setup()
+        except mpdclient.MPDError as error:
+            logger.error('cannot use partitions: {}'.format(error))
+            client.close()
+            return
+        self.__mpd_client = client
+        self.__partition_pool = pool
+
     def get_status(self, key, parameter = None):
         """Return the status for key.
 
@@ -109,41 +208,45 @@ class Mpc(ListenerPlugin):
             ('' if playlist else 'not ')))
         return playlist
 
-    def mpc(self, *args, **kwargs):
+    async def mpc(self, *args, **kwargs):
         """Call mpc as a subprocess and return its output.
 
         Positional arguments:
         *args -- one string for each parameter part passed to mpc [string]
-        **kwargs -- passed as arguments to subprocess.run()
+        **kwargs -- passed to subprocesses.runner.run(), e.g., input or
+            timeout
         """
         call = ['mpc']
 
+        pool = self.get_partition_pool()
+        if pool is not None and pool.get_active() != pool.default:
+            call.append('--partition={}'.format(pool.get_active()))
+
         if len(args) > 0:
             call += args
 
         logger.debug('calling mpc with: {}'.format(','.join(
             [item for item in call])))
 
-        if sys.version_info[1] >= 7:
-            # capture output is new and in this case required with python >= 3.7
-            result = subprocess.run(call, capture_output=True,
-                    encoding="utf-8", **kwargs)
-        else:
-            result = subprocess.run(call, encoding="utf-8", **kwargs,
-                    stdout=subprocess.PIPE)
+        try:
+            result = await subprocesses.runner.run(*call, **kwargs)
+        except (subprocess.TimeoutExpired, OSError) as error:
+            logger.error('error calling mpc: {}'.format(error))
+            return None
 
         raw = result.stdout
         if result.returncode != 0 or raw[:9] == 'mpd error':
             # error
-            logger.error('error calling mpc: "{}"'.format(raw.strip()))
+            logger.error('error calling mpc: "{}"'.format(
+                (raw + result.stderr).strip()))
             return None
         return raw
 
-    def query_mpd_status(self):
+    async def query_mpd_status(self):
         """Query the status (filename, position, name, volume, status)."""
         logger.debug('querying mpd status')
         # get the status
-        raw = self.mpc('status', '-f', '%file%@@%position%@@%name%')[:-1]
+        raw = await self.mpc('status', '-f', '%file%@@%position%@@%name%')
 
         status = {}
 
@@ -153,7 +256,7 @@ class Mpc(ListenerPlugin):
             return status
 
         # remove the last character as it is a "\n" and split the lines
-        raw = raw.split('\n')
+        raw = raw[:-1].split('\n')
 
         if len(raw) == 1:
             # not playing
@@ -188,7 +291,7 @@ class Mpc(ListenerPlugin):
             ['"{}": "{}"'.format(kw,v) for kw, v in status.items()])))
         return status
 
-    def apply_mpd_status(self, key, status):
+    async def apply_mpd_status(self, key, status):
         """Tries to set mpd to the same status as saved in the statusmap.
 
         Positional arguments:
@@ -206,15 +309,15 @@ class Mpc(ListenerPlugin):
             ['"{}": "{}"'.format(kw,v) for kw, v in status.items()])))
 
         # clear playlist
-        self.mpc('clear')
+        await self.mpc('clear')
 
         # load files
         if self.key_marks_playlist(key):
             logger.debug('loading playlist')
-            result = self.mpc('load', key[:-4])
+            result = await self.mpc('load', key[:-4])
         else:
             logger.debug('loading folder')
-            result = self.mpc('add', key)
+            result = await self.mpc('add', key)
 
         if result is None:
             # some error occured during loading
@@ -227,26 +330,26 @@ class Mpc(ListenerPlugin):
                 # those are used to load a queue or play which needs to be done
                 # beforehand and afterwards respectively
                 continue
-            result = self.mpc(keyword, state)
+            result = await self.mpc(keyword, state)
             if result is None:
                 logger.error('error setting "{}" to "{}"'.format(keyword, state))
 
         # jump to position playing
         if 'position' in status:
             logger.debug('jumping to position in playlist')
-            result = self.mpc('play', status['position'])
+            result = await self.mpc('play', status['position'])
             if result is None:
                 logger.debug('could not jump to position playlist')
-            self.mpc('toggle')
+            await self.mpc('toggle')
 
         if 'time' in status:
             logger.debug('seeking position in track')
-            result = self.mpc('seek', status['time'])
+            result = await self.mpc('seek', status['time'])
             if result is None:
                 logger.debug('could not jump to position in track')
         return True
 
-    def check_mpd_queue_is_current_list(self):
+    async def check_mpd_queue_is_current_list(self):
         """Check if mpd's queue is the list we expect to be looking at."""
         logger.debug('comparing playlists')
 
@@ -257,16 +360,25 @@ class Mpc(ListenerPlugin):
 
         if self.key_marks_playlist(current_key):
             # get the queue
-            queue = self.mpc('playlist').strip()
+            queue = await self.mpc('playlist')
             # get the contents of the playlist
-            assumed_list = self.mpc('playlist',
-                    current_key[:-4]).strip()
+            assumed_list = await self.mpc('playlist', current_key[:-4])
+            if queue is None or assumed_list is None:
+                logger.debug('could not get the playlists')
+                return False
+            assumed_list = assumed_list.strip()
         else:
             # get the queue but show filenames
-            queue = self.mpc('playlist', '-f', '%file%').strip()
-            # find files in the specified folder
-            assumed_list = self.mpc(
-                    'search', 'filename', current_key).strip()
+            queue = await self.mpc('playlist', '-f', '%file%')
+            if queue is None:
+                logger.debug('could not get the queue')
+                return False
+            # the files `mpc add KEY` queued
+            tracks = await self.get_library_index().get_tracks(current_key)
+            if tracks is None:
+                return False
+            assumed_list = '\n'.join(tracks)
+        queue = queue.strip()
 
         #print('Queue:')
         #print(queue)
@@ -285,7 +397,7 @@ class Mpc(ListenerPlugin):
 
         return queue == assumed_list
 
-    def check_status(self):
+    async def check_status(self):
         logger.debug('checking status')
         key = self.get_current_key()
         if key is None:
@@ -299,7 +411,7 @@ class Mpc(ListenerPlugin):
             return False
         logger.debug('current key: "{}"'.format(key))
 
-        if not self.check_mpd_queue_is_current_list():
+        if not await self.check_mpd_queue_is_current_list():
             # the current playlist differs from what we would expect by looking
             # at the statusmap
             # maybe someone has changed it from the outside (e.g., another mpd
@@ -311,51 +423,128 @@ class Mpc(ListenerPlugin):
         logger.debug('loaded playlist is expected playlist')
         return True
 
-    def update_status(self):
-        """Update status in statusmap."""
-        self.lock.acquire()
-        logger.debug('updating status')
+    async def update_status(self, force=False):
+        """Update status in statusmap.
 
-        if time.time() - self.__last_status_update <= 5:
-            logger.debug('too early')
-            self.lock.release()
-            return
+        Keyword arguments:
+        force -- update even if the last update was less than 5 s ago, e.g.,
+            after a command [boolean]
+        """
+        async with self.get_lock():
+            logger.debug('updating status')
+
+            if not force and self.__last_status_update is not None and \
+                    time.monotonic() - self.__last_status_update <= 5:
+                logger.debug('too early')
+                return
+
+            # try again in 5 s whatever happens (e.g., MPD is down)
+            self.__last_status_update = time.monotonic()
+            if not await self.check_status():
+                return
+            status = await self.query_mpd_status()
+            if not 'status' in status:
+                logger.debug('cancel status update, mpd error')
+                return
+
+            #if status['status'] == 'stopped':
+            #    # cannot store anything meaningful
+            #    logger.debug('cancel status update, not playing')
+            #    return
+            if status['status'] == 'playing':
+                self.mark_as_busy(True)
+            else:
+                self.mark_as_busy(False)
+
+            # persist the status
+            key = self.get_current_key()
+            if key is None:
+                logger.debug('cancel status update, no current key')
+                return
+            self.checkpoint(key, status)
+            self.__last_status_update = time.monotonic()
+
+    def checkpoint(self, key, status):
+        """Remember the status and write it to disk if necessary.
+
+        The status is written immediately if something other than the time
+        changed (track, playing / paused, playback options, key). While only
+        the time moves it is written every interval_checkpoint seconds.
+        Identical states are never written twice.
 
-        if not self.check_status():
-            self.__last_status_update = time.time()
-            self.lock.release()
+        Positional arguments:
+        key -- the key [string]
+        status -- as returned by query_mpd_status() [dict]
+        """
+        if not 'time' in status:
+            # stopped, keep the last position MPD reported as it is unknown
+            # when it stopped since
+            self.write_checkpoint(extrapolate=False)
+            self.__anchor = None
             return
-        status = self.query_mpd_status()
+        now = time.monotonic()
+        self.__anchor = (key, dict(status), now)
 
-        #if status['status'] == 'stopped':
-        #    # cannot store anything meaningful
-        #    logger.debug('cancel status update, not playing')
-        #    return
-        if status['status'] == 'playing':
-            self.mark_as_busy(True)
+        persisted = self.__persisted
+        if persisted == (key, status):
+            logger.debug('status unchanged')
+            return
+        if persisted is None or persisted[0] != key or \
+                self._without_time(persisted[1]) != self._without_time(status):
+            logger.debug('status changed')
+            self._persist(key, status)
+        elif now - self.__last_write >= \
+                self.get_settings().interval_checkpoint:
+            self._persist(key, status)
         else:
-            self.mark_as_busy(False)
+            self.set_status(key, soft=True, **status)
 
-        # persist the status
-        key = self.get_current_key()
-        if key is None:
-            logger.debug('cancel status update, no current key')
-            self.lock.release()
-            self.__last_status_update = time.time()
-            return
-        self.set_status(key, soft=False, **status)
-        self.__last_status_update = time.time()
-        self.lock.release()
+    def get_extrapolated_status(self):
+        """Return (key, status) with the time moved on while playing.
 
-    def watch_status(self, stop_event, interval):
-        """Poll MPD's status every INTERVAL seconds.
+        The time is extrapolated from the time MPD reported last and the
+        monotonic clock so MPD need not be queried.
 
-        Positional arguments:
-        stop_event -- stops the thread if set [threading.Event]
-        interval -- interval between polls in seconds [int]
+        Returns:
+        (key, status) or None if nothing is known
+        """
+        if self.__anchor is None:
+            return None
+        key, status, queried_at = self.__anchor
+        status = dict(status)
+        if status.get('status') == 'playing':
+            status['time'] = format_time(parse_time(status['time']) +
+                    time.monotonic() - queried_at)
+        return (key, status)
+
+    def write_checkpoint(self, extrapolate=True):
+        """Write the (extrapolated) current status to disk if it changed.
+
+        Used before switching keys, on stop and on terminate / shutdown.
+
+        Keyword arguments:
+        extrapolate -- move the time on while playing, write the status
+            as MPD reported it last otherwise [boolean]
         """
-        while not stop_event.wait(interval):
-            self.update_status()
+        if extrapolate:
+            current = self.get_extrapolated_status()
+        elif self.__anchor is not None:
+            current = self.__anchor[:2]
+        else:
+            current = None
+        if current is None or current == self.__persisted:
+            return
+        logger.debug('writing checkpoint')
+        self._persist(*current)
+
+    def _persist(self, key, status):
+        self.set_status(key, soft=False, **status)
+        self.__persisted = (key, dict(status))
+        self.__last_write = time.monotonic()
+
+    def _without_time(self, status):
+        return {keyword: value for keyword, value in status.items()
+                if keyword != 'time'}
 
     def seize_control(self):
         """Seize control of control buttons' events."""
@@ -366,7 +555,7 @@ class Mpc(ListenerPlugin):
         self.register('previous', lambda: self.simple_command('prev'), True)
         #self.register('volume', self.volume)
 
-    def play(self, *args, **kwargs):
+    async def play(self, *args, **kwargs):
         """Play the contents of the playlist / folder defined by KEY.
 
         Keyword arguments:
@@ -377,11 +566,11 @@ class Mpc(ListenerPlugin):
         # seize control!
         self.seize_control()
 
-        status = self.query_mpd_status()
+        status = await self.query_mpd_status()
 
-        if not status['status'] == 'stopped':
+        if status.get('status', 'stopped') != 'stopped':
             # something is playing / paused
-            if self.check_status():
+            if await self.check_status():
                 # we know what's playing
                 if self.get_current_key == kwargs['key']:
                     # and it's the same as requested
@@ -389,43 +578,85 @@ class Mpc(ListenerPlugin):
                     logger.debug('already playing')
                     return
 
-        try:
-            if not self.apply_mpd_status(kwargs['key'],
-                    self.get_status(kwargs['key'])):
+        # save where the last key stopped
+        self.write_checkpoint()
+
+        if self.get_partition_pool() is not None:
+            if not await self.switch_partition(kwargs['key']):
                 return
-            result = self.mpc('play')
-            if result is None:
-                raise ChildProcessError
             self.mark_as_busy(True)
-        except (KeyError, ChildProcessError) as e:
-            self.debug('error loading status: {}'.format(','.join(
-                ['{},{}'.format(kw,v) for kw,v in kwargs.items()])))
-            self.communicate('Could not load playlist.')
-            return
+        else:
+            try:
+                if not await self.apply_mpd_status(kwargs['key'],
+                        self.get_status(kwargs['key'])):
+                    return
+                result = await self.mpc('play')
+                if result is None:
+                    raise ChildProcessError
+                self.__plays.inc(queue='loaded')
+                self.mark_as_busy(True)
+            except (KeyError, ChildProcessError) as e:
+                self.debug('error loading status: {}'.format(','.join(
+                    ['{},{}'.format(kw,v) for kw,v in kwargs.items()])))
+                self.communicate('Could not load playlist.')
+                return
         self.set_current_key(kwargs['key'])
-        self.update_status()
+        await self.update_status(force=True)
 
         # mpd is now playing the desired list
         # watch it and store it's progresse every X seconds
         #self.chronicler.start()
 
-    def simple_command(self, do):
+    async def switch_partition(self, key):
+        """Play key in its partition, load it into one if necessary.
+
+        Positional arguments:
+        key -- the key as used in EventMap and StatusMap [string]
+
+        Returns True / False on success / failure
+        """
+        pool = self.get_partition_pool()
+        playlist = self.key_marks_playlist(key)
+        status = {}
+        if pool.get_partition(key) is None:
+            # it needs to be loaded
+            status = self.get_status(key) or {}
+        try:
+            # talks to MPD over a blocking socket
+            held = await self.run_in_executor(pool.switch, key,
+                    playlist=playlist, options=status,
+                    position=int(status['position']) - 1
+                        if 'position' in status else None,
+                    elapsed=parse_time(status['time'])
+                        if 'time' in status else None)
+        except mpdclient.MPDError as error:
+            logger.error('could not play "{}" in a partition: {}'.format(key,
+                error))
+            return False
+        logger.debug('playing "{}" in partition "{}" ({})'.format(key,
+            pool.get_active(), 'held' if held else 'loaded'))
+        self.__plays.inc(queue='held' if held else 'loaded')
+        return True
+
+    async def simple_command(self, do):
         """Wrapper around the more simple functions (toggle, stop, etc.)."""
         logger.debug('simple command: {}'.format(do))
-        self.mpc(do)
-        self.update_status()
+        if do == 'stop':
+            # MPD forgets the position when stopped
+            await self.update_status(force=True)
+        await self.mpc(do)
+        await self.update_status(force=True)
 
-    def volume(self, direction=None, step=None):
+    async def volume(self, direction=None, step=None):
         if not direction in ['+', '-']:
             logger.error('no such direction "{}"'.format(direction))
             return
         if step is None:
-            step = self.get_config().get('MPC', 'volume_step', default="5",
-                    variable_type="str")
+            step = self.get_settings().volume_step
 
         logger.debug('changing volume: {}{}'.format(direction, step))
-        result = self.mpc('volume', '{}{}'.format(direction, step))
+        result = await self.mpc('volume', '{}{}'.format(direction, step))
         if result is None:
             logger.error('could not change volume')
-        if not self.check_status():
+        if not await self.check_status():
             return
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import logging
+import socket
+
+logger = logging.getLogger('boxcontroller.plugin.' + __name__)
+
+class MPDError(Exception):
+    """MPD answered with an error or could not be reached."""
+
+class MPDClient():
+    """A minimal client for MPD's text protocol.
+
+    Used for what mpc cannot do (well), e.g., sending several commands to a
+    partition at once.
+    """
+
+    def __init__(self, host='localhost', port=6600, timeout=5):
+        """Initialise variables.
+
+        Keyword arguments:
+        host -- host name or path to a unix socket [string]
+        port -- the port [int]
+        timeout -- seconds to wait for MPD [float]
+        """
+        self.__host = host
+        self.__port = port
+        self.__timeout = timeout
+        self.__socket = None
+        self.__file = None
+
+    def connect(self):
+        """Connect to MPD and read its greeting."""
+        if self.__host.startswith('/'):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            address = self.__host
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            address = (self.__host, self.__port)
+        sock.settimeout(self.__timeout)
+        try:
+            sock.connect(address)
+        except OSError as error:
+            sock.close()
+            raise MPDError('could not connect to {}: {}'.format(address,
+                error))
+        self.__socket = sock
+        self.__file = sock.makefile('r', encoding='utf-8', newline='\n')
+        greeting = self.__file.readline()
+        if not greeting.startswith('OK MPD '):
+            self.close()
+            raise MPDError('unexpected greeting: "{}"'.format(
+                greeting.strip()))
+        logger.debug('connected to MPD {}'.format(greeting[7:].strip()))
+
+    def close(self):
+        if self.__socket is None:
+            return
+        try:
+            self.__socket.sendall(b'close\n')
+        except OSError:
+            pass
+        self.__file.close()
+        self.__socket.close()
+        self.__socket = None
+        self.__file = None
+
+    def command(self, *args):
+        """Send a command and return MPD's answer.
+
+        Positional arguments:
+        * -- the command and its arguments [string]
+
+        Returns:
+        [(key, value)] [list]
+        """
+        return self.command_list([args])
+
+    def command_list(self, commands):
+        """Send commands at once, MPD stops at the first failing one.
+
+        Connects (again) if necessary. Note that a new connection starts in
+        the default partition.
+
+        Positional arguments:
+        commands -- [(command, argument, ...)] [list]
+
+        Returns:
+        [(key, value)] of all commands [list]
+        """
+        lines = [self.format_command(*command) for command in commands]
+        if len(lines) > 1:
+            lines = ['command_list_begin'] + lines + ['command_list_end']
+        request = ('\n'.join(lines) + '\n').encode('utf-8')
+        for attempt in range(2):
+            if self.__socket is None:
+                self.connect()
+            try:
+                self.__socket.sendall(request)
+                return self.__read_response()
+            except (OSError, EOFError) as error:
+                logger.debug('lost connection to MPD: {}'.format(error))
+                self.close()
+        raise MPDError('lost connection to MPD')
+
+    def format_command(self, command, *args):
+        """Return a command line with its arguments quoted."""
+        return ' '.join([command] + ['"{}"'.format(str(arg).replace(
+            '\\', '\\\\').replace('"', '\\"')) for arg in args])
+
+    def __read_response(self):
+        pairs = []
+        while True:
+            line = self.__file.readline()
+            if line == '':
+                raise EOFError('connection closed')
+            line = line.rstrip('\n')
+            if line == 'OK':
+                return pairs
+            if line.startswith('ACK '):
+                raise MPDError(line[4:])
+            key, _, value = line.partition(': ')
+            pairs.append((key, value))
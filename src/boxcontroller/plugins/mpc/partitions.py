@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import collections
+import logging
+
+logger = logging.getLogger('boxcontroller.plugin.' + __name__)
+
+class PartitionPool():
+    """Keep the queues of recently used keys ready in MPD partitions.
+
+    Each partition has its own queue and player but only the active one owns
+    the audio outputs. Switching to a key whose queue is held by a partition
+    just pauses the active partition and moves the outputs over, the queue
+    and the position of the paused key are kept for when it comes back.
+
+    Otherwise the least recently used partition is loaded with the key.
+
+    Requires MPD >= 0.22.
+    """
+
+    default = 'default'
+    prefix = 'boxcontroller'
+
+    def __init__(self, client, size):
+        """Initialise variables.
+
+        Positional arguments:
+        client -- connection to MPD [MPDClient]
+        size -- number of partitions besides the default one [int]
+        """
+        self.__client = client
+        self.__size = size
+        # partition -> key its queue holds, least recently used first
+        self.__keys = collections.OrderedDict()
+        self.__active = self.default
+        self.__outputs = []
+
+    def setup(self, current_key=None):
+        """Create the partitions and move all outputs to the default one.
+
+        Keyword arguments:
+        current_key -- the key in the default partition's queue [string]
+        """
+        names = [self.default] + ['{}{}'.format(self.prefix, i)
+                for i in range(self.__size)]
+        existing = self.__get_values(self.__client.command('listpartitions'),
+                'partition')
+        for name in names:
+            if not name in existing:
+                logger.debug('creating partition "{}"'.format(name))
+                self.__client.command('newpartition', name)
+
+        # outputs might still be elsewhere after a restart
+        outputs = []
+        for name in names:
+            for output in self.__get_values(self.__client.command_list(
+                    [('partition', name), ('outputs',)]), 'outputname'):
+                if not output in outputs:
+                    outputs.append(output)
+        self.__outputs = outputs
+        self.__client.command_list([('partition', self.default)] +
+                [('moveoutput', output) for output in outputs])
+
+        self.__keys.clear()
+        for name in names[1:]:
+            # the contents of the other partitions are unknown
+            self.__keys[name] = None
+        self.__keys[self.default] = current_key
+        self.__active = self.default
+        logger.debug('partitions: {}, outputs: {}'.format(','.join(names),
+            ','.join(outputs)))
+
+    def get_active(self):
+        """Return the name of the partition owning the outputs."""
+        return self.__active
+
+    def get_partition(self, key):
+        """Return the partition holding key or None."""
+        for partition, held in self.__keys.items():
+            if held == key:
+                return partition
+        return None
+
+    def forget(self, key):
+        """Do not reuse the queue held for key.
+
+        Positional arguments:
+        key -- the key [string]
+        """
+        partition = self.get_partition(key)
+        if partition is not None:
+            self.__keys[partition] = None
+
+    def switch(self, key, playlist=False, options=None, position=None,
+            elapsed=None):
+        """Play key, loading it first if no partition holds it.
+
+        Positional arguments:
+        key -- the key, i.e., a folder or a playlist [string]
+
+        Keyword arguments:
+        playlist -- key is a playlist [boolean]
+        options -- e.g., {'repeat': 'on'} [dict]
+        position -- where to start if loaded (0-based) [int]
+        elapsed -- where to start in the track if loaded in seconds [int]
+
+        Returns:
+        True if the key was held by a partition [boolean]
+
+        Raises MPDError.
+        """
+        partition = self.get_partition(key)
+        held = partition is not None
+        if held:
+            logger.debug('"{}" is held by partition "{}"'.format(key,
+                partition))
+        else:
+            partition = next(name for name in self.__keys
+                    if name != self.__active)
+            logger.debug('loading "{}" into partition "{}"'.format(key,
+                partition))
+            # do not trust the partition's queue if loading fails
+            self.__keys[partition] = None
+            self.__load(partition, key, playlist, options or {})
+            self.__keys[partition] = key
+
+        commands = [('partition', self.__active), ('pause', '1'),
+                ('partition', partition)]
+        commands += [('moveoutput', output) for output in self.__outputs]
+        if held or position is None:
+            commands.append(('play',))
+        else:
+            commands.append(('seek', position, elapsed or 0))
+        self.__client.command_list(commands)
+        self.__active = partition
+        self.__keys.move_to_end(partition)
+        return held
+
+    def __load(self, partition, key, playlist, options):
+        commands = [('partition', partition), ('clear',)]
+        if playlist:
+            # strip ".m3u"
+            commands.append(('load', key[:-4]))
+        else:
+            commands.append(('add', key))
+        for option in ['repeat', 'random', 'single', 'consume']:
+            if option in options:
+                # mpc prints on / off (or oneshot for single)
+                commands.append((option, {'on': '1', 'off': '0'}.get(
+                    options[option], options[option])))
+        self.__client.command_list(commands)
+
+    def __get_values(self, pairs, wanted):
+        return [value for key, value in pairs if key == wanted]
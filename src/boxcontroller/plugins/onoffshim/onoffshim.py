@@ -1,10 +1,9 @@
 #!/usr/bin/env python3
 
-from gpiodmonitor.gpiodmonitor import GPIODMonitor
 import time
-import gpiod
 import logging
 
+from boxcontroller import ipc
 from boxcontroller.processplugin import ProcessPlugin
 
 logger = logging.getLogger('boxcontroller.plugin.' + __name__)
@@ -39,15 +38,23 @@ class Onoffshim(ProcessPlugin):
                 ;;
     """
 
+    # GPIODMonitor.run() never returns, its thread only ends with the
+    # plugin's process
+    execution_modes = ['process']
+
+    config_section = 'OnOffShim'
+    config_schema = {
+            'chip': ('int', None),
+            'pin_shutdown': ('int', 4),
+            'pin_listen': ('int', 17),
+            }
+
     def __init__(self, *args, **kwargs):
         ProcessPlugin.__init__(self, *args, **kwargs)
-        self.__chip = kwargs['main'].get_config().get('OnOffShim',
-                'chip', default=None, variable_type='int')
+        self.__chip = self.get_settings().chip
         self.__pin = {}
-        self.__pin['shutdown'] = kwargs['main'].get_config().get('OnOffShim',
-                'pin_shutdown', default=4, variable_type='int')
-        self.__pin['listen'] = kwargs['main'].get_config().get('OnOffShim',
-                'pin_listen', default=17, variable_type='int')
+        self.__pin['shutdown'] = self.get_settings().pin_shutdown
+        self.__pin['listen'] = self.get_settings().pin_listen
         if self.__chip is None or len(self.__pin) < 2:
             logger.error('No chip or pins defined')
             return
@@ -60,12 +67,16 @@ class Onoffshim(ProcessPlugin):
 
     def on_pressed(self, pin, time):
         logger.debug('shutdown pin pressed'.format(pin))
-        self.queue_put('shutdown')
+        # do not wait behind other inputs
+        self.queue_put('shutdown', priority=ipc.PRIORITY_HIGH)
 
     def run(self):
+        # import here so the main process does not need to load gpiod
+        from gpiodmonitor.gpiodmonitor import GPIODMonitor
         monitor = GPIODMonitor(self.get_chip())
         monitor.register_long_press(self.get_pin('listen'),
             self.on_pressed,
             3)
         logger.debug('listening to shutdown pin')
-        monitor.run()
+        # GPIODMonitor runs its own loop which never returns
+        self.run_loop_in_thread(monitor.run)
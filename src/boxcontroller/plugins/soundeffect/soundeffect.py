@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
 
-import pkg_resources
-import subprocess
-import sys
 from pathlib import Path
 import logging
+import subprocess
 
+from boxcontroller import aio
 from boxcontroller.listenerplugin import ListenerPlugin
 
 logger = logging.getLogger('boxcontroller.plugin.' + __name__)
@@ -16,30 +15,39 @@ class Soundeffect(ListenerPlugin):
     Initialises on on_plugins_loaded().
     """
 
+    config_section = 'Soundeffect'
+    config_schema = {
+            'path': ('path', None),
+            'ready': ('str', None),
+            'shutdown': ('str', None),
+            'error': ('str', None),
+            'feedback': ('str', None),
+            }
+
     def on_init(self):
-        # subprocess for playing sounds
+        # sounds are played in the background (play_sound is a coroutine)
         self.register('finished_loading', lambda: self.play_sound('ready'))
         self.register('before_shutdown', lambda: self.play_sound('shutdown'))
         self.register('error', lambda: self.play_sound('error'))
         self.register('feedback', lambda: self.play_sound('feedback'))
-        self._path_sounds = Path(self.get_config().get('Soundeffect',
-                'path',
-                default=pkg_resources.resource_filename(__name__, 'sounds')))
+        self.on_config_changed({})
 
-    def play_sound(self, sound):
-        sound = self.get_config().get('Soundeffect', sound, default=None)
+    def on_config_changed(self, changes):
+        self._path_sounds = self.get_settings().path
+        if self._path_sounds is None:
+            self._path_sounds = Path(__file__).parent / 'sounds'
+
+    async def play_sound(self, name):
+        sound = self.get_settings().get(name)
         if sound is None:
-            logger.error('no such sound configured: "{}"'.format(str(sound)))
+            logger.error('no such sound configured: "{}"'.format(name))
+            return
+        try:
+            result = await aio.run("/usr/bin/aplay", "-N",
+                    self._path_sounds / sound)
+        except (subprocess.TimeoutExpired, OSError) as error:
+            logger.error('could not run aplay: {}'.format(error))
             return
-        call = ["/usr/bin/aplay", "-N", self._path_sounds / sound]
-        if sys.version_info[1] >= 7:
-            # capture output is new and in this case required with python >= 3.7
-            result = subprocess.run(call, capture_output=True,
-                    encoding="utf-8")
-        else:
-            result = subprocess.run(call, encoding="utf-8",
-                    stdout=subprocess.PIPE)
-
-        raw = result.stdout
+
         if result.returncode != 0:
             logger.error('could not play sound "{}"'.format(sound))
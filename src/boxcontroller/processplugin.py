@@ -2,33 +2,214 @@
 
 import logging
 import multiprocessing
+import multiprocessing.connection
+import os
 import signal
+import threading
 
 from . import plugin
+from . import ipc
+from . import sampler
+from .log import log
 
 logger = logging.getLogger(__name__)
 
+START_METHODS = ['fork', 'forkserver', 'spawn']
+
+# how a ProcessPlugin is executed:
+# process -- in its own process
+# thread -- in a thread of the main process
+# inline -- its file descriptors are watched by the main loop which calls the
+#   plugin back when they are ready
+EXECUTION_MODES = ['process', 'thread', 'inline']
+
+def set_start_method(method, preload=None):
+    """Set how the processes of ProcessPlugins are started.
+
+    Must be called before any process, queue or lock is created, i.e., before
+    configuring logging.
+
+    "fork" copies the whole main process into each child (fast but children
+    inherit all loaded plugins and forking with threads running is unsafe),
+    "forkserver" forks the children from a lean server process which has only
+    imported the modules in preload, "spawn" starts a fresh interpreter for
+    each child.
+
+    Positional arguments:
+    method -- "fork", "forkserver" or "spawn" [string]
+
+    Keyword arguments:
+    preload -- modules to import into the forkserver [list]
+    """
+    if not method in START_METHODS or \
+            not method in multiprocessing.get_all_start_methods():
+        logger.error('unsupported start method "{}"'.format(method))
+        return
+    multiprocessing.set_start_method(method, force=True)
+    if method == 'forkserver' and preload is not None:
+        multiprocessing.set_forkserver_preload(list(preload))
+
 class ProcessPlugin(plugin.Plugin, multiprocessing.Process):
-    """Base class for plugins using their own process.
+    """Base class for plugins using their own process, thread or callbacks.
+
+    The execution mode is read from "execution_mode" in the plugin's config
+    section or [Plugins], see EXECUTION_MODES.
+
+    "process" and "thread" call run() which should return once
+    get_interrupt_signal() is set and wait with wait() to receive commands.
+    "inline" needs the plugin to implement get_inline_callbacks().
 
     Modified after: https://pymotw.com/3/multiprocessing/communication.html
     """
 
+    # the execution modes the plugin supports
+    execution_modes = ['process', 'thread']
+
     def __init__(self, *args, **kwargs):
-        """Register with main process to be started and store queues.
+        """Register with main process to be started and store connections.
 
         If you need to overwrite this function don't forget to use:
         ProcessPlugin.__init__(self, *args, **kwargs)
         """
         plugin.Plugin.__init__(self, *args, **kwargs)
         multiprocessing.Process.__init__(self)
-        kwargs['main'].register_process(self.get_name(), self)
-        self.__to_plugins = kwargs['to_plugins']
-        self.__from_plugins = kwargs['from_plugins']
+        self.__execution_mode = self.read_execution_mode(
+                kwargs['main'].get_config())
+        self.__thread = None
+        self.__inline = False
+        connection, source, commands = kwargs['main'].register_process(
+                self.get_name(), self)
+        self.__sender = ipc.Sender(connection, source)
+        self.__commands = commands
+        self.__command_callbacks = {}
         self.__interrupt_signal = False
+        # "spawn" and "forkserver" pickle the plugin so only use picklable
+        # callbacks (functions, bound methods, functools.partial)
+        self.register_command('stop', self.set_interrupt_signal)
+        self.register_command('profile', self.set_profiling)
+        self.__log_config = log.get_child_config()
         #signal.signal(signal.SIGINT, self.handle_signal)
         ##signal.signal(signal.SIGTERM, self.handle_signal)
 
+    def __setstate__(self, state):
+        """Restore the plugin in a child not forked from the main process.
+
+        Logging and signal handling need to be configured again in that
+        case.
+        """
+        self.__dict__.update(state)
+        log.configure_child(self.__log_config)
+        # like forked children, leave handling SIGINT to the main process:
+        # Ctrl+C reaches the whole process group, BoxController then stops
+        # the plugins in order
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def read_execution_mode(self, config):
+        """Return the configured execution mode if it is supported.
+
+        Positional arguments:
+        config -- the config to read from [Config]
+        """
+        mode = config.get('Plugins', 'execution_mode', default='process')
+        if self.config_section is not None:
+            mode = config.get(self.config_section, 'execution_mode',
+                    default=mode)
+        if not mode in EXECUTION_MODES or not mode in self.execution_modes:
+            logger.error('{} does not support execution mode "{}"'.format(
+                self.get_name(), mode))
+            return 'process'
+        return mode
+
+    def get_execution_mode(self):
+        return self.__execution_mode
+
+    def start_execution(self):
+        """Start the plugin according to its execution mode."""
+        mode = self.get_execution_mode()
+        if mode == 'process':
+            self.start()
+        elif mode == 'thread':
+            self.__thread = threading.Thread(target=self.run,
+                    name=self.get_name(), daemon=True)
+            self.__thread.start()
+        else:
+            self.setup_inline()
+            self.__inline = True
+
+    def is_started(self):
+        """Return True if start_execution() has been called."""
+        return self.pid is not None or self.__thread is not None or \
+                self.__inline
+
+    def is_executing(self):
+        """Return True if the plugin's process / thread is still running."""
+        mode = self.get_execution_mode()
+        if mode == 'process':
+            return self.pid is not None and self.is_alive()
+        elif mode == 'thread':
+            return self.__thread is not None and self.__thread.is_alive()
+        return self.__inline
+
+    def stop_execution(self, timeout=1):
+        """Stop the plugin according to its execution mode.
+
+        Processes and threads need to return from run() once
+        get_interrupt_signal() is set, BoxController sends "stop" beforehand.
+        Threads cannot be killed. Processes are only terminated if they did
+        not return in time as terminating a process while it writes to the
+        shared log queue may corrupt the queue.
+
+        Keyword arguments:
+        timeout -- seconds to wait for a process / thread to return [float]
+        """
+        mode = self.get_execution_mode()
+        if mode == 'process':
+            if self.pid is not None:
+                self.join(timeout)
+                if self.is_alive():
+                    logger.debug('terminating process of {}'.format(
+                        self.get_name()))
+                    self.terminate()
+                    self.join()
+        elif mode == 'thread':
+            self.set_interrupt_signal()
+            if self.__thread is not None:
+                self.__thread.join(timeout)
+                if self.__thread.is_alive():
+                    logger.error('thread of {} did not stop'.format(
+                        self.get_name()))
+        elif self.__inline:
+            self.__inline = False
+            self.set_interrupt_signal()
+            self.teardown_inline()
+
+    def setup_inline(self):
+        """Prepare for "inline" execution, e.g., open devices."""
+        pass
+
+    def teardown_inline(self):
+        """Clean up after "inline" execution, e.g., close devices."""
+        pass
+
+    def get_inline_callbacks(self):
+        """Return the objects to watch and their callbacks.
+
+        Called by the main loop before each wait so the objects may change.
+        The callbacks are called in the main thread when the object is ready
+        for reading and must not block.
+
+        Returns:
+        {file descriptor or object with fileno(): callback} [dict]
+        """
+        raise NotImplementedError('Overwrite this method to support the ' +
+                'execution mode "inline".')
+
+    def get_selectables(self):
+        """Return get_inline_callbacks() and the command connection."""
+        selectables = {self.__commands: self.handle_commands}
+        selectables.update(self.get_inline_callbacks())
+        return selectables
+
     def handle_signal(self, signum, frame):
         #logger.debug('{} recieved interrupt signal'.format(self.get_name()))
         self.set_interrupt_signal()
@@ -39,17 +220,143 @@ class ProcessPlugin(plugin.Plugin, multiprocessing.Process):
     def get_interrupt_signal(self):
         return self.__interrupt_signal
 
-    def queue_get(self):
-        """Get messages off the queue."""
-        return self.__to_plugins.get()
+    def set_profiling(self, enable, path=None,
+            interval=sampler.DEFAULT_INTERVAL):
+        """Start or stop sampling the process, see sampler.Sampler.
 
-    def queue_put(self, input_string):
-        """Put string messages onto the queue.
+        BoxController sends "profile" to plugins running in their own
+        process, the others are sampled with the main process.
+
+        Positional arguments:
+        enable -- start (True) or stop and write the samples (False) [bool]
+
+        Keyword arguments:
+        path -- the file to write the samples to [string]
+        interval -- seconds between two samples [float]
+        """
+        if enable:
+            sampler.sampler.start(path, interval)
+        else:
+            sampler.sampler.stop()
+        if threading.current_thread() is threading.main_thread():
+            # write the samples before dying if terminated, SIGINT is
+            # ignored (BoxController stops profiling before the plugins)
+            signal.signal(signal.SIGTERM, self.stop_profiling_and_exit if
+                    enable else signal.SIG_DFL)
+
+    def stop_profiling_and_exit(self, signum, frame):
+        """Write the samples and die from the signal as usual."""
+        sampler.sampler.stop()
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+    def get_command_connection(self):
+        """Return the connection commands from BoxController arrive on."""
+        return self.__commands
+
+    def register_command(self, command, callback):
+        """Call callback when BoxController sends command.
+
+        Positional arguments:
+        command -- the command, e.g., "pause" [string]
+        callback -- the function / lambda to call with the command's
+            parameters [function]
+        """
+        self.__command_callbacks[command] = callback
+
+    def handle_commands(self):
+        """Read the pending commands and call their callbacks."""
+        try:
+            messages = ipc.receive(self.__commands)
+        except (EOFError, OSError):
+            logger.error('{} lost connection to BoxController'.format(
+                self.get_name()))
+            self.set_interrupt_signal()
+            return
+        for message in messages:
+            command, args, kwargs = ipc.decode_command(message.payload)
+            callback = self.__command_callbacks.get(command)
+            if callback is None:
+                logger.error('{} got unknown command "{}"'.format(
+                    self.get_name(), command))
+                continue
+            logger.debug('{} executing command "{}"'.format(self.get_name(),
+                command))
+            callback(*args, **kwargs)
+
+    def wait(self, objects, timeout=None):
+        """Wait until one of objects is ready and handle commands meanwhile.
+
+        Commands are handled as soon as they arrive. Returns the objects that
+        are ready (may be empty after a command, on timeout or if the
+        interrupt signal has been set).
+
+        Positional arguments:
+        objects -- file descriptors or objects with fileno(), e.g., an
+            evdev.InputDevice [list]
+
+        Keyword arguments:
+        timeout -- seconds to wait at most, None to wait forever [float]
+        """
+        ready = multiprocessing.connection.wait(
+                [self.__commands] + list(objects), timeout)
+        if self.__commands in ready:
+            ready.remove(self.__commands)
+            self.handle_commands()
+        return ready
+
+    def start_command_listener(self):
+        """Handle commands in a separate thread.
+
+        Use this if the plugin's own loop cannot wait on the command
+        connection. The callbacks will then be called from that thread.
+        """
+        def listen():
+            while not self.get_interrupt_signal():
+                self.wait([])
+        thread = threading.Thread(target=listen, daemon=True)
+        thread.start()
+        return thread
+
+    def run_loop_in_thread(self, loop):
+        """Run a loop that never returns in a thread, return on "stop".
+
+        Use this in run() for loops that cannot wait on the command
+        connection and cannot be interrupted (e.g., GPIODMonitor.run()).
+        Commands are handled meanwhile, the loop's thread ends with the
+        process so it stops as soon as "stop" arrives.
+
+        Positional arguments:
+        loop -- the loop [function]
+        """
+        thread = threading.Thread(target=loop, name='{} loop'.format(
+            self.get_name()), daemon=True)
+        thread.start()
+        # return as well if the loop fails
+        while not self.get_interrupt_signal() and thread.is_alive():
+            self.wait([], timeout=1)
+
+    def queue_put(self, input_string, priority=ipc.PRIORITY_NONE):
+        """Send a string to BoxController as input.
 
         Positional arguments:
         input_string -- the string that will become input for BoxController
+
+        Keyword arguments:
+        priority -- the priority of the input [int]
+        """
+        self.__sender.put(input_string, priority=priority)
+
+    def queue_put_many(self, input_strings, priority=ipc.PRIORITY_NONE):
+        """Send several strings to BoxController as input in one go.
+
+        Positional arguments:
+        input_strings -- the strings that will become input [list]
+
+        Keyword arguments:
+        priority -- the priority of the inputs [int]
         """
-        return self.__from_plugins.put(input_string)
+        self.__sender.put_many(input_strings, priority=priority)
 
     def run(self):
         raise NotImplementedError('Overwrite this method to get your process ' +
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import datetime
+import logging
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+HEADER = '# boxcontroller input recording v1'
+
+class Recorder():
+    """Write every input with its time and source to a file for replaying.
+
+    Each line holds the seconds since recording started, the source (name of
+    the ProcessPlugin, "control", ...) and the input, separated by tabs:
+
+        12.345678	Inputusbrfid	0123456789
+
+    Replay it with tools/replay.py.
+    """
+
+    def __init__(self, path):
+        """Open the file, append if it exists.
+
+        Positional arguments:
+        path -- the file [Path]
+        """
+        self.__path = Path(path)
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        self.__file = self.__path.open('a', encoding='utf-8')
+        self.__lock = threading.Lock()
+        self.__start = time.monotonic()
+        self.__file.write('{} started {}\n'.format(HEADER,
+            datetime.datetime.now().isoformat(timespec='seconds')))
+        self.__file.flush()
+        logger.info('recording inputs to {}'.format(self.__path))
+
+    def get_path(self):
+        return self.__path
+
+    def record(self, string, source=None, timestamp=None):
+        """Record an input.
+
+        Positional arguments:
+        string -- the input [string]
+
+        Keyword arguments:
+        source -- where the input came from [string]
+        timestamp -- time.monotonic() when it was received [float]
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        line = '{:.6f}\t{}\t{}\n'.format(max(timestamp - self.__start, 0),
+                escape(source or '-'), escape(string))
+        with self.__lock:
+            if self.__file.closed:
+                return
+            self.__file.write(line)
+            # keep what has been recorded if the box crashes
+            self.__file.flush()
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+def escape(string):
+    return string.replace('\\', '\\\\').replace('\t', '\\t').replace('\n',
+            '\\n')
+
+def unescape(string):
+    result = []
+    characters = iter(string)
+    for character in characters:
+        if character == '\\':
+            character = {'t': '\t', 'n': '\n'}.get(next(characters, '\\'),
+                    '\\')
+        result.append(character)
+    return ''.join(result)
+
+def read(path):
+    """Return the inputs recorded in a file.
+
+    Recordings appended to the file start again at 0 s and are shifted to
+    follow the previous one.
+
+    Positional arguments:
+    path -- the file [Path]
+
+    Returns:
+    [(seconds, source, input)] [list]
+    """
+    records = []
+    offset = 0
+    last = 0
+    with Path(path).open('r', encoding='utf-8') as file:
+        for number, line in enumerate(file, 1):
+            line = line.rstrip('\n')
+            if line.startswith(HEADER):
+                offset = last
+                continue
+            if line == '' or line.startswith('#'):
+                continue
+            try:
+                seconds, source, string = line.split('\t', 2)
+                seconds = float(seconds) + offset
+            except ValueError:
+                logger.error('{}:{}: cannot read "{}"'.format(path, number,
+                    line))
+                continue
+            last = seconds
+            records.append((seconds, unescape(source), unescape(string)))
+    return records
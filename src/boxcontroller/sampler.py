@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# seconds between two samples
+DEFAULT_INTERVAL = 0.005
+
+# the extension of the files the samples of each process are written to
+EXTENSION = '.collapsed'
+
+class Sampler():
+    """Sample the stacks of all threads of the process at a fixed interval.
+
+    A thread of its own looks at sys._current_frames() every interval so
+    the main loop, the threads of plugins and the executor are covered
+    without slowing down every call like a deterministic profiler would. The
+    samples are wall-clock: a thread waiting in select() is counted as
+    being in select().
+
+    The samples are written as "collapsed stacks", one line per stack
+    (outermost frame first, separated by ";") and the number of samples, as
+    read by flamegraph.pl or speedscope, e.g.:
+
+        thread MainThread;run (boxcontroller.py:820);... 42
+    """
+
+    def __init__(self):
+        """Initialise variables."""
+        self.__samples = {}
+        self.__labels = {}
+        self.__lock = threading.Lock()
+        self.__thread = None
+        # a forked child inherits the sampler but not its thread
+        self.__pid = None
+        self.__stop = threading.Event()
+        self.__interval = DEFAULT_INTERVAL
+        self.__path = None
+        self.__started = None
+        self.__duration = 0
+
+    def is_running(self):
+        return self.__thread is not None and self.__pid == os.getpid()
+
+    def get_path(self):
+        """Return the file the samples are written to when stopped."""
+        return self.__path
+
+    def get_samples(self):
+        """Return {(thread, frame, ...): number of samples}."""
+        with self.__lock:
+            return dict(self.__samples)
+
+    def start(self, path, interval=DEFAULT_INTERVAL):
+        """Start sampling, discard earlier samples.
+
+        Positional arguments:
+        path -- the file to write the samples to when stopped [Path]
+
+        Keyword arguments:
+        interval -- seconds between two samples [float]
+        """
+        if self.is_running():
+            logger.debug('already profiling')
+            return
+        self.__path = Path(path)
+        self.__interval = max(float(interval), 0.0001)
+        with self.__lock:
+            self.__samples = {}
+        self.__stop.clear()
+        self.__pid = os.getpid()
+        self.__started = time.monotonic()
+        self.__thread = threading.Thread(target=self.__sample,
+                name='boxcontroller-sampler', daemon=True)
+        self.__thread.start()
+        logger.info('profiling process {} every {:.1f} ms'.format(os.getpid(),
+            self.__interval * 1000))
+
+    def stop(self):
+        """Stop sampling and write the samples.
+
+        Returns:
+        the file written or None [Path]
+        """
+        if not self.is_running():
+            return None
+        self.__stop.set()
+        self.__thread.join()
+        self.__thread = None
+        self.__duration = time.monotonic() - self.__started
+        return self.write(self.__path)
+
+    def __sample(self):
+        own = threading.get_ident()
+        while not self.__stop.wait(self.__interval):
+            names = {thread.ident: thread.name
+                    for thread in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self.__get_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append('thread {}'.format(names.get(ident, ident)))
+                stacks.append(tuple(reversed(stack)))
+            with self.__lock:
+                for stack in stacks:
+                    self.__samples[stack] = self.__samples.get(stack, 0) + 1
+
+    def __get_label(self, code):
+        label = self.__labels.get(code)
+        if label is None:
+            label = '{} ({}:{})'.format(code.co_name,
+                    Path(code.co_filename).name, code.co_firstlineno)
+            self.__labels[code] = label
+        return label
+
+    def write(self, path):
+        """Write the samples as collapsed stacks.
+
+        Positional arguments:
+        path -- the file [Path]
+
+        Returns:
+        the file written or None [Path]
+        """
+        samples = self.get_samples()
+        path = Path(path)
+        # only let the complete file appear as the main process waits for it
+        partial = path.with_name(path.name + '.partial')
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with partial.open('w', encoding='utf-8') as file:
+                file.write('# pid {} sampled every {:.1f} ms for {:.1f} s\n'
+                        .format(os.getpid(), self.__interval * 1000,
+                            self.__duration))
+                for stack, count in sorted(samples.items()):
+                    file.write('{} {}\n'.format(';'.join(frame.replace(';',
+                        ',') for frame in stack), count))
+            partial.replace(path)
+        except OSError as error:
+            logger.error('could not write profile to "{}": {}'.format(path,
+                error))
+            return None
+        logger.info('wrote {} samples to "{}"'.format(sum(samples.values()),
+            path))
+        return path
+
+def read(path):
+    """Return the samples written by Sampler.write().
+
+    Positional arguments:
+    path -- the file [Path]
+
+    Returns:
+    {(thread, frame, ...): number of samples} [dict]
+    """
+    samples = {}
+    with Path(path).open('r', encoding='utf-8') as file:
+        for line in file:
+            line = line.rstrip('\n')
+            if line == '' or line.startswith('#'):
+                continue
+            stack, _, count = line.rpartition(' ')
+            try:
+                key = tuple(stack.split(';'))
+                samples[key] = samples.get(key, 0) + int(count)
+            except ValueError:
+                logger.error('{}: cannot read "{}"'.format(path, line))
+    return samples
+
+def summarise(samples, limit=20):
+    """Return the functions most samples were taken in as a table.
+
+    "self" counts the samples where the function was running itself, "total"
+    those where it was on the stack, i.e., including the functions it
+    called.
+
+    Positional arguments:
+    samples -- {(thread, frame, ...): number of samples} [dict]
+
+    Keyword arguments:
+    limit -- how many functions to list [int]
+
+    Returns:
+    the table [string]
+    """
+    total = sum(samples.values())
+    if total == 0:
+        return 'no samples\n'
+    own = {}
+    inclusive = {}
+    for stack, count in samples.items():
+        # the thread if the thread was not running any Python code
+        own[stack[-1]] = own.get(stack[-1], 0) + count
+        for frame in set(stack[1:]):
+            inclusive[frame] = inclusive.get(frame, 0) + count
+    lines = ['{:>7} {:>7} {:>7}  {}'.format('self', 'self%', 'total%',
+        'function')]
+    for frame, count in sorted(own.items(), key=lambda item: -item[1])[
+            :limit]:
+        lines.append('{:>7} {:>6.1f}% {:>6.1f}%  {}'.format(count,
+            count / total * 100, inclusive.get(frame, count) / total * 100,
+            frame))
+    return '\n'.join(lines) + '\n'
+
+def write_summary(directory, limit=20):
+    """Merge the samples of all processes in directory into summary.txt.
+
+    Lists the hot spots of each process and of all processes together.
+
+    Positional arguments:
+    directory -- where the samples of each process were written to [Path]
+
+    Keyword arguments:
+    limit -- how many functions to list per process [int]
+
+    Returns:
+    the file written or None [Path]
+    """
+    directory = Path(directory)
+    merged = {}
+    sections = []
+    for path in sorted(directory.glob('*' + EXTENSION)):
+        try:
+            samples = read(path)
+        except OSError as error:
+            logger.error('could not read "{}": {}'.format(path, error))
+            continue
+        for stack, count in samples.items():
+            # keep the threads of different processes apart
+            key = ('{} {}'.format(path.stem, stack[0]),) + stack[1:]
+            merged[key] = merged.get(key, 0) + count
+        sections.append('== {} ({} samples)\n{}'.format(path.stem,
+            sum(samples.values()), summarise(samples, limit)))
+    if len(sections) == 0:
+        logger.error('no profiles found in "{}"'.format(directory))
+        return None
+    sections.insert(0, '== all processes ({} samples)\n{}'.format(
+        sum(merged.values()), summarise(merged, limit)))
+    path = directory / 'summary.txt'
+    try:
+        path.write_text('\n'.join(sections), encoding='utf-8')
+    except OSError as error:
+        logger.error('could not write "{}": {}'.format(path, error))
+        return None
+    logger.info('wrote profile summary to "{}"'.format(path))
+    return path
+
+# the sampler of this process
+sampler = Sampler()
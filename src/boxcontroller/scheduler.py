@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+import heapq
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class Timer():
+    """A scheduled callback as returned by Scheduler.
+
+    Use cancel() to prevent it from being called (again).
+    """
+
+    __slots__ = ('deadline', 'interval', 'callback', 'args', 'kwargs',
+            'cancelled', '_scheduler')
+
+    def __init__(self, scheduler, deadline, interval, callback, args, kwargs):
+        self._scheduler = scheduler
+        self.deadline = deadline
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+
+    def get_deadline(self):
+        """Return the time.monotonic() of the next call."""
+        return self.deadline
+
+    def get_remaining(self):
+        """Return the seconds left until the next call."""
+        return max(self.deadline - time.monotonic(), 0)
+
+    def is_active(self):
+        """Return True if the timer will be called (again)."""
+        return not self.cancelled
+
+    def cancel(self):
+        self._scheduler.cancel(self)
+
+class Scheduler():
+    """One-shot and periodic callbacks on the monotonic clock.
+
+    The timers are kept in a heap ordered by their deadline. The owner (i.e.,
+    BoxController's main loop) waits at most get_timeout() seconds and calls
+    run_due() afterwards, so the callbacks are called in the owner's thread.
+
+    Timers may be scheduled and cancelled from other threads, the owner is
+    woken up through get_waker() if its wait has to end earlier.
+    """
+
+    def __init__(self):
+        """Initialise variables."""
+        self.__heap = []
+        # breaks ties between timers with the same deadline
+        self.__counter = itertools.count()
+        self.__cancelled = 0
+        self.__lock = threading.Lock()
+        self.__owner = threading.get_ident()
+        self.__waker, self.__wake = multiprocessing.Pipe(duplex=False)
+        self.__woken = False
+
+    def get_waker(self):
+        """Return the connection that becomes ready if a timer has been
+        scheduled from another thread. Call run_due() when it's ready."""
+        return self.__waker
+
+    def call_at(self, deadline, callback, *args, **kwargs):
+        """Call callback at the given time.
+
+        Positional arguments:
+        deadline -- time as returned by time.monotonic() [float]
+        callback -- the function to call [function]
+        * -- parameters to pass to the callback
+
+        Keyword arguments:
+        * -- parameters to pass to the callback
+
+        Returns:
+        the timer [Timer]
+        """
+        return self._schedule(Timer(self, deadline, None, callback, args,
+            kwargs))
+
+    def call_later(self, delay, callback, *args, **kwargs):
+        """Call callback after delay seconds.
+
+        Positional arguments:
+        delay -- seconds to wait [float]
+        callback -- the function to call [function]
+        * -- parameters to pass to the callback
+
+        Keyword arguments:
+        * -- parameters to pass to the callback
+
+        Returns:
+        the timer [Timer]
+        """
+        return self.call_at(time.monotonic() + delay, callback, *args,
+                **kwargs)
+
+    def call_every(self, interval, callback, *args, **kwargs):
+        """Call callback every interval seconds until cancelled.
+
+        The first call happens after interval seconds. Deadlines do not drift:
+        if a call is late the following ones are not postponed, if calls
+        have been missed altogether they are skipped.
+
+        Positional arguments:
+        interval -- seconds between two calls [float]
+        callback -- the function to call [function]
+        * -- parameters to pass to the callback
+
+        Keyword arguments:
+        * -- parameters to pass to the callback
+
+        Returns:
+        the timer [Timer]
+        """
+        if interval <= 0:
+            raise ValueError('interval must be positive')
+        return self._schedule(Timer(self, time.monotonic() + interval,
+            interval, callback, args, kwargs))
+
+    def cancel(self, timer):
+        """Prevent timer from being called (again).
+
+        Positional arguments:
+        timer -- the timer to cancel [Timer]
+        """
+        with self.__lock:
+            if timer.cancelled:
+                return
+            timer.cancelled = True
+            # cancelled timers are removed lazily
+            self.__cancelled += 1
+            if self.__cancelled > 64 and \
+                    self.__cancelled > len(self.__heap) // 2:
+                self.__heap = [item for item in self.__heap
+                        if not item[2].cancelled]
+                heapq.heapify(self.__heap)
+                self.__cancelled = 0
+
+    def _schedule(self, timer):
+        with self.__lock:
+            earliest = self.__heap[0][0] if len(self.__heap) > 0 else None
+            heapq.heappush(self.__heap, (timer.deadline, next(self.__counter),
+                timer))
+            wake = threading.get_ident() != self.__owner and \
+                    not self.__woken and \
+                    (earliest is None or timer.deadline < earliest)
+            if wake:
+                self.__woken = True
+        if wake:
+            self.__wake.send_bytes(b'\0')
+        return timer
+
+    def get_timeout(self, maximum=None):
+        """Return the seconds until the next deadline.
+
+        Keyword arguments:
+        maximum -- return at most this [float], None for no limit
+
+        Returns:
+        seconds [float] or maximum if no timer is scheduled
+        """
+        with self.__lock:
+            while len(self.__heap) > 0 and self.__heap[0][2].cancelled:
+                heapq.heappop(self.__heap)
+                self.__cancelled -= 1
+            if len(self.__heap) == 0:
+                return maximum
+            timeout = max(self.__heap[0][0] - time.monotonic(), 0)
+        if maximum is None:
+            return timeout
+        return min(timeout, maximum)
+
+    def run_due(self):
+        """Call all timers whose deadline has passed.
+
+        Returns:
+        the number of callbacks called [int]
+        """
+        with self.__lock:
+            if self.__woken:
+                self.__waker.recv_bytes()
+                self.__woken = False
+        called = 0
+        now = time.monotonic()
+        while True:
+            with self.__lock:
+                if len(self.__heap) == 0 or self.__heap[0][0] > now:
+                    break
+                deadline, count, timer = heapq.heappop(self.__heap)
+                if timer.cancelled:
+                    self.__cancelled -= 1
+                    continue
+                if timer.interval is None:
+                    timer.cancelled = True
+                else:
+                    # skip missed calls but keep the phase
+                    missed = (now - timer.deadline) // timer.interval
+                    timer.deadline += (missed + 1) * timer.interval
+                    heapq.heappush(self.__heap, (timer.deadline,
+                        next(self.__counter), timer))
+            called += 1
+            try:
+                timer.callback(*timer.args, **timer.kwargs)
+            except Exception:
+                logger.exception('error in timer callback {}'.format(
+                    timer.callback))
+        return called
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import contextlib
+import logging
+import os
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# the time [s] we want to be ready in after starting the interpreter on a
+# Raspberry Pi Zero, checked by tools/bench_startup.py
+TARGET_BOOT_TO_READY = 3.0
+
+def get_process_age():
+    """Return the seconds since this process was started or None.
+
+    Read from /proc (Linux only), precise to a clock tick (usually 10 ms).
+    """
+    try:
+        with open('/proc/self/stat') as stat:
+            # the name of the program may contain spaces, the fields after
+            # it do not
+            fields = stat.read().rpartition(')')[2].split()
+        with open('/proc/uptime') as uptime:
+            since_boot = float(uptime.read().split()[0])
+        # field 22: the start time in clock ticks after boot
+        started = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+    return max(since_boot - started, 0)
+
+class StartupProfiler():
+    """Record how long the phases of booting BoxController take.
+
+    Phases are recorded relative to the start of the process, i.e., they
+    include starting the interpreter and the imports before this module
+    (see get_process_age()). If the start cannot be read they are recorded
+    relative to the moment this module was imported. The profiler does
+    nothing unless it has been enabled.
+    """
+
+    def __init__(self):
+        """Initialise variables."""
+        age = get_process_age()
+        self.__start = time.monotonic() - (age if age is not None else 0)
+        self.__path = None
+        self.__phases = []
+        self.__ready = None
+
+    def enable(self, path):
+        """Start recording phases and write the report to path when ready.
+
+        Positional arguments:
+        path -- where to write the report to [Path]
+        """
+        self.__path = Path(path)
+
+    def is_enabled(self):
+        return self.__path is not None
+
+    def get_phases(self):
+        """Return a list of (name, start [s], duration [s])."""
+        return self.__phases
+
+    def get_boot_to_ready(self):
+        """Return the time [s] it took to become ready or None."""
+        return self.__ready
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Record the time spent in the block.
+
+        Positional arguments:
+        name -- the name of the phase [string]
+        """
+        if not self.is_enabled():
+            yield
+            return
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            end = time.monotonic()
+            self.__phases.append((name, start - self.__start, end - start))
+
+    def ready(self):
+        """Mark BoxController as ready and write the report."""
+        if not self.is_enabled() or self.__ready is not None:
+            return
+        self.__ready = time.monotonic() - self.__start
+        logger.info('ready after {:.3f} s (target: {:.1f} s)'.format(
+            self.__ready, TARGET_BOOT_TO_READY))
+        self.write_report()
+
+    def get_report(self):
+        """Return the report as a string."""
+        lines = ['{:<40} {:>9} {:>9}'.format('phase', 'start', 'duration')]
+        for name, start, duration in self.get_phases():
+            lines.append('{:<40} {:>9.4f} {:>9.4f}'.format(name, start,
+                duration))
+        lines.append('')
+        if self.get_boot_to_ready() is not None:
+            lines.append('boot-to-ready: {:.4f} s (target: {:.1f} s)'.format(
+                self.get_boot_to_ready(), TARGET_BOOT_TO_READY))
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self):
+        """Write the report to the configured path."""
+        try:
+            self.__path.parent.mkdir(parents=True, exist_ok=True)
+            self.__path.write_text(self.get_report())
+            logger.info('wrote startup profile to "{}"'.format(self.__path))
+        except OSError:
+            logger.error('could not write startup profile to "{}"'.format(
+                self.__path))
+
+profiler = StartupProfiler()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+import asyncio
+import collections
+import logging
+import re
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_outcomes = metrics.registry.counter('boxcontroller_subprocess_outcomes_total',
+        'Subprocesses by how they ended (ok, failed, timeout, error)',
+        ['program', 'command', 'outcome'])
+
+def get_command(args):
+    """Return the name a call is counted as, e.g., "mpc status".
+
+    The program and its first argument if that is a word (a subcommand like
+    "status", not an option, a path or a number which would make a new
+    label for each value).
+
+    Positional arguments:
+    args -- the program and its arguments [list]
+    """
+    command = [Path(args[0]).name]
+    for arg in args[1:]:
+        if not arg.startswith('-'):
+            if re.fullmatch(r'[A-Za-z][\w-]*', arg) is not None:
+                command.append(arg)
+            break
+    return ' '.join(command)
+
+class SubprocessRunner():
+    """Run external programs (mpc, amixer, aplay, ...) for all plugins.
+
+    Each call has a timeout after which the program is killed so a hanging
+    program cannot stall the main loop forever. Calls in the background
+    (run(), awaited or passed to ListenerPlugin.create_task() to forget about
+    them) wait for a free slot if too many programs are running already.
+    Blocking calls (run_blocking()) are meant for code running off the main
+    loop (threads, ProcessPlugins), plugins on the main loop await run().
+    They never wait for a slot as the main loop might be needed to free one
+    but they count towards the limit.
+
+    The time each command took and how it ended is recorded in
+    metrics.subprocesses and boxcontroller_subprocess_outcomes_total.
+    """
+
+    def __init__(self, limit=4, timeout=10):
+        """Initialise variables.
+
+        Keyword arguments:
+        limit -- programs running in the background at most [int]
+        timeout -- seconds after which a program is killed by default,
+            None to wait forever [float]
+        """
+        self.__limit = limit
+        self.__timeout = timeout
+        self.__running = 0
+        # (loop, future) of calls waiting for a slot
+        self.__waiters = collections.deque()
+        self.__lock = threading.Lock()
+        metrics.registry.gauge('boxcontroller_subprocesses_running',
+                'Subprocesses running', function=self.get_running)
+        metrics.registry.gauge('boxcontroller_subprocesses_waiting',
+                'Subprocesses waiting for a free slot',
+                function=self.get_waiting)
+
+    def configure(self, limit=None, timeout=None):
+        """Change the limit and the default timeout.
+
+        Keyword arguments:
+        limit -- programs running in the background at most [int]
+        timeout -- default timeout in seconds, 0 to wait forever [float]
+        """
+        if limit is not None:
+            self.__limit = max(int(limit), 1)
+        if timeout is not None:
+            self.__timeout = timeout if timeout > 0 else None
+        self.__wake()
+
+    def get_limit(self):
+        return self.__limit
+
+    def get_timeout(self):
+        return self.__timeout
+
+    def get_running(self):
+        """Return the number of programs running."""
+        return self.__running
+
+    def get_waiting(self):
+        """Return the number of calls waiting for a free slot."""
+        return len(self.__waiters)
+
+    async def __acquire(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            with self.__lock:
+                if self.__running < self.__limit:
+                    self.__running += 1
+                    return
+                waiter = loop.create_future()
+                self.__waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self.__lock:
+                    if (loop, waiter) in self.__waiters:
+                        self.__waiters.remove((loop, waiter))
+                # a slot freed for this call goes to the next one
+                self.__wake()
+                raise
+
+    def __release(self):
+        with self.__lock:
+            self.__running -= 1
+        self.__wake()
+
+    def __wake(self):
+        """Let the next call waiting for a slot check again."""
+        with self.__lock:
+            if len(self.__waiters) == 0 or self.__running >= self.__limit:
+                return
+            loop, waiter = self.__waiters.popleft()
+        loop.call_soon_threadsafe(
+                lambda: waiter.done() or waiter.set_result(None))
+
+    def __finish(self, args, start, outcome):
+        program = Path(args[0]).name
+        command = get_command(args)
+        metrics.subprocesses.observe(time.monotonic() - start,
+                program=program, command=command)
+        _outcomes.inc(program=program, command=command, outcome=outcome)
+
+    async def run(self, *args, input=None, timeout=False, check=False):
+        """Run a program without blocking the main loop, await the result.
+
+        Positional arguments:
+        * -- the program and its arguments [string]
+
+        Keyword arguments:
+        input -- passed to the program's stdin [string]
+        timeout -- kill the program after timeout seconds, None to wait
+            forever, False for the default [float]
+        check -- raise subprocess.CalledProcessError if it fails [boolean]
+
+        Returns:
+        stdout and stderr decoded as UTF-8 [subprocess.CompletedProcess]
+
+        Raises subprocess.TimeoutExpired, OSError if it cannot be started.
+        """
+        args = [str(arg) for arg in args]
+        timeout = self.__timeout if timeout is False else timeout
+        await self.__acquire()
+        start = time.monotonic()
+        outcome = 'error'
+        try:
+            process = await asyncio.create_subprocess_exec(*args,
+                    stdin=subprocess.DEVNULL if input is None else
+                        subprocess.PIPE,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(
+                    None if input is None else input.encode('utf-8')),
+                    timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                outcome = 'timeout'
+                logger.error('killed "{}" after {} s'.format(' '.join(args),
+                    timeout))
+                raise subprocess.TimeoutExpired(args, timeout)
+            except asyncio.CancelledError:
+                # do not leave it running when the caller gives up
+                process.kill()
+                raise
+            outcome = 'ok' if process.returncode == 0 else 'failed'
+        finally:
+            self.__finish(args, start, outcome)
+            self.__release()
+        result = subprocess.CompletedProcess(args, process.returncode,
+                stdout.decode('utf-8'), stderr.decode('utf-8'))
+        if check:
+            result.check_returncode()
+        return result
+
+    def run_blocking(self, *args, input=None, timeout=False, check=False):
+        """Run a program and wait for it, only off the main loop, e.g., in a
+        thread or a ProcessPlugin.
+
+        Positional arguments:
+        * -- the program and its arguments [string]
+
+        Keyword arguments:
+        see run()
+
+        Returns:
+        stdout and stderr decoded as UTF-8 [subprocess.CompletedProcess]
+
+        Raises subprocess.TimeoutExpired, OSError if it cannot be started.
+        """
+        args = [str(arg) for arg in args]
+        timeout = self.__timeout if timeout is False else timeout
+        with self.__lock:
+            self.__running += 1
+        start = time.monotonic()
+        outcome = 'error'
+        try:
+            result = subprocess.run(args, input=input,
+                    stdin=subprocess.DEVNULL if input is None else None,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    encoding='utf-8', timeout=timeout, check=check)
+            outcome = 'ok' if result.returncode == 0 else 'failed'
+            return result
+        except subprocess.TimeoutExpired:
+            outcome = 'timeout'
+            logger.error('killed "{}" after {} s'.format(' '.join(args),
+                timeout))
+            raise
+        except subprocess.CalledProcessError:
+            outcome = 'failed'
+            raise
+        finally:
+            self.__finish(args, start, outcome)
+            self.__release()
+
+# the runner used throughout BoxController
+runner = SubprocessRunner()
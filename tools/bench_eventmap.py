@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Compare loading the eventmap with looking it up in a compiled index.
+
+Writes an eventmap with CARDS cards (mapped to "play" like the cards of a
+large library) and loads it in a fresh interpreter per variant:
+
+text -- all mappings loaded into dicts (the default)
+compile -- [Mapping] index set, the index needs to be compiled
+index -- [Mapping] index set, the index has already been compiled
+
+Reports how long creating the EventMap took, the memory the interpreter
+uses afterwards (USS, see boxcontroller.memoryreport) and the time per
+lookup.
+
+Usage:
+    python3 tools/bench_eventmap.py [--cards CARDS] [--lookups LOOKUPS]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / 'src'
+
+CHILD = """
+import json
+import random
+import sys
+import time
+from boxcontroller import config as cfg
+from boxcontroller import memoryreport
+from boxcontroller.eventmap import EventMap
+
+cards, lookups = int(sys.argv[1]), int(sys.argv[2])
+config = cfg.Config()
+start = time.monotonic()
+eventmap = EventMap(config)
+loaded = time.monotonic() - start
+keys = ['{:010d}'.format(random.randrange(cards)) for i in range(lookups)]
+start = time.monotonic()
+for key in keys:
+    eventmap.get(key)
+lookup = (time.monotonic() - start) / lookups
+print(json.dumps({'load': loaded, 'lookup': lookup,
+    'uss': memoryreport.get_memory()['uss']}))
+"""
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cards', type=int, default=50000)
+    parser.add_argument('--lookups', type=int, default=10000)
+    args = parser.parse_args()
+
+    print('{:<8} {:>10} {:>10} {:>12}'.format('variant', 'load [ms]',
+        'USS [MiB]', 'lookup [us]'))
+    with tempfile.TemporaryDirectory() as tmp:
+        home = Path(tmp)
+        user_config = home / '.config' / 'boxcontroller'
+        user_config.mkdir(parents=True)
+        with (user_config / 'eventmap').open('w') as eventmap:
+            for card in range(args.cards):
+                eventmap.write('{:010d}|play|{:010d}|position=0\n'.format(card,
+                    card))
+        env = dict(os.environ)
+        env['HOME'] = str(home)
+        env['PYTHONPATH'] = os.pathsep.join(
+                [str(SRC)] + env.get('PYTHONPATH', '').split(os.pathsep))
+
+        for variant in ['text', 'compile', 'index']:
+            index = '' if variant == 'text' else 'eventmap.index'
+            (user_config / 'config.ini').write_text(
+                    '[Mapping]\nindex = {}\n'.format(index))
+            result = subprocess.run([sys.executable, '-c', CHILD,
+                str(args.cards), str(args.lookups)], env=env,
+                stdout=subprocess.PIPE, universal_newlines=True, check=True)
+            report = json.loads(result.stdout.strip().split('\n')[-1])
+            print('{:<8} {:>10.1f} {:>10.1f} {:>12.2f}'.format(variant,
+                report['load'] * 1000, report['uss'] / 1048576,
+                report['lookup'] * 1000000))
+
+if __name__ == '__main__':
+    main()
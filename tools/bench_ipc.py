@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Compare the ProcessPlugin -> BoxController transports.
+
+* queue -- a shared multiprocessing.Queue carrying pickled (timestamp, string)
+  tuples (the timestamp is only added to measure latency)
+* pipe -- a pipe per plugin carrying boxcontroller.ipc messages, one write per
+  message
+* pipe-batch -- like pipe but BATCH messages per write
+
+A child process sends N inputs as fast as it can (or one batch every
+INTERVAL seconds), the parent receives them and reports throughput and the
+latency between creating and processing each message. Flooding measures
+throughput, pacing measures the latency of single inputs.
+
+Usage:
+    python3 tools/bench_ipc.py [-n MESSAGES] [--batch BATCH] [--interval S]
+"""
+
+import argparse
+import multiprocessing
+import multiprocessing.connection
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from boxcontroller import ipc
+
+PAYLOAD = '0372441754'
+
+def produce_queue(queue, count, batch, interval):
+    for i in range(count):
+        queue.put((time.monotonic(), PAYLOAD))
+        if interval > 0 and i % batch == batch - 1:
+            time.sleep(interval)
+    queue.put(None)
+
+def produce_pipe(connection, count, batch, interval):
+    sender = ipc.Sender(connection, 1)
+    for i in range(count):
+        sender.put(PAYLOAD)
+        if interval > 0 and i % batch == batch - 1:
+            time.sleep(interval)
+    connection.send_bytes(b'')
+
+def produce_pipe_batch(connection, count, batch, interval):
+    sender = ipc.Sender(connection, 1)
+    for i in range(0, count, batch):
+        sender.put_many([PAYLOAD] * min(batch, count - i))
+        if interval > 0:
+            time.sleep(interval)
+    connection.send_bytes(b'')
+
+def consume_queue(queue):
+    latencies = []
+    while True:
+        item = queue.get()
+        if item is None:
+            return latencies
+        latencies.append(time.monotonic() - item[0])
+
+def consume_pipe(connection):
+    latencies = []
+    while True:
+        messages = ipc.receive(connection)
+        if len(messages) == 0:
+            return latencies
+        now = time.monotonic()
+        for message in messages:
+            latencies.append(now - message.timestamp)
+
+def run(transport, count, batch, interval):
+    """Run one transport and return (seconds, latencies)."""
+    if transport == 'queue':
+        reader = writer = multiprocessing.Queue()
+        produce, consume = produce_queue, consume_queue
+    else:
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        produce = produce_pipe if transport == 'pipe' else produce_pipe_batch
+        consume = consume_pipe
+
+    process = multiprocessing.Process(target=produce,
+            args=(writer, count, batch, interval))
+    start = time.monotonic()
+    process.start()
+    latencies = consume(reader)
+    duration = time.monotonic() - start
+    process.join()
+    return (duration, latencies)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--messages', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--interval', type=float, default=0,
+            help='pause between batches in seconds, 0 to flood')
+    args = parser.parse_args()
+
+    print('{:<12} {:>12} {:>12} {:>12} {:>12}'.format('transport', 'msg/s',
+        'p50 [ms]', 'p99 [ms]', 'max [ms]'))
+    for transport in ['queue', 'pipe', 'pipe-batch']:
+        duration, latencies = run(transport, args.messages, args.batch,
+                args.interval)
+        latencies.sort()
+        print('{:<12} {:>12.0f} {:>12.3f} {:>12.3f} {:>12.3f}'.format(
+            transport, len(latencies) / duration,
+            statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000,
+            latencies[-1] * 1000))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Compare the memory used by ProcessPlugins per start method.
+
+Boots BoxController in a fresh interpreter per start method (fork,
+forkserver, spawn) with PROCESSES idle ProcessPlugins and prints the USS, PSS
+and RSS of the main process and each child (see
+boxcontroller.memoryreport).
+
+USS is what a child really costs: memory shared copy-on-write with the main
+process or the forkserver is not counted. The forkserver process itself is
+not listed.
+
+ProcessPlugins talking to hardware are blacklisted by default as they cannot
+be started without it. The remaining plugins call mpc, amixer and aplay so
+run this on a box or provide stand-ins in PATH.
+
+Usage:
+    python3 tools/bench_memory.py [-n PROCESSES] [--settle SECONDS]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / 'src'
+
+CHILD = """
+import sys
+import time
+from boxcontroller import config as cfg
+from boxcontroller import processplugin
+from boxcontroller.boxcontroller import BoxController
+config = cfg.Config()
+preload = config.get('System', 'forkserver_preload', default='')
+processplugin.set_start_method(sys.argv[1],
+        preload=[module.strip() for module in preload.split(',')])
+boxcontroller = BoxController(config)
+boxcontroller.start()
+time.sleep(float(sys.argv[2]))
+print(boxcontroller.get_memory_report())
+boxcontroller.terminate()
+boxcontroller.stop_processes()
+"""
+
+PLUGIN = """
+from boxcontroller.processplugin import ProcessPlugin
+
+class Idle{0}(ProcessPlugin):
+    def run(self):
+        while not self.get_interrupt_signal():
+            self.wait([])
+"""
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--processes', type=int, default=3,
+            help='number of idle ProcessPlugins')
+    parser.add_argument('--settle', type=float, default=2,
+            help='seconds to wait for the children to settle')
+    parser.add_argument('--blacklist', type=str,
+            default='inputusbrfid,inputgpiod,onoffshim',
+            help='plugins not to load')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        home = Path(tmp)
+        user_config = home / '.config' / 'boxcontroller'
+        (user_config / 'plugins').mkdir(parents=True)
+        (user_config / 'config.ini').write_text(
+                '[Plugins]\nblacklist = {}\n'.format(args.blacklist))
+        for i in range(args.processes):
+            package = user_config / 'plugins' / 'idle{}'.format(i)
+            package.mkdir()
+            (package / '__init__.py').write_text('')
+            (package / 'idle{}.py'.format(i)).write_text(PLUGIN.format(i))
+
+        env = dict(os.environ)
+        env['HOME'] = str(home)
+        env['PYTHONPATH'] = os.pathsep.join(
+                [str(SRC)] + env.get('PYTHONPATH', '').split(os.pathsep))
+        for method in ['fork', 'forkserver', 'spawn']:
+            result = subprocess.run([sys.executable, '-c', CHILD, method,
+                str(args.settle)], env=env, stdout=subprocess.PIPE,
+                universal_newlines=True, check=True)
+            print('start method: {}'.format(method))
+            print(result.stdout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Compare the execution modes of ProcessPlugins.
+
+Boots BoxController in a fresh interpreter per execution mode (process,
+thread, inline) with PLUGINS input plugins. Each plugin reads lines from its
+own FIFO like an input device and sends them as input. A writer thread puts
+a timestamp into a FIFO every INTERVAL seconds and the latency between
+writing and BoxController processing the input is measured.
+
+Reports the latency and the memory used by all processes (USS, PSS, see
+boxcontroller.memoryreport).
+
+Usage:
+    python3 tools/bench_modes.py [-n MESSAGES] [--plugins PLUGINS]
+        [--interval SECONDS]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / 'src'
+
+CHILD = """
+import json
+import os
+import sys
+import threading
+import time
+from boxcontroller import config as cfg
+from boxcontroller import memoryreport
+from boxcontroller import processplugin
+from boxcontroller.boxcontroller import BoxController
+
+count, plugins, interval = int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3])
+config = cfg.Config()
+processplugin.set_start_method(config.get('System', 'start_method'),
+        preload=[config.get('System', 'forkserver_preload')])
+boxcontroller = BoxController(config)
+latencies = []
+boxcontroller.process_input = lambda string, **kwargs: latencies.append(
+        time.monotonic() - float(string))
+boxcontroller.start()
+
+def write():
+    fifos = [os.open(config.get('Fifo{}'.format(i), 'path'), os.O_WRONLY)
+            for i in range(plugins)]
+    for i in range(count):
+        os.write(fifos[i % plugins], '{!r}\\n'.format(time.monotonic()).encode())
+        time.sleep(interval)
+threading.Thread(target=write, daemon=True).start()
+
+while len(latencies) < count:
+    boxcontroller.receive_messages(timeout=1)
+
+pids = [os.getpid()] + [process.pid for process in
+        boxcontroller.get_processes().values() if process.pid is not None]
+memory = [memoryreport.get_memory(pid) for pid in pids]
+print(json.dumps({'latencies': latencies, 'processes': len(pids),
+    'uss': sum(item['uss'] for item in memory),
+    'pss': sum(item['pss'] for item in memory)}))
+boxcontroller.terminate()
+boxcontroller.stop_processes()
+"""
+
+PLUGIN = """
+import os
+from boxcontroller.processplugin import ProcessPlugin
+
+class Fifo{0}(ProcessPlugin):
+    execution_modes = ['process', 'thread', 'inline']
+    config_section = 'Fifo{0}'
+    config_schema = {{'path': ('str', None)}}
+
+    def open(self):
+        # do not block until the writer opens the FIFO
+        self.fifo = os.open(self.get_settings().path,
+                os.O_RDONLY | os.O_NONBLOCK)
+        self.buffer = b''
+
+    def read(self):
+        try:
+            self.buffer += os.read(self.fifo, 4096)
+        except BlockingIOError:
+            return
+        lines = self.buffer.split(b'\\n')
+        self.buffer = lines.pop()
+        self.queue_put_many([line.decode() for line in lines])
+
+    def run(self):
+        self.open()
+        while not self.get_interrupt_signal():
+            if self.fifo in self.wait([self.fifo]):
+                self.read()
+
+    def setup_inline(self):
+        self.open()
+
+    def get_inline_callbacks(self):
+        return {{self.fifo: self.read}}
+"""
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--messages', type=int, default=2000)
+    parser.add_argument('--plugins', type=int, default=3,
+            help='number of input plugins')
+    parser.add_argument('--interval', type=float, default=0.002,
+            help='seconds between two inputs')
+    parser.add_argument('--start-method', type=str, default='forkserver')
+    parser.add_argument('--blacklist', type=str,
+            default='inputusbrfid,inputgpiod,onoffshim',
+            help='plugins not to load')
+    args = parser.parse_args()
+
+    print('{:<8} {:>10} {:>10} {:>10} {:>10} {:>10}'.format('mode',
+        'processes', 'USS [MiB]', 'PSS [MiB]', 'p50 [ms]', 'p99 [ms]'))
+    for mode in ['process', 'thread', 'inline']:
+        with tempfile.TemporaryDirectory() as tmp:
+            home = Path(tmp)
+            user_config = home / '.config' / 'boxcontroller'
+            (user_config / 'plugins').mkdir(parents=True)
+            config = ['[Plugins]', 'blacklist = {}'.format(args.blacklist),
+                    'execution_mode = {}'.format(mode), '[System]',
+                    'start_method = {}'.format(args.start_method)]
+            for i in range(args.plugins):
+                package = user_config / 'plugins' / 'fifo{}'.format(i)
+                package.mkdir()
+                (package / '__init__.py').write_text('')
+                (package / 'fifo{}.py'.format(i)).write_text(PLUGIN.format(i))
+                os.mkfifo(str(home / 'fifo{}'.format(i)))
+                config += ['[Fifo{}]'.format(i),
+                        'path = {}'.format(home / 'fifo{}'.format(i))]
+            (user_config / 'config.ini').write_text('\n'.join(config) + '\n')
+
+            env = dict(os.environ)
+            env['HOME'] = str(home)
+            env['PYTHONPATH'] = os.pathsep.join(
+                    [str(SRC)] + env.get('PYTHONPATH', '').split(os.pathsep))
+            result = subprocess.run([sys.executable, '-c', CHILD,
+                str(args.messages), str(args.plugins), str(args.interval)],
+                env=env, stdout=subprocess.PIPE, universal_newlines=True,
+                check=True)
+            report = json.loads(result.stdout.strip().split('\n')[-1])
+
+        latencies = sorted(report['latencies'])
+        print('{:<8} {:>10} {:>10.1f} {:>10.1f} {:>10.3f} {:>10.3f}'.format(
+            mode, report['processes'], report['uss'] / 1048576,
+            report['pss'] / 1048576, statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000))
+
+if __name__ == '__main__':
+    main()
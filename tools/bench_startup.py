@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Measure BoxController's boot-to-ready time.
+
+Boots BoxController in fresh interpreters and compares the median
+boot-to-ready time (from the start of the process, so starting the
+interpreter and all imports are measured, too) with the target stated in
+boxcontroller.startupprofiler. Exits with 1 if the target is missed.
+
+ProcessPlugins talking to hardware are blacklisted by default as they cannot
+be started without it. The remaining plugins call mpc, amixer and aplay so
+run this on a box or provide stand-ins in PATH.
+
+Usage:
+    python3 tools/bench_startup.py [-n RUNS] [--target SECONDS]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / 'src'
+
+CHILD = """
+import sys
+from boxcontroller.startupprofiler import profiler
+profiler.enable(sys.argv[1])
+with profiler.phase('import boxcontroller'):
+    from boxcontroller import config as cfg
+    from boxcontroller.boxcontroller import BoxController
+with profiler.phase('config load'):
+    config = cfg.Config()
+boxcontroller = BoxController(config)
+boxcontroller.start()
+boxcontroller.terminate()
+print(profiler.get_boot_to_ready())
+"""
+
+def boot(home, report):
+    """Boot BoxController once and return the boot-to-ready time [s].
+
+    Positional arguments:
+    home -- the home directory holding .config/boxcontroller [Path]
+    report -- where to write the startup profile to [Path]
+    """
+    env = dict(os.environ)
+    env['HOME'] = str(home)
+    env['PYTHONPATH'] = os.pathsep.join(
+            [str(SRC)] + env.get('PYTHONPATH', '').split(os.pathsep))
+    result = subprocess.run([sys.executable, '-c', CHILD, str(report)],
+            env=env, stdout=subprocess.PIPE, universal_newlines=True,
+            check=True)
+    return float(result.stdout.strip().split('\n')[-1])
+
+def main():
+    sys.path.insert(0, str(SRC))
+    from boxcontroller.startupprofiler import TARGET_BOOT_TO_READY
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--runs', type=int, default=5,
+            help='number of boots')
+    parser.add_argument('--target', type=float, default=TARGET_BOOT_TO_READY,
+            help='target boot-to-ready time [s]')
+    parser.add_argument('--blacklist', type=str,
+            default='inputusbrfid,inputgpiod,onoffshim',
+            help='plugins not to load')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        home = Path(tmp)
+        user_config = home / '.config' / 'boxcontroller'
+        user_config.mkdir(parents=True)
+        (user_config / 'config.ini').write_text(
+                '[Plugins]\nblacklist = {}\n'.format(args.blacklist))
+        report = home / 'startup_profile'
+
+        times = [boot(home, report) for i in range(args.runs)]
+        print(report.read_text())
+
+    median = statistics.median(times)
+    print('boot-to-ready over {} runs: median {:.4f} s, min {:.4f} s, '
+            'max {:.4f} s'.format(args.runs, median, min(times), max(times)))
+    if median > args.target:
+        print('FAIL: target of {:.1f} s missed'.format(args.target))
+        sys.exit(1)
+    print('OK: target of {:.1f} s met'.format(args.target))
+
+if __name__ == '__main__':
+    main()
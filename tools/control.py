@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Send inputs and events to a running BoxController.
+
+Talks to the control socket ([Control] socket in config.ini, disabled by
+default, e.g., set "socket = control.sock" to enable it), e.g.:
+
+    python3 tools/control.py input 0123456789
+    python3 tools/control.py event vol_step direction=+
+    python3 tools/control.py bench -n 10000 --batch 100 yourself
+
+`bench` sends the same input N times in batches and reports the throughput
+and the round trip time per batch. Map the input to a harmless event (or to
+none at all) before load-testing a box.
+
+Usage:
+    python3 tools/control.py [--socket PATH] input INPUT [INPUT ...]
+    python3 tools/control.py [--socket PATH] event EVENT [ARG ...]
+        [KEY=VALUE ...]
+    python3 tools/control.py [--socket PATH] bench [-n N] [--batch SIZE]
+        INPUT
+"""
+
+import argparse
+import json
+import socket
+import statistics
+import sys
+import time
+from pathlib import Path
+
+class Client():
+
+    def __init__(self, path):
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__socket.connect(str(path))
+        self.__file = self.__socket.makefile('rb')
+
+    def request(self, request):
+        """Send a request (an item or a list of items), return the answer."""
+        self.__socket.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        return json.loads(self.__file.readline().decode('utf-8'))
+
+    def close(self):
+        self.__file.close()
+        self.__socket.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', type=str,
+            default='~/.config/boxcontroller/control.sock')
+    commands = parser.add_subparsers(dest='command')
+    send_input = commands.add_parser('input', help='send inputs')
+    send_input.add_argument('inputs', nargs='+')
+    send_event = commands.add_parser('event', help='request an event')
+    send_event.add_argument('event')
+    send_event.add_argument('arguments', nargs='*',
+            help='ARG or KEY=VALUE')
+    bench = commands.add_parser('bench', help='send an input many times')
+    bench.add_argument('input')
+    bench.add_argument('-n', '--inputs', type=int, default=10000)
+    bench.add_argument('--batch', type=int, default=100)
+    args = parser.parse_args()
+
+    client = Client(Path(args.socket).expanduser())
+    ok = True
+    if args.command == 'input':
+        for result in client.request([{'input': string}
+                for string in args.inputs]):
+            print(json.dumps(result))
+            ok = ok and result['ok']
+    elif args.command == 'event':
+        item = {'event': args.event, 'args': [], 'kwargs': {}}
+        for argument in args.arguments:
+            if '=' in argument:
+                key, value = argument.split('=', 1)
+                item['kwargs'][key] = value
+            else:
+                item['args'].append(argument)
+        result = client.request(item)
+        print(json.dumps(result))
+        ok = result['ok']
+    elif args.command == 'bench':
+        round_trips = []
+        start = time.monotonic()
+        for sent in range(0, args.inputs, args.batch):
+            batch = [{'input': args.input}] * min(args.batch,
+                    args.inputs - sent)
+            before = time.monotonic()
+            results = client.request(batch)
+            round_trips.append(time.monotonic() - before)
+            ok = ok and all(result['ok'] for result in results)
+        duration = time.monotonic() - start
+        print('{} inputs in {:.2f} s: {:.0f} inputs/s, '
+                'round trip per batch of {}: p50 {:.2f} ms, max {:.2f} ms'
+                .format(args.inputs, duration, args.inputs / duration,
+                    args.batch, statistics.median(round_trips) * 1000,
+                    max(round_trips) * 1000))
+    else:
+        parser.print_help()
+    client.close()
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
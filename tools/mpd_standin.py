@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""A stand-in for MPD to try the Mpc plugin's partitions without MPD.
+
+Speaks the subset of MPD's protocol used by PartitionPool: partitions,
+outputs, the queue (add / load / clear), playback options, play / pause /
+seek and status. There is no audio, a folder or playlist holds TRACKS tracks
+and loading sleeps DELAY seconds to mimic MPD searching its database.
+
+Usage:
+    python3 tools/mpd_standin.py [--port PORT] [--outputs NAME,...]
+        [--tracks TRACKS] [--delay SECONDS] [--selftest]
+
+Then set `partitions`, `mpd_host` and `mpd_port` in the [MPC] section.
+With --selftest it switches between keys with PartitionPool and prints how
+long each switch took instead of serving.
+"""
+
+import argparse
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+
+class Partition():
+
+    def __init__(self, name):
+        self.name = name
+        self.queue = []
+        self.options = {'repeat': '0', 'random': '0', 'single': '0',
+                'consume': '0'}
+        self.state = 'stop'
+        self.song = None
+        # elapsed seconds when the state last changed and when that was
+        self.elapsed = 0
+        self.since = time.monotonic()
+
+    def get_elapsed(self):
+        if self.state == 'play':
+            return self.elapsed + time.monotonic() - self.since
+        return self.elapsed
+
+    def set_state(self, state, song=None, elapsed=None):
+        self.elapsed = self.get_elapsed() if elapsed is None else elapsed
+        self.since = time.monotonic()
+        self.state = state
+        if song is not None:
+            self.song = song
+
+class Error(Exception):
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+class StandIn():
+    """The state shared by all connections."""
+
+    def __init__(self, outputs, tracks, delay):
+        self.lock = threading.Lock()
+        self.partitions = {'default': Partition('default')}
+        self.outputs = {name: 'default' for name in outputs}
+        self.tracks = tracks
+        self.delay = delay
+
+    def execute(self, connection, command, args):
+        """Execute a command for a connection, return [(key, value)]."""
+        method = getattr(self, 'do_' + command, None)
+        if method is None:
+            raise Error(5, 'unknown command "{}"'.format(command))
+        with self.lock:
+            return method(connection, *args) or []
+
+    def current(self, connection):
+        return self.partitions[connection.partition]
+
+    def do_ping(self, connection):
+        pass
+
+    def do_listpartitions(self, connection):
+        return [('partition', name) for name in self.partitions]
+
+    def do_newpartition(self, connection, name):
+        if name in self.partitions:
+            raise Error(56, 'name already exists')
+        self.partitions[name] = Partition(name)
+
+    def do_partition(self, connection, name):
+        if not name in self.partitions:
+            raise Error(50, 'partition does not exist')
+        connection.partition = name
+
+    def do_outputs(self, connection):
+        pairs = []
+        for i, (name, partition) in enumerate(self.outputs.items()):
+            if partition == connection.partition:
+                pairs += [('outputid', str(i)), ('outputname', name),
+                        ('plugin', 'null'), ('outputenabled', '1')]
+        return pairs
+
+    def do_moveoutput(self, connection, name):
+        if not name in self.outputs:
+            raise Error(50, 'no such output')
+        self.outputs[name] = connection.partition
+
+    def do_clear(self, connection):
+        partition = self.current(connection)
+        partition.queue = []
+        partition.set_state('stop', elapsed=0)
+        partition.song = None
+
+    def do_add(self, connection, uri):
+        if uri.endswith('.mp3'):
+            self.current(connection).queue.append(uri)
+            return
+        time.sleep(self.delay)
+        self.current(connection).queue += ['{}/{:02d}.mp3'.format(uri, i)
+                for i in range(self.tracks)]
+
+    def do_load(self, connection, name):
+        time.sleep(self.delay)
+        self.current(connection).queue += ['{}/{:02d}.mp3'.format(name, i)
+                for i in range(self.tracks)]
+
+    def set_option(self, connection, option, value):
+        self.current(connection).options[option] = value
+
+    def do_repeat(self, connection, value):
+        self.set_option(connection, 'repeat', value)
+
+    def do_random(self, connection, value):
+        self.set_option(connection, 'random', value)
+
+    def do_single(self, connection, value):
+        self.set_option(connection, 'single', value)
+
+    def do_consume(self, connection, value):
+        self.set_option(connection, 'consume', value)
+
+    def do_play(self, connection, position=None):
+        partition = self.current(connection)
+        if position is None:
+            position = partition.song or 0
+            elapsed = None if partition.state == 'pause' else 0
+        else:
+            position, elapsed = int(position), 0
+        if not 0 <= int(position) < len(partition.queue):
+            raise Error(2, 'Bad song index')
+        partition.set_state('play', song=position, elapsed=elapsed)
+
+    def do_pause(self, connection, pause='1'):
+        partition = self.current(connection)
+        if partition.state == 'stop':
+            return
+        partition.set_state('pause' if pause == '1' else 'play')
+
+    def do_stop(self, connection):
+        self.current(connection).set_state('stop', elapsed=0)
+
+    def do_seek(self, connection, position, elapsed):
+        partition = self.current(connection)
+        if not 0 <= int(position) < len(partition.queue):
+            raise Error(2, 'Bad song index')
+        partition.set_state('play', song=int(position),
+                elapsed=float(elapsed))
+
+    def do_status(self, connection):
+        partition = self.current(connection)
+        pairs = [('partition', partition.name), ('volume', '50')]
+        pairs += list(partition.options.items())
+        pairs += [('playlistlength', str(len(partition.queue))),
+                ('state', partition.state)]
+        if partition.song is not None:
+            pairs += [('song', str(partition.song)),
+                    ('elapsed', '{:.3f}'.format(partition.get_elapsed()))]
+        return pairs
+
+    def do_playlistinfo(self, connection):
+        pairs = []
+        for i, uri in enumerate(self.current(connection).queue):
+            pairs += [('file', uri), ('Pos', str(i))]
+        return pairs
+
+def split(line):
+    """Split a command line into its (quoted) parts."""
+    parts = []
+    i = 0
+    while i < len(line):
+        if line[i] == ' ':
+            i += 1
+            continue
+        if line[i] == '"':
+            part = ''
+            i += 1
+            while line[i] != '"':
+                if line[i] == '\\':
+                    i += 1
+                part += line[i]
+                i += 1
+            i += 1
+        else:
+            end = line.find(' ', i)
+            end = len(line) if end == -1 else end
+            part = line[i:end]
+            i = end
+        parts.append(part)
+    return parts
+
+class Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.partition = 'default'
+        self.write('OK MPD 0.23.5')
+        commands = None
+        for raw in self.rfile:
+            line = raw.decode('utf-8').rstrip('\n')
+            if line == 'close':
+                return
+            if line in ['command_list_begin', 'command_list_ok_begin']:
+                commands = []
+                continue
+            if line == 'command_list_end':
+                self.run(commands)
+                commands = None
+                continue
+            if commands is not None:
+                commands.append(line)
+                continue
+            self.run([line])
+
+    def run(self, lines):
+        answer = []
+        for index, line in enumerate(lines):
+            parts = split(line)
+            try:
+                pairs = self.server.standin.execute(self, parts[0], parts[1:])
+            except (Error, TypeError, ValueError) as error:
+                code = error.code if isinstance(error, Error) else 2
+                answer.append('ACK [{}@{}] {{{}}} {}'.format(code, index,
+                    parts[0], error))
+                self.write(*answer)
+                return
+            answer += ['{}: {}'.format(key, value) for key, value in pairs]
+        answer.append('OK')
+        self.write(*answer)
+
+    def write(self, *lines):
+        self.wfile.write(('\n'.join(lines) + '\n').encode('utf-8'))
+
+class Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+def selftest(port, keys):
+    """Switch between keys with PartitionPool and print the times."""
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+    from boxcontroller.plugins.mpc.mpdclient import MPDClient
+    from boxcontroller.plugins.mpc.partitions import PartitionPool
+
+    client = MPDClient('127.0.0.1', port)
+    pool = PartitionPool(client, 2)
+    pool.setup()
+    for key in keys:
+        start = time.monotonic()
+        held = pool.switch(key, options={'repeat': 'on'}, position=1,
+                elapsed=30)
+        print('{:<10} {:<16} {:<7} {:>8.1f} ms'.format(key, pool.get_active(),
+            'held' if held else 'loaded', (time.monotonic() - start) * 1000))
+        status = dict(client.command('status'))
+        assert status['state'] == 'play', status
+        assert status['partition'] == pool.get_active(), status
+        outputs = dict(client.command('outputs'))
+        assert outputs.get('outputname') == 'speaker', outputs
+    client.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=6600)
+    parser.add_argument('--outputs', type=str, default='speaker',
+            help='names of the outputs')
+    parser.add_argument('--tracks', type=int, default=10,
+            help='tracks per folder / playlist')
+    parser.add_argument('--delay', type=float, default=0.5,
+            help='seconds loading a folder / playlist takes')
+    parser.add_argument('--selftest', action='store_true')
+    args = parser.parse_args()
+
+    server = Server(('127.0.0.1', 0 if args.selftest else args.port),
+            Handler)
+    server.standin = StandIn(args.outputs.split(','), args.tracks,
+            args.delay)
+    if not args.selftest:
+        server.serve_forever()
+        return
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    selftest(server.server_address[1], ['a', 'b', 'a', 'c', 'b', 'c', 'a'])
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
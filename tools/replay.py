@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Replay inputs recorded with `boxcontroller --record` and measure.
+
+Sends the inputs through the control socket of a running BoxController
+with the recorded gaps (--speed 1), N times faster (--speed N) or as fast
+as possible (--max). With --headless a BoxController is started for the
+replay (pass options with -o, e.g., to blacklist input plugins) and
+stopped afterwards.
+
+Reports the throughput, the latency (round trip through the control
+socket, i.e., mapping and dispatching the event) and how late inputs were
+sent compared to the schedule.
+
+Usage:
+    python3 tools/replay.py RECORDING [--socket PATH] [--speed N | --max]
+        [--headless [-d USER_CONFIG] [-o OPTIONS]]
+"""
+
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / 'src'
+sys.path.insert(0, str(SRC))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from boxcontroller import recorder
+from control import Client
+
+def start_headless(socket, user_config, options):
+    """Start BoxController with its control socket at socket."""
+    options = '@@'.join(['Control.socket={}'.format(socket)] +
+            ([options] if options != '' else []))
+    call = [sys.executable, '-m', 'boxcontroller.boxcontroller', '-o',
+            options]
+    if user_config != '':
+        call += ['-d', user_config]
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+            [str(SRC)] + env.get('PYTHONPATH', '').split(os.pathsep))
+    process = subprocess.Popen(call, env=env)
+    for i in range(300):
+        if socket.is_socket() or process.poll() is not None:
+            break
+        time.sleep(0.1)
+    if not socket.is_socket():
+        process.kill()
+        sys.exit('BoxController did not open its control socket')
+    return process
+
+def percentile(values, share):
+    return sorted(values)[min(int(len(values) * share), len(values) - 1)]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('recording', type=str)
+    parser.add_argument('--socket', type=str,
+            default='~/.config/boxcontroller/control.sock')
+    parser.add_argument('--speed', type=float, default=1,
+            help='replay N times faster than recorded')
+    parser.add_argument('--max', action='store_true',
+            help='replay as fast as possible')
+    parser.add_argument('--headless', action='store_true',
+            help='start a BoxController for the replay')
+    parser.add_argument('-d', '--user_config', type=str, default='')
+    parser.add_argument('-o', '--options', type=str, default='',
+            help='options for the headless BoxController')
+    args = parser.parse_args()
+
+    records = recorder.read(args.recording)
+    if len(records) == 0:
+        sys.exit('nothing recorded')
+
+    process = None
+    with tempfile.TemporaryDirectory() as tmp:
+        socket = Path(args.socket).expanduser()
+        if args.headless:
+            socket = Path(tmp) / 'control.sock'
+            process = start_headless(socket, args.user_config, args.options)
+        client = Client(socket)
+
+        latencies = []
+        delays = []
+        unmapped = 0
+        failed = 0
+        first = records[0][0]
+        start = time.monotonic()
+        for seconds, source, string in records:
+            if not args.max:
+                due = start + (seconds - first) / args.speed
+                wait = due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                delays.append(max(time.monotonic() - due, 0))
+            before = time.monotonic()
+            result = client.request({'input': string, 'source': source})
+            latencies.append(time.monotonic() - before)
+            if not result['ok']:
+                failed += 1
+            elif result['event'] is None:
+                unmapped += 1
+        duration = time.monotonic() - start
+        client.close()
+
+        if process is not None:
+            process.send_signal(signal.SIGINT)
+            process.wait()
+
+    print('replayed {} inputs ({} unmapped, {} failed) in {:.2f} s '
+            '(recorded: {:.2f} s): {:.0f} inputs/s'.format(len(records),
+                unmapped, failed, duration, records[-1][0] - first,
+                len(records) / duration if duration > 0 else 0))
+    print('latency: p50 {:.2f} ms, p99 {:.2f} ms, max {:.2f} ms'.format(
+        statistics.median(latencies) * 1000,
+        percentile(latencies, 0.99) * 1000, max(latencies) * 1000))
+    if len(delays) > 0:
+        print('sent late: p50 {:.2f} ms, max {:.2f} ms'.format(
+            statistics.median(delays) * 1000, max(delays) * 1000))
+
+if __name__ == '__main__':
+    main()